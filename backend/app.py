@@ -1,16 +1,64 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager, contextmanager, suppress
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+import asyncio
+import contextvars
+import functools
+import importlib
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
 import uvicorn
 
+from climate_cache import ClimateCache, DailySeriesStore, DAILY_PARAMETERS, DEFAULT_DB_PATH, cell_for
+from prediction_cache import PredictionCache, normalize_prediction, scale_prediction
+from single_flight import SingleFlight, canonical_key
+from json_stream import IncrementalJsonObjectParser
+from prediction_sessions import PredictionSessionStore
+import local_answers
+from crop_scoring import CropScorer
+import prediction_output
+from prediction_output import (
+    GeminiBatchPrediction, GeminiBatchPredictionRepair, GeminiPrediction, GeminiPredictionRepair
+)
+from nasa_client import BASE_URL as NASA_POWER_URL, CircuitOpenError, NasaPowerClient
+from climate_grid import ClimateGrid, DEFAULT_GRID_PATH
+from soil_store import SoilStore, DEFAULT_SOIL_PATH
+import metrics
+from metrics import stage
+import deadlines
+from deadlines import DeadlineExceeded
+from warmup import CacheWarmer, RequestKeyLog
+from gemini_scheduler import (
+    GeminiScheduler, GenaiClientAdapter, PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_PREDICT, estimate_tokens
+)
+
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(cache_warmer.run_forever()) if cache_warmer is not None else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+        # Let the run unwind before giving up the lock, so another worker can't start warming alongside it
+        with suppress(asyncio.CancelledError):
+            await warmup_task
+        cache_warmer.release_lock()
+    if request_key_log is not None:
+        request_key_log.close()
+    # Close pooled upstream connections on shutdown
+    await nasa_client.aclose()
+
 # Initialize FastAPI
-app = FastAPI(title="GreenByte - Crop Prediction API", version="1.0.0")
+app = FastAPI(title="GreenByte - Crop Prediction API", version="1.0.0", lifespan=lifespan)
 
 # Enable CORS for frontend communication
 app.add_middleware(
@@ -21,31 +69,174 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+# Configure Gemini API; GEMINI_API_KEYS takes a comma-separated pool of keys to spread load over
+GEMINI_API_KEYS = [key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip()]
+if not GEMINI_API_KEYS and os.getenv("GEMINI_API_KEY"):
+    GEMINI_API_KEYS = [os.getenv("GEMINI_API_KEY")]
+if not GEMINI_API_KEYS:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
+GEMINI_API_KEY = GEMINI_API_KEYS[0]
 
 genai.configure(api_key=GEMINI_API_KEY)
 
+def load_class(spec: str):
+    """Import a class given as module:Class"""
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+# Model class for Gemini calls as "module:Class"; unset means the SDK's GenerativeModel. Used to run
+# against a stand-in such as the benchmark's fake_upstreams:FakeGenerativeModel
+GEMINI_MODEL_CLASS = os.getenv("GEMINI_MODEL_CLASS", "")
+gemini_model_class = load_class(GEMINI_MODEL_CLASS) if GEMINI_MODEL_CLASS else genai.GenerativeModel
+
+# Per-key request/token quotas and queueing for all Gemini calls
+gemini_scheduler = GeminiScheduler(
+    GEMINI_API_KEYS,
+    rpm=float(os.getenv("GEMINI_RPM", "60")),
+    tpm=float(os.getenv("GEMINI_TPM", "1000000")),
+    max_queue=int(os.getenv("GEMINI_QUEUE_SIZE", "100")),
+    queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10")),
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+    # A stand-in model class has no SDK client to bind per key
+    client_adapter=None if GEMINI_MODEL_CLASS else GenaiClientAdapter(),
+)
+
+# Output tokens assumed when reserving quota for a prediction (chatbot answers use max_output_tokens)
+PREDICTION_OUTPUT_TOKENS = 1500
+
+# Structured output: predictions are generated as JSON matching the prediction_output models
+PREDICTION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": prediction_output.response_schema(GeminiPrediction),
+}
+BATCH_PREDICTION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": prediction_output.response_schema(GeminiBatchPrediction),
+}
+PREDICTION_REPAIR_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": prediction_output.response_schema(GeminiPredictionRepair),
+}
+BATCH_PREDICTION_REPAIR_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": prediction_output.response_schema(GeminiBatchPredictionRepair),
+}
+
+# Cache NASA POWER aggregates per grid cell; set CLIMATE_CACHE_PATH="" to keep it in memory only
+climate_cache = ClimateCache(
+    db_path=os.getenv("CLIMATE_CACHE_PATH", DEFAULT_DB_PATH),
+    max_memory_entries=int(os.getenv("CLIMATE_CACHE_SIZE", "1024")),
+)
+climate_series = DailySeriesStore(db_path=os.getenv("CLIMATE_CACHE_PATH", DEFAULT_DB_PATH))
+
+# Memory-mapped climate grid for the service region (built with climate_grid.py); None if not built
+climate_grid = ClimateGrid.open(
+    os.getenv("CLIMATE_GRID_PATH", DEFAULT_GRID_PATH),
+    max_age_days=int(os.getenv("CLIMATE_GRID_MAX_AGE_DAYS", "45")),
+)
+
+# Shared NASA POWER connection pool with retries, hedged requests and a circuit breaker
+nasa_client = NasaPowerClient(
+    timeout=float(os.getenv("NASA_TIMEOUT", "5")),
+    total_timeout=float(os.getenv("NASA_TOTAL_TIMEOUT", "8")),
+    max_retries=int(os.getenv("NASA_MAX_RETRIES", "2")),
+    hedge_delay=float(os.getenv("NASA_HEDGE_DELAY", "1.5")),
+    failure_threshold=int(os.getenv("NASA_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("NASA_BREAKER_RESET", "30")),
+    base_url=os.getenv("NASA_POWER_URL", NASA_POWER_URL),
+)
+
+# Soil profiles and sensor records, loaded once and reloaded when the file changes
+soil_store = SoilStore(os.getenv("SOIL_DATA_PATH", DEFAULT_SOIL_PATH))
+
+# Use a located soil record of the requested type if one is within this distance of the farm
+SOIL_NEAREST_MAX_KM = float(os.getenv("SOIL_NEAREST_MAX_KM", "25"))
+
+# Cache Gemini predictions per unit of land area, keyed on soil, climate cell and prompt version
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", "86400")),
+)
+
+# Keep /predict results server-side so /ask can refer to them by prediction_id
+prediction_sessions = PredictionSessionStore(
+    max_entries=int(os.getenv("PREDICTION_SESSION_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("PREDICTION_SESSION_TTL", "86400")),
+    spill_path=os.getenv("PREDICTION_SESSION_SPILL_PATH") or None,
+)
+
+# Seconds to keep a Gemini cached-content prefix per prediction and language; 0 disables it
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "0"))
+
+# Answer lookup/arithmetic chatbot questions locally instead of calling Gemini; set to 0 to disable
+LOCAL_ANSWERS_ENABLED = os.getenv("LOCAL_ANSWERS", "1") == "1"
+
+# Crop prediction engine: "gemini" only, "fallback" to local scoring when Gemini is throttled, times out
+# or gives no usable answer (other errors, such as a bad API key, are still returned),
+# "prefilter" to also send Gemini a locally scored shortlist, or "local" to skip Gemini
+CROP_ENGINE_MODE = os.getenv("CROP_ENGINE_MODE", "fallback")
+CROP_PREFILTER_SIZE = int(os.getenv("CROP_PREFILTER_SIZE", "8"))
+crop_scorer = CropScorer()
+
+# Coalesce identical concurrent upstream work
+predict_flight = SingleFlight("predict")
+ask_flight = SingleFlight("ask")
+climate_flight = SingleFlight("climate")
+
+# /predict/batch limits: items per call, plots packed into one Gemini prompt, parallel upstream calls
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", "4"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# End-to-end deadlines in seconds; a client can ask for less with an X-Request-Timeout header
+PREDICT_DEADLINE_SECONDS = float(os.getenv("PREDICT_DEADLINE_SECONDS", "30"))
+ASK_DEADLINE_SECONDS = float(os.getenv("ASK_DEADLINE_SECONDS", "20"))
+# Within a /predict deadline: the longest the climate fetch may take, and the time it must leave for Gemini
+CLIMATE_STAGE_BUDGET_SECONDS = float(os.getenv("CLIMATE_STAGE_BUDGET_SECONDS", "8"))
+GEMINI_STAGE_RESERVE_SECONDS = float(os.getenv("GEMINI_STAGE_RESERVE_SECONDS", "5"))
+
+# Append the location and soil type of every /predict to this JSON-lines file for the cache warm-up
+REQUEST_KEY_LOG = os.getenv("REQUEST_KEY_LOG", "")
+request_key_log = RequestKeyLog(REQUEST_KEY_LOG) if REQUEST_KEY_LOG else None
+
+# Off-peak warm-up of climate and predictions for the hottest (cell, soil type) pairs in the request key
+# log and any WARMUP_SOURCES sample files. The window (UTC hours) follows POWER's daily refresh at
+# midnight UTC, when cached climate, and the predictions keyed on it, start over. Only the worker
+# holding WARMUP_LOCK_PATH runs it.
+WARMUP_SOURCES = [path.strip() for path in os.getenv("WARMUP_SOURCES", "").split(",") if path.strip()]
+if REQUEST_KEY_LOG:
+    WARMUP_SOURCES.append(REQUEST_KEY_LOG)
+cache_warmer = CacheWarmer(
+    lambda pair, allow_gemini: warm_prediction(pair, allow_gemini),
+    WARMUP_SOURCES,
+    top=int(os.getenv("WARMUP_TOP", "100")),
+    max_gemini_calls=int(os.getenv("WARMUP_MAX_GEMINI_CALLS", "50")),
+    concurrency=int(os.getenv("WARMUP_CONCURRENCY", "2")),
+    window=tuple(int(hour) for hour in os.getenv("WARMUP_UTC_HOURS", "0-2").split("-")),
+    half_life_hours=float(os.getenv("WARMUP_HALF_LIFE_HOURS", "72")),
+    lookback_days=float(os.getenv("WARMUP_LOOKBACK_DAYS", "14")),
+    on_startup=os.getenv("WARMUP_ON_STARTUP", "0") == "1",
+    key_log=request_key_log,
+    lock_path=os.getenv("WARMUP_LOCK_PATH", os.path.join(tempfile.gettempdir(), "greenbyte-warmup.lock")),
+) if WARMUP_SOURCES else None
+
+# Profile requests slower than this many milliseconds with a sampling profiler; 0 disables it
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+slow_request_profiler = (
+    metrics.SlowRequestProfiler(SLOW_REQUEST_PROFILE_MS / 1000) if SLOW_REQUEST_PROFILE_MS > 0 else None
+)
+
+# Bump whenever create_prediction_prompt changes so stale cached predictions are not reused
+PREDICTION_PROMPT_VERSION = "3"
+
 # Pydantic models for request/response
 class CropPredictionRequest(BaseModel):
     land_area: int  # in square feet
     latitude: float
     longitude: float
     soil_type: str  # Sandy, Loamy, Clayey, Silty
-
-class CropData(BaseModel):
-    name: str
-    water_required_liters: float
-
-class YieldData(BaseModel):
-    crop_name: str
-    yield_amount: float
-    market_rate_per_unit: float
-    cost_of_selling: float
-    cost_of_growing: float
-    roi: float
+    soil_id: Optional[str] = None  # A specific soil record (e.g. an IoT sensor) from the soil data
+    bypass_cache: bool = False  # Skip the prediction cache and ask Gemini again
 
 class ClimateData(BaseModel):
     avg_temp: float
@@ -60,196 +251,990 @@ class CropPredictionResponse(BaseModel):
     best_sowing_time: str
     climate_data: dict
     soil_info: dict
+    prediction_id: Optional[str] = None  # Pass to /ask instead of re-sending the prediction
+    prediction_source: Optional[str] = None  # "gemini" or "local" (offline crop scoring)
+    partial: bool = False  # The deadline ran out before crops were predicted; only soil and climate are set
+
+class BatchPredictionRequest(BaseModel):
+    items: list[CropPredictionRequest]
+
+class BatchPredictionResult(BaseModel):
+    index: int  # Position of the item in the request
+    status_code: int = 200
+    result: Optional[CropPredictionResponse] = None
+    error: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    results: list[BatchPredictionResult]
+    stats: dict
 
 class ChatbotRequest(BaseModel):
     question: str
-    prediction_data: CropPredictionResponse  # The output from /predict endpoint
+    prediction_data: Optional[CropPredictionResponse] = None  # The output from /predict endpoint
+    prediction_id: Optional[str] = None  # Or the prediction_id it returned
     language: str = "en"  # Language code: "en", "hi", "kn"
 
 class ChatbotResponse(BaseModel):
     answer: str
 
+@functools.cache
+def known_route_paths() -> frozenset:
+    """Paths used as endpoint labels; built on the first request, once every route is registered"""
+    return frozenset(route.path for route in app.routes)
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Latency histogram, in-flight gauge, Server-Timing header and slow-request profiling"""
+    endpoint = request.url.path if request.url.path in known_route_paths() else "other"
+    
+    token = metrics.begin_request(endpoint)
+    metrics.requests_in_flight.inc(endpoint=endpoint)
+    if slow_request_profiler is not None:
+        slow_request_profiler.request_started()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        # For streaming endpoints this covers the time until the response starts
+        total = time.perf_counter() - started
+        response.headers["Server-Timing"] = metrics.server_timing_header(metrics.end_request(token), total)
+        token = None
+        return response
+    finally:
+        total = time.perf_counter() - started
+        if token is not None:
+            metrics.end_request(token)
+        metrics.requests_in_flight.dec(endpoint=endpoint)
+        metrics.request_duration.observe(total, endpoint=endpoint, method=request.method, status=status)
+        if slow_request_profiler is not None:
+            slow_request_profiler.request_finished(endpoint, request.method, started, total)
+
 @app.get("/")
 def read_root():
     """Welcome endpoint"""
     return {"message": "Welcome to GreenByte - Crop Prediction API"}
 
 @app.post("/predict", response_model=CropPredictionResponse)
-async def predict_crop(request: CropPredictionRequest):
+async def predict_crop(request: CropPredictionRequest, http_request: Request):
     """
     Predict crops based on land area, location, and soil type.
     Uses NASA POWER API for climate data and Gemini for crop prediction.
     """
     try:
-        # Get soil information from iot_data.json (fast, local file)
-        soil_info = get_soil_info(request.soil_type)
-        
-        # Fetch climate data from NASA POWER API with fallback
+        log_request_key(request)
+        # Identical concurrent requests share one NASA + Gemini round trip
+        flight_key = canonical_key("predict", {**request.model_dump(), "soil_type": request.soil_type.strip().lower()})
         try:
-            climate_data = fetch_climate_data(request.latitude, request.longitude)
-        except Exception as climate_error:
-            # Use default climate data if NASA API fails or is slow
-            print(f"Warning: NASA API failed, using default climate data: {climate_error}")
-            climate_data = {
-                "avg_temp": 25.0,
-                "avg_soil_moisture": 0.5,
-                "avg_surface_temp": 26.0,
-                "total_rainfall": 100.0
+            # The shared work gets the full deadline; a caller's own deadline only limits its wait
+            result = await run_request(
+                http_request, PREDICT_DEADLINE_SECONDS,
+                lambda: predict_flight.run(flight_key, lambda: run_prediction(request), deadline=PREDICT_DEADLINE_SECONDS)
+            )
+        except DeadlineExceeded as e:
+            result = await prediction_past_deadline(request, e)
+        return await remember_prediction(result)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise prediction_http_exception(e)
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_crop_batch(request: BatchPredictionRequest):
+    """
+    Predict crops for many plots in one call.
+    Climate is fetched once per grid cell, plots sharing soil and climate share one
+    prediction, and the remaining plots are packed several to a Gemini prompt.
+    Each item gets its own result or error; one failure does not fail the batch.
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {BATCH_MAX_ITEMS} items")
+    
+    return await run_batch_prediction(request.items)
+
+@app.post("/predict/stream")
+async def predict_crop_stream(request: CropPredictionRequest):
+    """
+    Progressive variant of /predict. Soil and climate are sent as soon as they are
+    known and the crop sections follow as Gemini generates them, as Server-Sent Events.
+    """
+    log_request_key(request)
+    return StreamingResponse(
+        stream_prediction(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/ask", response_model=ChatbotResponse)
+async def ask_question(request: ChatbotRequest, http_request: Request):
+    """
+    Answer questions based strictly on the provided prediction data.
+    The chatbot will only answer questions using information from the dataset.
+    """
+    try:
+        return await run_request(http_request, ASK_DEADLINE_SECONDS, lambda: answer_question(request))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+
+async def answer_question(request: ChatbotRequest) -> dict:
+    """Answer an /ask question locally if it is a lookup, otherwise with Gemini"""
+    # Create a prompt that restricts answers to only the provided dataset
+    with stage("context"):
+        prediction_data, context = await resolve_chatbot_context(request)
+    
+    # Questions that are pure lookups or arithmetic over the data are answered locally
+    if LOCAL_ANSWERS_ENABLED:
+        with stage("local_answer"):
+            local_answer = local_answers.answer_locally(request.question, prediction_data, request.language)
+        if local_answer:
+            return {
+                "answer": local_answer
             }
-        
-        # Create prompt for Gemini
-        prompt = create_prediction_prompt(
-            land_area=request.land_area,
-            latitude=request.latitude,
-            longitude=request.longitude,
-            soil_type=request.soil_type,
-            climate_data=climate_data,
-            soil_info=soil_info
+    
+    with stage("prompt"):
+        prompt = create_chatbot_prompt(request.question, prediction_data, request.language, context=context)
+    with stage("context_cache"):
+        cached_content = await get_gemini_context_cache(request.prediction_id, request.language, context)
+    
+    # Get answer from Gemini, sharing the call with identical in-flight questions
+    flight_key = canonical_key("ask", " ".join(request.question.lower().split()), request.language, prompt)
+    try:
+        answer = await ask_flight.run(
+            flight_key, lambda: get_chatbot_answer(prompt, request.language, cached_content=cached_content),
+            deadline=ASK_DEADLINE_SECONDS
         )
+    except DeadlineExceeded:
+        answer = chatbot_timeout_answer(request.language)
+    
+    return {
+        "answer": answer
+    }
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: ChatbotRequest):
+    """
+    Streaming variant of /ask. Answer text is pushed as Server-Sent Events while
+    Gemini generates it, followed by a "done" event with the full answer.
+    """
+    try:
+        prediction_data, context = await resolve_chatbot_context(request)
         
-        # Get prediction from Gemini
-        prediction = get_gemini_prediction(prompt)
-        
+        local_answer = None
+        if LOCAL_ANSWERS_ENABLED:
+            local_answer = local_answers.answer_locally(request.question, prediction_data, request.language)
+        if local_answer:
+            answer_stream = stream_local_answer(local_answer)
+        else:
+            prompt = create_chatbot_prompt(request.question, prediction_data, request.language, context=context)
+            cached_content = await get_gemini_context_cache(request.prediction_id, request.language, context)
+            answer_stream = stream_chatbot_answer(prompt, request.language, cached_content=cached_content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+    
+    return StreamingResponse(
+        answer_stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, stage, upstream and cache metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@metrics.registry.collector("greenbyte_cache_lookups_total", "Cache lookups by result", "counter")
+def cache_lookup_samples():
+    climate, prediction, sessions = climate_cache.stats, prediction_cache.stats, prediction_sessions.stats
+    counts = {
+        "climate": {"hit": climate["memory_hits"] + climate["disk_hits"], "miss": climate["misses"]},
+        "prediction": {"hit": prediction["hits"], "miss": prediction["misses"], "bypass": prediction["bypassed"]},
+        "prediction_sessions": {"hit": sessions["hits"] + sessions["spill_hits"], "miss": sessions["misses"]},
+        "local_answers": {"hit": local_answers.stats["answered"], "miss": local_answers.stats["fallback"]},
+    }
+    if climate_grid is not None:
+        grid = climate_grid.stats
+        counts["climate_grid"] = {"hit": grid["hits"], "miss": grid["outside"] + grid["stale"] + grid["empty"]}
+    return [({"cache": cache, "result": result}, value)
+            for cache, results in counts.items() for result, value in results.items()]
+
+@metrics.registry.collector("greenbyte_cache_hit_ratio", "Share of cache lookups that were hits")
+def cache_hit_ratio_samples():
+    totals = {}
+    for labels, value in cache_lookup_samples():
+        if labels["result"] != "bypass":
+            hits, lookups = totals.get(labels["cache"], (0, 0))
+            totals[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), lookups + value)
+    return [({"cache": cache}, hits / lookups if lookups else 0.0) for cache, (hits, lookups) in totals.items()]
+
+@metrics.registry.collector("greenbyte_coalesced_in_flight", "Upstream calls in flight per coalescing group")
+def coalesced_in_flight_samples():
+    return [({"group": flight.name}, flight.get_stats()["in_flight"])
+            for flight in (predict_flight, ask_flight, climate_flight)]
+
+@metrics.registry.collector("greenbyte_gemini_queue_depth", "Gemini requests waiting for quota by priority")
+def gemini_queue_samples():
+    queued = gemini_scheduler.get_stats()["queued_by_priority"]
+    return [({"priority": priority}, count) for priority, count in queued.items()]
+
+@metrics.registry.collector("greenbyte_gemini_key_in_flight", "Gemini calls in flight per API key")
+def gemini_key_in_flight_samples():
+    return [({"key": key.label}, key.in_flight) for key in gemini_scheduler.keys]
+
+@metrics.registry.collector("greenbyte_gemini_key_requests_total", "Gemini calls admitted per API key", "counter")
+def gemini_key_request_samples():
+    return [({"key": key.label}, key.stats["requests"]) for key in gemini_scheduler.keys]
+
+@metrics.registry.collector(
+    "greenbyte_prediction_output_total", "Gemini predictions by validation outcome and entry-level fixes", "counter"
+)
+def prediction_output_samples():
+    return [({"outcome": outcome}, count) for outcome, count in prediction_output.stats.items()]
+
+@metrics.registry.collector("greenbyte_nasa_circuit_open", "1 while the NASA POWER circuit breaker is open")
+def nasa_circuit_samples():
+    return [({}, 1 if nasa_client.breaker.state == "open" else 0)]
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters and sizes for the climate and prediction caches"""
+    return {
+        "climate": climate_cache.get_stats(),
+        "climate_series": climate_series.get_stats(),
+        "climate_grid": climate_grid.get_stats() if climate_grid is not None else None,
+        "soil": soil_store.get_stats(),
+        "nasa": nasa_client.get_stats(),
+        "prediction": prediction_cache.get_stats(),
+        "prediction_sessions": prediction_sessions.get_stats(),
+        "local_answers": dict(local_answers.stats),
+        "prediction_output": dict(prediction_output.stats),
+        "warmup": cache_warmer.get_stats() if cache_warmer is not None else None,
+        "gemini": gemini_scheduler.get_stats(),
+        "coalescing": {
+            flight.name: flight.get_stats() for flight in (predict_flight, ask_flight, climate_flight)
+        }
+    }
+
+def request_deadline(http_request: Request, limit: float) -> float:
+    """Seconds a request may take: the endpoint's limit, or less if the client's X-Request-Timeout asks for it"""
+    try:
+        requested = float(http_request.headers.get("x-request-timeout", limit))
+    except ValueError:
+        requested = limit
+    return max(0.0, min(requested, limit))
+
+async def wait_for_disconnect(http_request: Request):
+    # The body has already been read, so the next message only arrives when the client goes away
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def run_request(http_request: Request, limit: float, work):
+    """
+    Await work() under the request's deadline. If the client disconnects first, the work is
+    cancelled (freeing its Gemini quota and NASA connections) and a 499 is returned.
+    """
+    token = deadlines.start(request_deadline(http_request, limit))
+    try:
+        task = asyncio.ensure_future(work())
+        watcher = asyncio.ensure_future(wait_for_disconnect(http_request))
+        try:
+            done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if not task.done():
+                task.cancel()
+    finally:
+        deadlines.reset(token)
+    
+    if task in done:
+        return task.result()
+    metrics.client_disconnects.inc(endpoint=http_request.url.path)
+    raise HTTPException(status_code=499, detail="Client closed request")
+
+def log_request_key(request: CropPredictionRequest):
+    if request_key_log is not None:
+        request_key_log.record(request.latitude, request.longitude, request.soil_type, request.land_area, request.soil_id)
+
+async def remember_prediction(payload: dict) -> dict:
+    """Store a /predict payload server-side and return it with its prediction_id"""
+    stored = {key: value for key, value in payload.items() if key != "prediction_id"}
+    return {**stored, "prediction_id": await prediction_sessions.save_async(stored)}
+
+async def resolve_chatbot_context(request: ChatbotRequest) -> tuple:
+    """Return (prediction data, formatted chatbot context) from a prediction_id or inline prediction_data"""
+    if request.prediction_id:
+        stored = await prediction_sessions.get_async(request.prediction_id)
+        if stored is None:
+            raise HTTPException(
+                status_code=404,
+                detail="PREDICTION_NOT_FOUND: Unknown or expired prediction_id. Please run the prediction again."
+            )
+        prediction_data = CropPredictionResponse(**stored)
+        context = await prediction_sessions.get_derived_async(
+            request.prediction_id, "chatbot_context", lambda p: format_prediction_context(prediction_data)
+        )
+        return prediction_data, context or format_prediction_context(prediction_data)
+    
+    if request.prediction_data is None:
+        raise HTTPException(status_code=400, detail="Either prediction_id or prediction_data is required")
+    return request.prediction_data, format_prediction_context(request.prediction_data)
+
+async def get_gemini_context_cache(prediction_id: str, language: str, context: str):
+    """
+    Gemini cached content holding the chatbot prompt prefix for a stored prediction, so
+    follow-up questions only send the question. Returns None when disabled or unsupported
+    (Gemini rejects prefixes below its minimum cacheable size).
+    """
+    import datetime
+    from google.generativeai import caching
+    
+    if not prediction_id or GEMINI_CONTEXT_CACHE_TTL <= 0:
+        return None
+    
+    name = f"gemini_context_cache:{language}"
+    existing = await prediction_sessions.get_derived_async(prediction_id, name)
+    if existing is not None:
+        cached_content, expires_at = existing
+        if cached_content is None or expires_at > time.time():
+            return cached_content
+    
+    prefix = create_chatbot_prompt_prefix(context, language)
+    try:
+        # Cached content belongs to the key that created it, so it is made and used on the configured key
+        cached_content = await gemini_scheduler.run(
+            lambda key: asyncio.to_thread(
+                caching.CachedContent.create,
+                model="models/gemini-2.5-flash",
+                contents=[prefix],
+                ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL)
+            ),
+            priority=PRIORITY_INTERACTIVE,
+            tokens=estimate_tokens(prefix),
+            pinned=0
+        )
+    except Exception as e:
+        # Remember the failure so every question doesn't retry it
+        print(f"Warning: Gemini context cache unavailable, sending the full prompt: {e}")
+        prediction_sessions.set_derived(prediction_id, name, (None, float("inf")))
+        return None
+    
+    # Refresh a little before Gemini expires it
+    prediction_sessions.set_derived(prediction_id, name, (cached_content, time.time() + GEMINI_CONTEXT_CACHE_TTL * 0.9))
+    return cached_content
+
+async def run_prediction(request: CropPredictionRequest) -> dict:
+    """Soil lookup, climate fetch and Gemini prediction for a single /predict request"""
+    # Get soil information from the soil store (in memory)
+    with stage("soil"):
+        soil_info = get_soil_info(request)
+    
+    # Fetch climate data from NASA POWER API with fallback
+    with stage("climate"):
+        climate_data = await get_climate_or_default(request.latitude, request.longitude)
+    
+    # Reuse a cached prediction for the same soil and climate cell, rescaled to this land area
+    with stage("cache"):
+        cache_key = prediction_cache_key(request, climate_data, soil_info)
+        prediction = None
+        if request.bypass_cache:
+            prediction_cache.record_bypass()
+        else:
+            prediction = prediction_cache.get(cache_key, request.land_area)
+            if cache_warmer is not None:
+                cache_warmer.record_lookup(cache_key, prediction is not None)
+    
+    source = "gemini"
+    if prediction is None:
+        try:
+            prediction, source = await predict_crops(request, climate_data, soil_info)
+        except DeadlineExceeded:
+            # Out of time and no local fallback: return the soil and climate gathered so far
+            return {
+                **empty_prediction(),
+                "climate_data": climate_data,
+                "soil_info": soil_info,
+                "prediction_source": None,
+                "partial": True
+            }
+        if source == "gemini":
+            prediction_cache.set(cache_key, prediction, request.land_area)
+    
+    return {
+        "crops": prediction["crops"],
+        "yield_data": prediction["yield_data"],
+        "crop_timeline": prediction.get("crop_timeline", []),
+        "best_sowing_time": prediction["best_sowing_time"],
+        "climate_data": climate_data,
+        "soil_info": soil_info,
+        "prediction_source": source
+    }
+
+async def prediction_past_deadline(request: CropPredictionRequest, error: DeadlineExceeded) -> dict:
+    """
+    /predict payload for a caller whose deadline passed while a shared prediction was still running:
+    soil, fallback climate and a local prediction if allowed, else the partial payload
+    """
+    soil_info = get_soil_info(request)
+    climate_data = await fallback_climate(request.latitude, request.longitude, error)
+    if local_fallback_allowed(error):
+        prediction = local_prediction(request, climate_data)
         return {
             "crops": prediction["crops"],
             "yield_data": prediction["yield_data"],
             "crop_timeline": prediction.get("crop_timeline", []),
             "best_sowing_time": prediction["best_sowing_time"],
             "climate_data": climate_data,
-            "soil_info": soil_info
+            "soil_info": soil_info,
+            "prediction_source": "local"
         }
+    return {
+        **empty_prediction(),
+        "climate_data": climate_data,
+        "soil_info": soil_info,
+        "prediction_source": None,
+        "partial": True
+    }
+
+async def warm_prediction(pair: dict, allow_gemini: bool) -> tuple:
+    """
+    Cache warm-up for one hot pair: fetch its climate and, if the prediction isn't cached and
+    allow_gemini is set, predict it at batch priority. Returns (outcome, prediction cache key,
+    Gemini calls spent, repairs included).
+    """
+    request = CropPredictionRequest(
+        land_area=pair["land_area"],
+        latitude=pair["latitude"],
+        longitude=pair["longitude"],
+        soil_type=pair["soil_type"],
+        soil_id=pair["soil_id"]
+    )
+    soil_info = get_soil_info(request)
+    # No fallback climate here: a prediction keyed on default values would never be looked up
+    climate_data = await fetch_climate_data(request.latitude, request.longitude)
+    cache_key = prediction_cache_key(request, climate_data, soil_info)
+    
+    if prediction_cache.contains(cache_key):
+        return "cached", cache_key, 0
+    if not allow_gemini or CROP_ENGINE_MODE == "local":
+        return "climate_only", cache_key, 0
     
+    with count_gemini_calls() as gemini:
+        try:
+            prediction, source = await predict_crops(request, climate_data, soil_info, priority=PRIORITY_BATCH)
+        except Exception as e:
+            print(f"Warning: warm-up prediction failed for {pair['soil_type']} at {pair['cell']}: {e}")
+            source = None
+    if source != "gemini":
+        return "prediction_failed", cache_key, gemini["calls"]
+    prediction_cache.set(cache_key, prediction, request.land_area)
+    return "predicted", cache_key, gemini["calls"]
+
+def build_prediction_prompt(request: CropPredictionRequest, climate_data: dict, soil_info: dict) -> str:
+    """create_prediction_prompt for a request, with the local shortlist in prefilter mode"""
+    candidate_crops = None
+    if CROP_ENGINE_MODE == "prefilter":
+        candidate_crops = crop_scorer.candidate_names(
+            climate_data, get_soil_record(request), CROP_PREFILTER_SIZE
+        )
+    
+    return create_prediction_prompt(
+        land_area=request.land_area,
+        latitude=request.latitude,
+        longitude=request.longitude,
+        soil_type=request.soil_type,
+        climate_data=climate_data,
+        soil_info=soil_info,
+        candidate_crops=candidate_crops
+    )
+
+def local_prediction(request: CropPredictionRequest, climate_data: dict) -> dict:
+    """Prediction from the offline crop scorer"""
+    with stage("local_scoring"):
+        return crop_scorer.recommend(request.land_area, climate_data, get_soil_record(request))
+
+# Gemini failures the local engine may cover for: throttling and timeouts
+LOCAL_FALLBACK_ERRORS = ("API_KEY_LIMIT_EXCEEDED", "DEADLINE_EXCEEDED", "GEMINI_TIMEOUT")
+
+def local_fallback_allowed(error: Exception = None) -> bool:
+    """Whether local scoring may stand in for Gemini after error, or after an unusable answer (no error)"""
+    if CROP_ENGINE_MODE not in ("fallback", "prefilter"):
+        return False
+    return error is None or str(error).startswith(LOCAL_FALLBACK_ERRORS)
+
+async def predict_crops(request: CropPredictionRequest, climate_data: dict, soil_info: dict,
+                        priority: int = PRIORITY_PREDICT) -> tuple:
+    """Crop prediction from the configured engine, returned as (prediction, source)"""
+    if CROP_ENGINE_MODE == "local":
+        return local_prediction(request, climate_data), "local"
+    
+    try:
+        with stage("prompt"):
+            prompt = build_prediction_prompt(request, climate_data, soil_info)
+        prediction = await get_gemini_prediction(prompt, priority=priority)
     except ValueError as e:
+        if not local_fallback_allowed(e):
+            raise
+        print(f"Warning: Gemini prediction failed, using local crop scoring: {e}")
+        metrics.fallbacks.inc(kind="local_prediction")
+        return local_prediction(request, climate_data), "local"
+    
+    if not prediction["crops"] and local_fallback_allowed():
+        # Gemini answered but nothing usable could be parsed out of it
+        metrics.fallbacks.inc(kind="local_prediction")
+        return local_prediction(request, climate_data), "local"
+    return prediction, "gemini"
+
+async def run_batch_prediction(items: list) -> dict:
+    """Run the /predict pipeline for many plots with shared climate fetches and packed Gemini prompts"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    stats = {
+        "items": len(items), "climate_cells": 0, "cache_hits": 0,
+        "gemini_calls": 0, "packed_prompts": 0, "local_predictions": 0
+    }
+    results = [None] * len(items)
+    
+    async def bounded(work):
+        async with semaphore:
+            return await work()
+    
+    def fail(index: int, e: Exception):
+        error = prediction_http_exception(e)
+        results[index] = {"index": index, "status_code": error.status_code, "error": error.detail}
+    
+    def succeed(index: int, prediction: dict, climate_data: dict, soil_info: dict, source: str = "gemini"):
+        # Stored server-side once every item is done
+        results[index] = {
+            "index": index,
+            "result": {
+                "crops": prediction["crops"],
+                "yield_data": prediction["yield_data"],
+                "crop_timeline": prediction.get("crop_timeline", []),
+                "best_sowing_time": prediction["best_sowing_time"],
+                "climate_data": climate_data,
+                "soil_info": soil_info,
+                "prediction_source": source
+            }
+        }
+    
+    async def finish() -> dict:
+        for result in results:
+            if "result" in result:
+                result["result"] = await remember_prediction(result["result"])
+        return {"results": results, "stats": stats}
+    
+    def succeed_locally(index: int):
+        climate_data, soil_info, _ = contexts[index]
+        stats["local_predictions"] += 1
+        succeed(index, local_prediction(items[index], climate_data), climate_data, soil_info, "local")
+    
+    # One climate fetch per grid cell
+    cells = {}
+    for item in items:
+        cells.setdefault(cell_for(item.latitude, item.longitude), item)
+    stats["climate_cells"] = len(cells)
+    climates = await asyncio.gather(*[
+        bounded(lambda item=item: get_climate_or_default(item.latitude, item.longitude))
+        for item in cells.values()
+    ])
+    climate_by_cell = dict(zip(cells, climates))
+    
+    # Serve cache hits and group the rest by prediction key so each group needs one Gemini answer
+    contexts = []
+    groups = {}
+    for index, item in enumerate(items):
+        soil_info = get_soil_info(item)
+        climate_data = climate_by_cell[cell_for(item.latitude, item.longitude)]
+        cache_key = prediction_cache_key(item, climate_data, soil_info)
+        contexts.append((climate_data, soil_info, cache_key))
+        
+        cached = None
+        if item.bypass_cache:
+            prediction_cache.record_bypass()
+        else:
+            cached = prediction_cache.get(cache_key, item.land_area)
+        if cached is not None:
+            stats["cache_hits"] += 1
+            succeed(index, cached, climate_data, soil_info)
+        else:
+            groups.setdefault(cache_key, []).append(index)
+    
+    def prompt_for(index: int) -> str:
+        climate_data, soil_info, _ = contexts[index]
+        return build_prediction_prompt(items[index], climate_data, soil_info)
+    
+    async def predict_single(index: int) -> tuple:
+        climate_data, soil_info, _ = contexts[index]
+        with count_gemini_calls() as gemini_calls:
+            try:
+                return await predict_crops(items[index], climate_data, soil_info, priority=PRIORITY_BATCH)
+            finally:
+                stats["gemini_calls"] += gemini_calls["calls"]
+    
+    def distribute(group: list, prediction: dict, source: str = "gemini") -> list:
+        """Hand a group's prediction to every item in it; return items that need their own call"""
+        if source == "local":
+            for index in group:
+                succeed_locally(index)
+            return []
+        
+        leader = group[0]
+        climate_data, soil_info, cache_key = contexts[leader]
+        prediction_cache.set(cache_key, prediction, items[leader].land_area)
+        succeed(leader, prediction, climate_data, soil_info)
+        
+        per_unit = normalize_prediction(prediction, items[leader].land_area)
+        if per_unit is None:
+            return group[1:]
+        for index in group[1:]:
+            succeed(index, scale_prediction(per_unit, items[index].land_area), climate_data, soil_info)
+        return []
+    
+    async def predict_pack(pack: list) -> list:
+        """Predict a pack of groups with one prompt; return the groups it couldn't answer"""
+        if len(pack) == 1:
+            return pack
+        try:
+            stats["packed_prompts"] += 1
+            with count_gemini_calls() as gemini_calls:
+                try:
+                    predictions = await get_gemini_batch_prediction([prompt_for(group[0]) for group in pack])
+                finally:
+                    stats["gemini_calls"] += gemini_calls["calls"]
+        except Exception as e:
+            if not local_fallback_allowed(e):
+                # Not throttling or a timeout: one bad packed call shouldn't fail every plot in it
+                print(f"Warning: packed Gemini prediction failed, predicting its groups one by one: {e}")
+                return pack
+            for group in pack:
+                for index in group:
+                    metrics.fallbacks.inc(kind="local_prediction")
+                    succeed_locally(index)
+            return []
+        
+        leftovers = []
+        for group, prediction in zip(pack, predictions):
+            if prediction is None:
+                # The packed answer was missing or malformed for this plot
+                leftovers.append(group)
+            else:
+                leftovers.extend([index] for index in distribute(group, prediction))
+        return leftovers
+    
+    async def predict_group(group: list):
+        """Fallback: one prediction for the group leader, shared with the rest of the group"""
+        try:
+            prediction, source = await predict_single(group[0])
+        except Exception as e:
+            for index in group:
+                fail(index, e)
+            return
+        for index in distribute(group, prediction, source):
+            try:
+                prediction, source = await predict_single(index)
+                climate_data, soil_info, _ = contexts[index]
+                succeed(index, prediction, climate_data, soil_info, source)
+            except Exception as e:
+                fail(index, e)
+    
+    pending = list(groups.values())
+    if CROP_ENGINE_MODE == "local":
+        for group in pending:
+            distribute(group, None, "local")
+        return await finish()
+    
+    packs = [pending[i:i + BATCH_PACK_SIZE] for i in range(0, len(pending), BATCH_PACK_SIZE)]
+    leftover_lists = await asyncio.gather(*[bounded(lambda pack=pack: predict_pack(pack)) for pack in packs])
+    await asyncio.gather(*[
+        bounded(lambda group=group: predict_group(group))
+        for leftovers in leftover_lists for group in leftovers
+    ])
+    
+    return await finish()
+
+def prediction_http_exception(e: Exception) -> HTTPException:
+    """Map a failure from the prediction pipeline to the HTTP error returned to the client"""
+    if isinstance(e, ValueError):
         error_message = str(e)
         # Check for specific error types
         if "API_KEY_LIMIT_EXCEEDED" in error_message:
-            raise HTTPException(
+            return HTTPException(
                 status_code=429, 
                 detail="API_KEY_LIMIT_EXCEEDED: Gemini API quota/rate limit has been exceeded. Please try again later or check your API key limits."
             )
         elif "API_KEY_ERROR" in error_message:
-            raise HTTPException(
+            return HTTPException(
                 status_code=401,
                 detail="API_KEY_ERROR: Invalid or missing API key. Please check your Gemini API key configuration."
             )
+        elif "DEADLINE_EXCEEDED" in error_message or "GEMINI_TIMEOUT" in error_message:
+            return HTTPException(status_code=504, detail=error_message)
         elif "GEMINI_API_ERROR" in error_message:
-            raise HTTPException(
+            return HTTPException(
                 status_code=500,
                 detail=error_message
             )
         else:
-            raise HTTPException(status_code=500, detail=f"Error processing prediction: {error_message}")
-    except Exception as e:
-        error_str = str(e).lower()
-        if "quota" in error_str or "limit" in error_str or "rate limit" in error_str:
-            raise HTTPException(
-                status_code=429,
-                detail="API_KEY_LIMIT_EXCEEDED: API quota/rate limit has been exceeded. Please try again later."
-            )
-        raise HTTPException(status_code=500, detail=f"Error processing prediction: {str(e)}")
+            return HTTPException(status_code=500, detail=f"Error processing prediction: {error_message}")
+    
+    error_str = str(e).lower()
+    if "quota" in error_str or "limit" in error_str or "rate limit" in error_str:
+        return HTTPException(
+            status_code=429,
+            detail="API_KEY_LIMIT_EXCEEDED: API quota/rate limit has been exceeded. Please try again later."
+        )
+    return HTTPException(status_code=500, detail=f"Error processing prediction: {str(e)}")
 
-@app.post("/ask", response_model=ChatbotResponse)
-async def ask_question(request: ChatbotRequest):
+async def stream_prediction(request: CropPredictionRequest):
     """
-    Answer questions based strictly on the provided prediction data.
-    The chatbot will only answer questions using information from the dataset.
+    Run the /predict pipeline, emitting each part of the response as a Server-Sent Event
+    as soon as it is known: soil_info, climate_data, then crops, yield_data, crop_timeline
+    and best_sowing_time as they are parsed out of the streamed Gemini output, and finally
+    "done" with the full validated CropPredictionResponse.
     """
+    prediction_fields = ("crops", "yield_data", "crop_timeline", "best_sowing_time")
     try:
-        # Create a prompt that restricts answers to only the provided dataset
-        prompt = create_chatbot_prompt(request.question, request.prediction_data, request.language)
+        soil_info = get_soil_info(request)
+        yield sse_event("soil_info", {"soil_info": soil_info})
         
-        # Get answer from Gemini
-        answer = get_chatbot_answer(prompt, request.language)
+        climate_data = await get_climate_or_default(request.latitude, request.longitude)
+        yield sse_event("climate_data", {"climate_data": climate_data})
         
-        return {
-            "answer": answer
-        }
+        cache_key = prediction_cache_key(request, climate_data, soil_info)
+        prediction = None
+        if request.bypass_cache:
+            prediction_cache.record_bypass()
+        else:
+            prediction = prediction_cache.get(cache_key, request.land_area)
+        
+        source = "gemini"
+        if prediction is None and CROP_ENGINE_MODE == "local":
+            prediction, source = local_prediction(request, climate_data), "local"
+        
+        if prediction is not None:
+            for field in prediction_fields:
+                yield sse_event(field, {field: prediction.get(field)})
+        else:
+            prompt = build_prediction_prompt(request, climate_data, soil_info)
+            
+            parser = IncrementalJsonObjectParser()
+            try:
+                async for text in stream_gemini_text(prompt, generation_config=PREDICTION_GENERATION_CONFIG):
+                    for field, value in parser.feed(text):
+                        if field in prediction_fields:
+                            yield sse_event(field, {field: value})
+                prediction, problems = prediction_output.check_prediction(parser.members)
+                if problems:
+                    # The valid sections are already out; repaired ones are sent again below
+                    prediction = await repair_prediction(prompt, parser.members, prediction, problems)
+                else:
+                    prediction_output.stats["valid"] += 1
+            except ValueError as e:
+                if not local_fallback_allowed(e):
+                    raise
+                print(f"Warning: Gemini prediction failed, using local crop scoring: {e}")
+                prediction = empty_prediction()
+            
+            if not prediction["crops"] and local_fallback_allowed():
+                # Replace whatever was streamed with the local engine's sections
+                metrics.fallbacks.inc(kind="local_prediction")
+                prediction, source = local_prediction(request, climate_data), "local"
+                for field in prediction_fields:
+                    yield sse_event(field, {field: prediction[field]})
+            else:
+                for field in prediction_fields:
+                    if parser.members.get(field) != prediction[field]:
+                        # Gemini left this section out or validation changed it; send the final version
+                        yield sse_event(field, {field: prediction[field]})
+                prediction_cache.set(cache_key, prediction, request.land_area)
+        
+        response = CropPredictionResponse(
+            crops=prediction["crops"],
+            yield_data=prediction["yield_data"],
+            crop_timeline=prediction.get("crop_timeline", []),
+            best_sowing_time=prediction["best_sowing_time"],
+            climate_data=climate_data,
+            soil_info=soil_info,
+            prediction_source=source
+        )
+        yield sse_event("done", await remember_prediction(response.model_dump()))
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+        error = prediction_http_exception(e)
+        yield sse_event("error", {"status_code": error.status_code, "detail": error.detail})
 
-def fetch_climate_data(lat: float, lon: float) -> dict:
-    """Fetch climate data from NASA POWER API"""
-    import requests
-    from datetime import datetime, timedelta
+def prediction_cache_key(request: CropPredictionRequest, climate_data: dict, soil_info: dict) -> tuple:
+    # Prefilter mode changes the prompt, so its predictions are cached separately
+    prompt_version = PREDICTION_PROMPT_VERSION + ("+prefilter" if CROP_ENGINE_MODE == "prefilter" else "")
+    # Different soil records of the same type (e.g. nearby sensors) get their own predictions
+    return prediction_cache.make_key(
+        f"{request.soil_type}#{soil_info.get('id', '')}",
+        cell_for(request.latitude, request.longitude),
+        climate_data,
+        prompt_version
+    )
+
+async def get_climate_or_default(lat: float, lon: float) -> dict:
+    """Climate aggregates for a point, or the cell's last known or default values if NASA POWER fails"""
+    try:
+        # Under a request deadline the fetch is capped and must leave time for the Gemini call
+        return await deadlines.run_within(
+            fetch_climate_data(lat, lon), "climate",
+            budget=CLIMATE_STAGE_BUDGET_SECONDS, reserve=GEMINI_STAGE_RESERVE_SECONDS
+        )
+    except Exception as climate_error:
+        if isinstance(climate_error, CircuitOpenError):
+            kind = "circuit_open"
+        elif isinstance(climate_error, DeadlineExceeded):
+            kind = "deadline_exceeded"
+        else:
+            kind = type(climate_error).__name__
+        metrics.upstream_errors.inc(upstream="nasa", kind=kind)
+        return await fallback_climate(lat, lon, climate_error)
+
+async def fallback_climate(lat: float, lon: float, error: Exception) -> dict:
+    """The cell's last known climate aggregates, or default values, when fresh ones can't be had"""
+    # Prefer the last aggregate fetched for this cell over the defaults
+    last_known = await climate_cache.get_last_known_async(lat, lon)
+    if last_known is not None:
+        print(f"Warning: NASA API failed, using last known climate data for the cell: {error}")
+        metrics.fallbacks.inc(kind="climate_last_known")
+        return last_known
     
-    BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
+    # Use default climate data if NASA API fails or is slow
+    print(f"Warning: NASA API failed, using default climate data: {error}")
+    metrics.fallbacks.inc(kind="climate_default")
+    return {
+        "avg_temp": 25.0,
+        "avg_soil_moisture": 0.5,
+        "avg_surface_temp": 26.0,
+        "total_rainfall": 100.0
+    }
+
+async def fetch_climate_data(lat: float, lon: float, days: int = 30) -> dict:
+    """
+    Fetch climate data from NASA POWER API.
+    Points covered by the local climate grid are answered from it without any network I/O.
+    Daily values are stored per grid cell, so only days not already held are requested.
+    """
+    from datetime import datetime, timedelta
     
     today = datetime.now()
-    thirty_days_ago = today - timedelta(days=30)
+    window_start = today - timedelta(days=days)
     
     end_date_str = today.strftime("%Y%m%d")
-    start_date_str = thirty_days_ago.strftime("%Y%m%d")
-    
-    params = {
-        "request": "execute",
-        "parameters": "T2M,PRECTOTCORR,GWETTOP,TS",
-        "community": "AG",
-        "longitude": lon,
-        "latitude": lat,
-        "start": start_date_str,
-        "end": end_date_str,
-        "format": "JSON"
-    }
-    
-    # Reduced timeout to fail faster if API is slow (5 seconds)
-    response = requests.get(BASE_URL, params=params, timeout=5)
-    response.raise_for_status()
-    
-    data = response.json()
-    parameters = data['properties']['parameter']
-    
-    def clean_values(param_key):
-        return [v for v in parameters[param_key].values() if v != -999]
+    start_date_str = window_start.strftime("%Y%m%d")
     
-    t2m_values = clean_values('T2M')
-    gwet_values = clean_values('GWETTOP')
-    ts_values = clean_values('TS')
-    precip_values = clean_values('PRECTOTCORR')
+    if climate_grid is not None:
+        grid_data = climate_grid.aggregate(lat, lon, start_date_str, end_date_str)
+        if grid_data is not None:
+            return grid_data
     
-    if not t2m_values:
-        raise ValueError("No valid climate data found for the requested period")
+    cache_key = climate_cache.make_key(lat, lon, start_date_str, end_date_str)
+    cached = await climate_cache.get_async(cache_key)
+    if cached is not None:
+        return cached
     
-    avg_temp = sum(t2m_values) / len(t2m_values)
-    avg_soil_moist = sum(gwet_values) / len(gwet_values)
-    avg_surface_temp = sum(ts_values) / len(ts_values)
-    total_rainfall = sum(precip_values)
-    
-    return {
-        "avg_temp": round(avg_temp, 2),
-        "avg_soil_moisture": round(avg_soil_moist, 4),
-        "avg_surface_temp": round(avg_surface_temp, 2),
-        "total_rainfall": round(total_rainfall, 2)
-    }
+    # Requests for different points in the same cell share one refresh
+    return await climate_flight.run(
+        cache_key, lambda: refresh_climate_data(cell_for(lat, lon), start_date_str, end_date_str, cache_key)
+    )
 
-def get_soil_info(soil_type: str) -> dict:
-    """Get soil information from iot_data.json"""
-    import json
-    
-    try:
-        with open("iot_data.json", "r") as f:
-            iot_data = json.load(f)
-        
-        for soil in iot_data["soil_data"]:
-            if soil["type"].lower() == soil_type.lower():
-                return {
-                    "type": soil["type"],
-                    "water_retention": soil["water_retention"],
-                    "nutrient_content": soil["nutrient_content"],
-                    "pH_level": soil["pH_level"]
-                }
+async def refresh_climate_data(cell: tuple, start_date_str: str, end_date_str: str, cache_key: str) -> dict:
+    """Fetch the days missing for a cell from NASA POWER and return the window's aggregates"""
+    # SQLite work runs in a worker thread to keep it off the event loop
+    missing = await asyncio.to_thread(climate_series.missing_ranges, cell, start_date_str, end_date_str)
+    for missing_start, missing_end in missing:
+        # Raises CircuitOpenError straight away while NASA is known to be failing
+        parameters = await nasa_client.get_daily(cell, missing_start, missing_end, DAILY_PARAMETERS)
         
-        return {"type": soil_type, "water_retention": "Unknown", "nutrient_content": "Unknown", "pH_level": 0}
+        # Regroup {param: {day: value}} into {day: {param: value}}; -999 fills are kept
+        # so the aggregates skip them the same way the 30-day averages always have
+        daily = {}
+        for param in DAILY_PARAMETERS:
+            for day, value in parameters.get(param, {}).items():
+                daily.setdefault(day, {})[param] = value
+        await asyncio.to_thread(climate_series.save_days, cell, daily)
     
-    except FileNotFoundError:
-        return {"type": soil_type, "water_retention": "Unknown", "nutrient_content": "Unknown", "pH_level": 0}
+    climate_data = await asyncio.to_thread(climate_series.aggregate, cell, start_date_str, end_date_str)
+    await climate_cache.set_async(cache_key, climate_data)
+    return climate_data
+
+def get_soil_info(request: CropPredictionRequest) -> dict:
+    """Soil attributes for a request from the soil store, or placeholders if the soil type is unknown"""
+    record = get_soil_record(request)
+    if record is None:
+        return {"type": request.soil_type, "water_retention": "Unknown", "nutrient_content": "Unknown", "pH_level": 0}
+    return dict(record)
+
+def get_soil_record(request: CropPredictionRequest):
+    """
+    Full soil record (NPK, drainage, organic matter, ...) for a request: by soil_id, else the
+    nearest located record of the soil type, else the type's profile. None if unknown.
+    """
+    return soil_store.find(
+        request.soil_type,
+        soil_id=request.soil_id,
+        latitude=request.latitude,
+        longitude=request.longitude,
+        max_distance_km=SOIL_NEAREST_MAX_KM
+    )
+
+# Labels and units for soil attributes shown to Gemini and the chatbot, in display order
+SOIL_ATTRIBUTES = [
+    ("water_retention", "Water Retention", ""),
+    ("nutrient_content", "Nutrient Content", ""),
+    ("pH_level", "pH Level", ""),
+    ("nitrogen_content_mg_kg", "Nitrogen (N)", " mg/kg"),
+    ("phosphorus_content_mg_kg", "Phosphorus (P)", " mg/kg"),
+    ("potassium_content_mg_kg", "Potassium (K)", " mg/kg"),
+    ("organic_matter_percent", "Organic Matter", "%"),
+    ("cation_exchange_capacity_meq_100g", "Cation Exchange Capacity (CEC)", " meq/100g"),
+    ("drainage_capacity", "Drainage", ""),
+    ("electrical_conductivity_ds_m", "Electrical Conductivity", " dS/m"),
+    ("soil_density_g_cm3", "Soil Density", " g/cm³"),
+    ("bulk_density", "Bulk Density", " g/cm³"),
+    ("soil_depth_cm", "Soil Depth", " cm"),
+    ("temperature_range_celsius", "Soil Temperature Range", "°C"),
+]
+
+def soil_attribute_lines(soil_info: dict) -> list:
+    """"Label: value" lines for every soil attribute, known ones first and any others after"""
+    lines = [f"Type: {soil_info['type']}"]
+    known = {"id", "type", "latitude", "longitude"}
+    for key, label, unit in SOIL_ATTRIBUTES:
+        known.add(key)
+        if key in soil_info:
+            lines.append(f"{label}: {soil_info[key]}{unit}")
+    for key, value in soil_info.items():
+        if key not in known:
+            lines.append(f"{key.replace('_', ' ').title()}: {value}")
+    return lines
 
 def create_prediction_prompt(land_area: int, latitude: float, longitude: float, 
-                            soil_type: str, climate_data: dict, soil_info: dict) -> str:
+                            soil_type: str, climate_data: dict, soil_info: dict,
+                            candidate_crops: list = None) -> str:
     """Create a detailed prompt for Gemini API"""
     # Convert square feet to acres (1 acre = 43,560 sq ft)
     land_area_acres = land_area / 43560
     
+    soil_str = "\n".join(f"- {line}" for line in soil_attribute_lines(soil_info))
+    
+    # Optional shortlist from the local crop scorer
+    candidates_str = ""
+    if candidate_crops:
+        candidates_str = f"""
+**Candidate Crops (pre-screened for this soil and climate):**
+- {", ".join(candidate_crops)}
+Choose your recommendations from these candidates unless one is clearly unsuitable.
+"""
+    
     return f"""
 Based on the following agricultural data, provide crop recommendations:
 
@@ -264,11 +1249,8 @@ Based on the following agricultural data, provide crop recommendations:
 - Total Rainfall: {climate_data['total_rainfall']} mm
 
 **Soil Information:**
-- Type: {soil_info['type']}
-- Water Retention: {soil_info['water_retention']}
-- Nutrient Content: {soil_info['nutrient_content']}
-- pH Level: {soil_info['pH_level']}
-
+{soil_str}
+{candidates_str}
 Please provide recommendations in the following JSON format:
 {{
     "crops": [
@@ -300,42 +1282,76 @@ Please provide recommendations in the following JSON format:
 Recommend 3-5 best crops considering climate and soil conditions. For yield_data, provide EXACT numbers (not ranges) for yield in kg, market rates in Indian rupees per kg, costs in rupees, and ROI as a percentage. For crop_timeline, include all 12 months list but only list the suitable months for planting each crop. Be very specific with all values.
 """
 
-def get_gemini_prediction(prompt: str) -> dict:
-    """Get prediction from Gemini API"""
-    import json
-    import re
-    
+# Counters of the enclosing count_gemini_calls() blocks; tasks started inside a block count towards it
+_gemini_call_counters = contextvars.ContextVar("gemini_call_counters", default=())
+
+@contextmanager
+def count_gemini_calls():
+    """Count the Gemini calls (repairs included) made inside the block, as counter["calls"]"""
+    counter = {"calls": 0}
+    token = _gemini_call_counters.set(_gemini_call_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _gemini_call_counters.reset(token)
+
+def record_gemini_call():
+    for counter in _gemini_call_counters.get():
+        counter["calls"] += 1
+
+async def generate_gemini_text(prompt: str, priority: int = PRIORITY_PREDICT, generation_config: dict = None) -> str:
+    """Call Gemini and return the raw response text, mapping API failures to tagged ValueErrors"""
+    record_gemini_call()
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
+        with stage("gemini"):
+            response = await deadlines.run_within(gemini_scheduler.run(
+                lambda key: key.bind(gemini_model_class("gemini-2.5-flash")).generate_content_async(
+                    prompt, generation_config=generation_config
+                ),
+                priority=priority,
+                tokens=estimate_tokens(prompt, PREDICTION_OUTPUT_TOKENS)
+            ), "gemini")
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        error_str = str(e).lower()
-        # Check for API key limit errors
-        if "quota" in error_str or "limit" in error_str or "rate limit" in error_str or "429" in error_str:
-            raise ValueError("API_KEY_LIMIT_EXCEEDED: Gemini API quota/rate limit has been exceeded. Please try again later or check your API key limits.")
-        elif "api key" in error_str or "invalid" in error_str or "401" in error_str or "403" in error_str:
-            raise ValueError("API_KEY_ERROR: Invalid or missing API key. Please check your Gemini API key configuration.")
-        else:
-            raise ValueError(f"GEMINI_API_ERROR: {str(e)}")
-    
-    # Extract JSON from response
-    response_text = response.text
+        raise gemini_api_error(e)
     
-    # Try to find JSON in the response
-    json_match = re.search(r'\{[\s\S]*\}', response_text)
-    if json_match:
-        try:
-            prediction_data = json.loads(json_match.group())
-            return {
-                "crops": prediction_data.get("crops", []),
-                "yield_data": prediction_data.get("yield_data", []),
-                "crop_timeline": prediction_data.get("crop_timeline", []),
-                "best_sowing_time": prediction_data.get("best_sowing_time", "Not specified")
-            }
-        except json.JSONDecodeError:
-            pass
+    return response.text
+
+async def stream_gemini_text(prompt: str, priority: int = PRIORITY_PREDICT, generation_config: dict = None):
+    """Yield Gemini response text chunks as they are generated, with the same error mapping"""
+    record_gemini_call()
+    try:
+        chunks = gemini_scheduler.stream(
+            lambda key: key.bind(gemini_model_class("gemini-2.5-flash")).generate_content_async(
+                prompt, stream=True, generation_config=generation_config
+            ),
+            priority=priority,
+            tokens=estimate_tokens(prompt, PREDICTION_OUTPUT_TOKENS)
+        )
+        async for chunk in chunks:
+            yield chunk.text
+    except Exception as e:
+        raise gemini_api_error(e)
+
+def gemini_api_error(e: Exception) -> ValueError:
+    """Tag a Gemini client failure so callers can map it to the right HTTP status, and count it"""
+    error_str = str(e).lower()
+    # Check for API key limit errors
+    if "quota" in error_str or "limit" in error_str or "rate limit" in error_str or "429" in error_str:
+        error = ValueError("API_KEY_LIMIT_EXCEEDED: Gemini API quota/rate limit has been exceeded. Please try again later or check your API key limits.")
+    elif (isinstance(e, (api_exceptions.Unauthenticated, api_exceptions.PermissionDenied))
+          or "api key" in error_str or "401" in error_str or "403" in error_str):
+        error = ValueError("API_KEY_ERROR: Invalid or missing API key. Please check your Gemini API key configuration.")
+    elif isinstance(e, (api_exceptions.DeadlineExceeded, asyncio.TimeoutError)):
+        error = ValueError(f"GEMINI_TIMEOUT: Gemini did not answer in time: {str(e)}")
+    else:
+        error = ValueError(f"GEMINI_API_ERROR: {str(e)}")
     
-    # Fallback: return the raw response
+    metrics.upstream_errors.inc(upstream="gemini", kind=str(error).split(":")[0].lower())
+    return error
+
+def empty_prediction() -> dict:
     return {
         "crops": [],
         "yield_data": [],
@@ -343,10 +1359,114 @@ def get_gemini_prediction(prompt: str) -> dict:
         "best_sowing_time": "Not specified"
     }
 
-def create_chatbot_prompt(question: str, prediction_data: CropPredictionResponse, language: str = "en") -> str:
-    """Create a prompt for the chatbot that restricts answers to only the provided dataset"""
-    import json
+async def get_gemini_prediction(prompt: str, priority: int = PRIORITY_PREDICT) -> dict:
+    """
+    Get a validated prediction from Gemini. Invalid entries are sent back once for repair and
+    dropped if still invalid; a reply with no readable JSON gives an empty prediction.
+    """
+    response_text = await generate_gemini_text(prompt, priority=priority, generation_config=PREDICTION_GENERATION_CONFIG)
+    
+    with stage("parse"):
+        try:
+            prediction_data = prediction_output.extract_json(response_text)
+        except ValueError as e:
+            print(f"Warning: could not decode the Gemini prediction: {e}")
+            prediction_output.stats["undecodable"] += 1
+            return empty_prediction()
+        prediction, problems = prediction_output.check_prediction(prediction_data)
     
+    if not problems:
+        prediction_output.stats["valid"] += 1
+        return prediction
+    return await repair_prediction(prompt, prediction_data, prediction, problems, priority)
+
+async def repair_prediction(prompt: str, prediction_data: dict, prediction: dict, problems: list,
+                            priority: int = PRIORITY_PREDICT) -> dict:
+    """
+    Ask again for just the invalid parts instead of regenerating the whole prediction. Returns the
+    repaired prediction, or the valid entries already checked (prediction) if the repair fails.
+    """
+    try:
+        repair_text = await generate_gemini_text(
+            prediction_output.create_repair_prompt(prompt, prediction_data, problems),
+            priority=priority,
+            generation_config=PREDICTION_REPAIR_GENERATION_CONFIG
+        )
+        with stage("parse"):
+            repair = prediction_output.extract_json(repair_text)
+            prediction_data = prediction_output.apply_repair(prediction_data, repair, problems)
+            prediction, problems = prediction_output.check_prediction(prediction_data, record=False)
+    except ValueError as e:
+        print(f"Warning: Gemini prediction repair failed, keeping the valid entries: {e}")
+    
+    prediction_output.stats["partial" if problems else "repaired"] += 1
+    return prediction
+
+def create_batch_prediction_prompt(prompts: list) -> str:
+    """Combine several single-plot prediction prompts into one request"""
+    sections = "\n".join(
+        f"=== PLOT {number} ===\n{prompt.strip()}\n" for number, prompt in enumerate(prompts, start=1)
+    )
+    
+    return f"""
+You will receive {len(prompts)} separate plots. Answer each plot independently, exactly as its section instructs.
+
+{sections}
+Return a single JSON object of the form {{"plots": [<answer for plot 1>, <answer for plot 2>, ...]}} with exactly {len(prompts)} entries in plot order, where each entry uses the JSON format requested in that plot's section.
+"""
+
+async def get_gemini_batch_prediction(prompts: list) -> list:
+    """
+    Get predictions for several plots from one Gemini call. Plots with invalid parts are repaired
+    together in one more call; entries that are missing or have no usable crops are None.
+    """
+    response_text = await generate_gemini_text(
+        create_batch_prediction_prompt(prompts), priority=PRIORITY_BATCH,
+        generation_config=BATCH_PREDICTION_GENERATION_CONFIG
+    )
+    
+    predictions = [None] * len(prompts)
+    try:
+        answer = prediction_output.extract_json(response_text)
+    except ValueError:
+        answer = {}
+    plots = answer.get("plots", []) if isinstance(answer, dict) else []
+    if not isinstance(plots, list):
+        plots = []
+    invalid_plots, plot_problems = {}, {}
+    for position, plot in enumerate(plots[:len(prompts)]):
+        if not isinstance(plot, dict):
+            continue
+        prediction, problems = prediction_output.check_prediction(plot)
+        if problems:
+            invalid_plots[position], plot_problems[position] = plot, problems
+        else:
+            prediction_output.stats["valid"] += 1
+            predictions[position] = prediction
+    if not plot_problems:
+        return predictions
+    
+    # One repair call for every plot with invalid parts
+    try:
+        repair_text = await generate_gemini_text(
+            prediction_output.create_batch_repair_prompt(prompts, invalid_plots, plot_problems),
+            priority=PRIORITY_BATCH,
+            generation_config=BATCH_PREDICTION_REPAIR_GENERATION_CONFIG
+        )
+        repairs = prediction_output.split_batch_repair(prediction_output.extract_json(repair_text))
+    except ValueError as e:
+        print(f"Warning: Gemini batch prediction repair failed, keeping the valid entries: {e}")
+        repairs = {}
+    for position, plot in invalid_plots.items():
+        repaired = prediction_output.apply_repair(plot, repairs.get(position, {}), plot_problems[position])
+        prediction, problems = prediction_output.check_prediction(repaired, record=False)
+        prediction_output.stats["partial" if problems else "repaired"] += 1
+        # Plots left without crops are predicted on their own
+        predictions[position] = prediction if prediction["crops"] else None
+    return predictions
+
+def format_prediction_context(prediction_data: CropPredictionResponse) -> str:
+    """Format the prediction data as the dataset block the chatbot answers from"""
     # Format the prediction data as a readable string
     crops_str = "\n".join([
         f"- {crop['name']}: Requires {crop['water_required_liters']:,} liters of water"
@@ -372,13 +1492,25 @@ def create_chatbot_prompt(question: str, prediction_data: CropPredictionResponse
         f"Total Rainfall: {prediction_data.climate_data['total_rainfall']} mm"
     )
     
-    soil_str = (
-        f"Type: {prediction_data.soil_info['type']}\n"
-        f"Water Retention: {prediction_data.soil_info['water_retention']}\n"
-        f"Nutrient Content: {prediction_data.soil_info['nutrient_content']}\n"
-        f"pH Level: {prediction_data.soil_info['pH_level']}"
-    )
+    soil_str = "\n".join(soil_attribute_lines(prediction_data.soil_info))
     
+    return f"""**CROP RECOMMENDATIONS:**
+{crops_str}
+
+**YIELD & ECONOMICS DATA:**
+{yield_data_str}
+
+**BEST SOWING TIME:**
+{prediction_data.best_sowing_time}
+
+**CLIMATE DATA:**
+{climate_str}
+
+**SOIL INFORMATION:**
+{soil_str}"""
+
+def chatbot_language(language: str) -> tuple:
+    """Return (target language name, instruction prefix) for a language code"""
     # Language mapping with detailed instructions
     language_instructions = {
         "en": {
@@ -396,8 +1528,11 @@ def create_chatbot_prompt(question: str, prediction_data: CropPredictionResponse
     }
     
     lang_config = language_instructions.get(language, language_instructions["en"])
-    target_language = lang_config["name"]
-    language_prefix = lang_config["prefix"]
+    return lang_config["name"], lang_config["prefix"]
+
+def create_chatbot_prompt_prefix(context: str, language: str = "en") -> str:
+    """Instructions and dataset block: everything in the chatbot prompt before the question"""
+    target_language, language_prefix = chatbot_language(language)
     
     return f"""{language_prefix}
 
@@ -421,44 +1556,99 @@ CRITICAL RULES - YOU MUST FOLLOW THESE STRICTLY:
 9. MISSING DATA: If asked about crops not listed in the dataset, say they are not in the available data (in {target_language}).
 10. OUT-OF-SCOPE: If asked about general farming practices, weather patterns, or anything not in the dataset, decline politely and refer to the dataset limitation (in {target_language}).
 
-**CROP RECOMMENDATIONS:**
-{crops_str}
+{context}"""
 
-**YIELD & ECONOMICS DATA:**
-{yield_data_str}
+def create_chatbot_question(question: str, language: str = "en") -> str:
+    """The question part of the chatbot prompt, appended after the prefix"""
+    target_language, _ = chatbot_language(language)
+    
+    return f"""**USER QUESTION:**
+{question}
 
-**BEST SOWING TIME:**
-{prediction_data.best_sowing_time}
+**YOUR ANSWER (in {target_language} ONLY - do not mix languages):**
+"""
 
-**CLIMATE DATA:**
-{climate_str}
+def create_chatbot_prompt(question: str, prediction_data: CropPredictionResponse, language: str = "en",
+                          context: str = None) -> tuple:
+    """
+    Create a prompt for the chatbot that restricts answers to only the provided dataset, as
+    (prefix, question part): a Gemini context cache holds the prefix, so the parts are kept apart.
+    Pass a previously formatted context to skip re-formatting the prediction data.
+    """
+    if context is None:
+        context = format_prediction_context(prediction_data)
+    
+    return create_chatbot_prompt_prefix(context, language), create_chatbot_question(question, language)
 
-**SOIL INFORMATION:**
-{soil_str}
+# Configure generation to be more focused on the requested language
+CHATBOT_GENERATION_CONFIG = {
+    "temperature": 0.1,  # Lower temperature for more consistent language adherence
+    "top_p": 0.7,  # More restrictive for consistency
+    "top_k": 20,  # Smaller top_k for less randomness
+    "max_output_tokens": 500,
+}
 
-**USER QUESTION:**
-{question}
+def chatbot_empty_answer(language: str) -> str:
+    """Localized message for when Gemini returns an empty answer"""
+    error_messages = {
+        "en": "I apologize, but I couldn't generate an answer. Please try rephrasing your question.",
+        "hi": "मुझे खेद है, लेकिन मैं उत्तर उत्पन्न नहीं कर सका। कृपया अपने प्रश्न को फिर से तैयार करने का प्रयास करें।",
+        "kn": "ಕ್ಷಮಿಸಿ, ನಾನು ಉತ್ತರವನ್ನು ರಚಿಸಲು ಸಾಧ್ಯವಾಗಲಿಲ್ಲ. ದಯವಿಟ್ಟು ನಿಮ್ಮ ಪ್ರಶ್ನೆಯನ್ನು ಮರುರೂಪಿಸಲು ಪ್ರಯತ್ನಿಸಿ."
+    }
+    return error_messages.get(language, error_messages["en"])
 
-**YOUR ANSWER (in {target_language} ONLY - do not mix languages):**
-"""
+def chatbot_error_answer(language: str, e: Exception) -> str:
+    """Localized message for when the Gemini call fails"""
+    error_messages = {
+        "en": f"I encountered an error while processing your question: {str(e)}",
+        "hi": f"आपके प्रश्न को संसाधित करते समय मुझे एक त्रुटि का सामना करना पड़ा: {str(e)}",
+        "kn": f"ನಿಮ್ಮ ಪ್ರಶ್ನೆಯನ್ನು ಪ್ರಕ್ರಿಯೆಗೊಳಿಸುವಾಗ ನಾನು ದೋಷವನ್ನು ಎದುರಿಸಿದೆ: {str(e)}"
+    }
+    return error_messages.get(language, error_messages["en"])
+
+def chatbot_timeout_answer(language: str) -> str:
+    """Localized message for when the answer could not be generated within the request deadline"""
+    timeout_messages = {
+        "en": "Sorry, I couldn't answer in time. Please try asking again.",
+        "hi": "क्षमा करें, मैं समय पर उत्तर नहीं दे सका। कृपया फिर से पूछें।",
+        "kn": "ಕ್ಷಮಿಸಿ, ನಾನು ಸಮಯಕ್ಕೆ ಉತ್ತರಿಸಲು ಸಾಧ್ಯವಾಗಲಿಲ್ಲ. ದಯವಿಟ್ಟು ಮತ್ತೆ ಕೇಳಿ."
+    }
+    return timeout_messages.get(language, timeout_messages["en"])
+
+def chatbot_model_and_contents(prompt: tuple, cached_content=None) -> tuple:
+    """
+    Model and request contents for a chatbot call from create_chatbot_prompt's (prefix, question part),
+    using the cached prompt prefix when there is one
+    """
+    prefix, question_part = prompt
+    if cached_content is None:
+        return gemini_model_class("gemini-2.5-flash"), prefix + "\n\n" + question_part
+    
+    # The cached content already holds the instructions and dataset; send only the question part
+    return gemini_model_class.from_cached_content(cached_content), question_part
+
+def chatbot_schedule_options(contents: str, cached_content=None) -> dict:
+    """Scheduler priority, token reservation and key pinning for a chatbot call"""
+    return {
+        "priority": PRIORITY_INTERACTIVE,
+        "tokens": estimate_tokens(contents, CHATBOT_GENERATION_CONFIG["max_output_tokens"]),
+        # Cached content only exists under the key that created it
+        "pinned": None if cached_content is None else 0,
+    }
 
-def get_chatbot_answer(prompt: str, language: str = "en") -> str:
+async def get_chatbot_answer(prompt: tuple, language: str = "en", cached_content=None) -> str:
     """Get answer from Gemini API for chatbot"""
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        model, contents = chatbot_model_and_contents(prompt, cached_content)
         
-        # Configure generation to be more focused on the requested language
-        generation_config = {
-            "temperature": 0.1,  # Lower temperature for more consistent language adherence
-            "top_p": 0.7,  # More restrictive for consistency
-            "top_k": 20,  # Smaller top_k for less randomness
-            "max_output_tokens": 500,
-        }
-        
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
+        with stage("gemini"):
+            response = await deadlines.run_within(gemini_scheduler.run(
+                lambda key: key.bind(model).generate_content_async(
+                    contents,
+                    generation_config=CHATBOT_GENERATION_CONFIG
+                ),
+                **chatbot_schedule_options(contents, cached_content)
+            ), "gemini")
         
         answer = response.text.strip()
         
@@ -469,22 +1659,66 @@ def get_chatbot_answer(prompt: str, language: str = "en") -> str:
         
         # Validate that answer is not empty
         if not answer:
-            error_messages = {
-                "en": "I apologize, but I couldn't generate an answer. Please try rephrasing your question.",
-                "hi": "मुझे खेद है, लेकिन मैं उत्तर उत्पन्न नहीं कर सका। कृपया अपने प्रश्न को फिर से तैयार करने का प्रयास करें।",
-                "kn": "ಕ್ಷಮಿಸಿ, ನಾನು ಉತ್ತರವನ್ನು ರಚಿಸಲು ಸಾಧ್ಯವಾಗಲಿಲ್ಲ. ದಯವಿಟ್ಟು ನಿಮ್ಮ ಪ್ರಶ್ನೆಯನ್ನು ಮರುರೂಪಿಸಲು ಪ್ರಯತ್ನಿಸಿ."
-            }
-            return error_messages.get(language, error_messages["en"])
+            return chatbot_empty_answer(language)
         
         return answer
     
+    except DeadlineExceeded:
+        return chatbot_timeout_answer(language)
     except Exception as e:
-        error_messages = {
-            "en": f"I encountered an error while processing your question: {str(e)}",
-            "hi": f"आपके प्रश्न को संसाधित करते समय मुझे एक त्रुटि का सामना करना पड़ा: {str(e)}",
-            "kn": f"ನಿಮ್ಮ ಪ್ರಶ್ನೆಯನ್ನು ಪ್ರಕ್ರಿಯೆಗೊಳಿಸುವಾಗ ನಾನು ದೋಷವನ್ನು ಎದುರಿಸಿದೆ: {str(e)}"
-        }
-        return error_messages.get(language, error_messages["en"])
+        gemini_api_error(e)  # Counted as an upstream error; the user gets a localized message
+        return chatbot_error_answer(language, e)
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message with a JSON payload"""
+    import json
+    
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_chatbot_answer(prompt: tuple, language: str = "en", cached_content=None):
+    """
+    Stream the chatbot answer from Gemini as Server-Sent Events.
+    Emits "delta" events as text arrives and a final "done" event carrying the
+    cleaned full answer (or a localized error message).
+    """
+    parts = []
+    try:
+        model, contents = chatbot_model_and_contents(prompt, cached_content)
+        
+        response = gemini_scheduler.stream(
+            lambda key: key.bind(model).generate_content_async(
+                contents,
+                generation_config=CHATBOT_GENERATION_CONFIG,
+                stream=True
+            ),
+            **chatbot_schedule_options(contents, cached_content)
+        )
+        
+        async for chunk in response:
+            text = chunk.text
+            if text:
+                parts.append(text)
+                yield sse_event("delta", {"text": text})
+    
+    except Exception as e:
+        gemini_api_error(e)  # Counted as an upstream error; the user gets a localized message
+        yield sse_event("error", {"answer": chatbot_error_answer(language, e)})
+        return
+    
+    answer = "".join(parts).strip()
+    
+    # Same post-processing as the non-streaming answer, applied to the full text
+    if language in ["hi", "kn"]:
+        answer = clean_response_language(answer, language)
+    
+    if not answer:
+        answer = chatbot_empty_answer(language)
+    
+    yield sse_event("done", {"answer": answer})
+
+async def stream_local_answer(answer: str):
+    """A locally computed answer, sent in the same event format as stream_chatbot_answer"""
+    yield sse_event("done", {"answer": answer})
 
 def clean_response_language(response: str, language: str) -> str:
     """
@@ -0,0 +1,230 @@
+"""
+Local stand-ins for NASA POWER and Gemini, for benchmarking without real API calls.
+
+power_app is a small HTTP server for the POWER daily point endpoint. For a
+given cell and day it returns the same plausible values every time, with a
+share of -999 fills like real POWER data. FakeGenerativeModel replaces
+genai.GenerativeModel inside the benchmark server. It answers prediction
+prompts with fenced JSON, batch prompts with a "plots" object, and chatbot
+prompts with plain text; the app is pointed at it through GEMINI_MODEL_CLASS.
+
+Both read their behaviour from an UpstreamFaults: mean latency, jitter,
+the share of calls that fail with a server error, and the share that are
+rejected with a 429.
+"""
+import asyncio
+import json
+import random
+import re
+import zlib
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from google.api_core import exceptions as api_exceptions
+
+
+class UpstreamFaults:
+    """Latency and failure injection for one fake upstream"""
+
+    def __init__(self, latency_ms: float = 100.0, jitter: float = 0.3, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self.stats = {"calls": 0, "errors": 0, "rate_limited": 0}
+
+    @classmethod
+    def from_env(cls, environ: dict, prefix: str, latency_ms: float, seed: int = 0):
+        """Faults from e.g. BENCH_NASA_LATENCY_MS, BENCH_NASA_JITTER, BENCH_NASA_ERROR_RATE, BENCH_NASA_429_RATE"""
+        return cls(
+            latency_ms=float(environ.get(f"{prefix}_LATENCY_MS", latency_ms)),
+            jitter=float(environ.get(f"{prefix}_JITTER", "0.3")),
+            error_rate=float(environ.get(f"{prefix}_ERROR_RATE", "0")),
+            rate_limit_rate=float(environ.get(f"{prefix}_429_RATE", "0")),
+            seed=seed,
+        )
+
+    def delay(self) -> float:
+        """Seconds to wait before answering; jitter is the spread as a fraction of the mean"""
+        spread = self.latency_ms * self.jitter
+        return max(0.0, self._random.gauss(self.latency_ms, spread)) / 1000
+
+    def outcome(self) -> str:
+        """"ok", "error" or "rate_limited" for the next call"""
+        self.stats["calls"] += 1
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return "rate_limited"
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return "error"
+        return "ok"
+
+
+# --- NASA POWER ---
+
+def power_daily_values(lat: float, lon: float, day: str, gap_rate: float) -> dict:
+    """Deterministic daily POWER values for a point, with about gap_rate of them as -999"""
+    rng = random.Random(zlib.crc32(f"{lat:.4f}:{lon:.4f}:{day}".encode()))
+    season = datetime.strptime(day, "%Y%m%d").timetuple().tm_yday / 365
+    base_temp = 30 - abs(lat - 10) * 0.4 - 6 * abs(season - 0.45)
+    values = {
+        "T2M": round(base_temp + rng.gauss(0, 2), 2),
+        "PRECTOTCORR": round(max(0.0, rng.expovariate(1 / 4) if rng.random() < 0.4 else 0.0), 2),
+        "GWETTOP": round(min(1.0, max(0.0, rng.gauss(0.5, 0.15))), 4),
+        "TS": round(base_temp + 1.5 + rng.gauss(0, 2.5), 2),
+    }
+    for param in values:
+        if rng.random() < gap_rate:
+            values[param] = -999
+    return values
+
+
+def power_response(lat: float, lon: float, start: str, end: str, parameters: list, gap_rate: float) -> dict:
+    """A POWER daily point response body in the shape the live API returns"""
+    series = {param: {} for param in parameters}
+    day = datetime.strptime(start, "%Y%m%d")
+    last = datetime.strptime(end, "%Y%m%d")
+    while day <= last:
+        key = day.strftime("%Y%m%d")
+        values = power_daily_values(lat, lon, key, gap_rate)
+        for param in parameters:
+            series[param][key] = values.get(param, -999)
+        day += timedelta(days=1)
+
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat, 0.0]},
+        "properties": {"parameter": series},
+        "header": {"title": "NASA/POWER Daily Data (benchmark stand-in)", "fill_value": -999,
+                   "start": start, "end": end},
+        "parameters": {param: {"units": "", "longname": param} for param in parameters},
+    }
+
+
+def create_power_app(faults: UpstreamFaults, gap_rate: float = 0.05) -> FastAPI:
+    """HTTP server answering /api/temporal/daily/point like NASA POWER"""
+    power_app = FastAPI(title="Fake NASA POWER")
+
+    @power_app.get("/api/temporal/daily/point")
+    async def daily_point(request: Request):
+        await asyncio.sleep(faults.delay())
+        outcome = faults.outcome()
+        if outcome == "rate_limited":
+            return JSONResponse({"message": "Too many requests"}, status_code=429)
+        if outcome == "error":
+            return JSONResponse({"message": "Service unavailable"}, status_code=503)
+
+        query = request.query_params
+        parameters = query.get("parameters", "T2M").split(",")
+        return power_response(
+            float(query["latitude"]), float(query["longitude"]), query["start"], query["end"], parameters, gap_rate
+        )
+
+    @power_app.get("/stats")
+    def stats():
+        return faults.stats
+
+    return power_app
+
+
+# --- Gemini ---
+
+CROPS = [
+    ("Rice", 1.4, 22, 18000, "Kharif", ["June", "July"]),
+    ("Wheat", 1.1, 24, 15000, "Rabi", ["October", "November"]),
+    ("Maize", 1.6, 20, 14000, "Kharif", ["June", "July", "August"]),
+    ("Ragi", 0.9, 35, 11000, "Kharif", ["May", "June"]),
+    ("Groundnut", 0.7, 60, 20000, "Kharif", ["June", "July"]),
+    ("Chickpea", 0.5, 55, 12000, "Rabi", ["October", "November"]),
+]
+
+
+def fake_prediction(land_area: float, rng: random.Random) -> dict:
+    """A prediction object in the format the prediction prompt asks for"""
+    acres = land_area / 43560
+    picks = rng.sample(CROPS, 3)
+    crops, yield_data, timeline = [], [], []
+    for name, tonnes_per_acre, rate, cost_per_acre, season, months in picks:
+        yield_amount = round(tonnes_per_acre * 1000 * acres * rng.uniform(0.85, 1.15), 2)
+        selling = round(yield_amount * rate, 2)
+        growing = round(cost_per_acre * acres, 2)
+        crops.append({"name": name, "water_required_liters": round(land_area * rng.uniform(8, 20), 2)})
+        yield_data.append({
+            "crop_name": name,
+            "yield_amount": yield_amount,
+            "market_rate_per_unit": rate,
+            "cost_of_selling": selling,
+            "cost_of_growing": growing,
+            "roi": round((selling - growing) / growing * 100, 2) if growing else 0.0,
+        })
+        timeline.append({"crop": name, "season": season, "suitable_months": months})
+    return {
+        "crops": crops,
+        "yield_data": yield_data,
+        "crop_timeline": timeline,
+        "best_sowing_time": "June to July for Kharif crops, October to November for Rabi crops",
+    }
+
+
+def fake_response_text(prompt: str, rng: random.Random) -> str:
+    """Gemini-style text for one of the app's prompts"""
+    if "**USER QUESTION:**" in prompt:
+        return ("Based on the prediction data, the recommended crops suit your soil and recent climate. "
+                "Sow during the months listed in the crop timeline and plan irrigation around the water requirement.")
+
+    plots = re.search(r"You will receive (\d+) separate plots", prompt)
+    if plots:
+        areas = [float(area) for area in re.findall(r"Land Area: (\d+(?:\.\d+)?) square feet", prompt)]
+        body = {"plots": [fake_prediction(area, rng) for area in areas[:int(plots.group(1))]]}
+    else:
+        area = re.search(r"Land Area: (\d+(?:\.\d+)?) square feet", prompt)
+        body = fake_prediction(float(area.group(1)) if area else 43560, rng)
+    return "Here are the crop recommendations for your land:\n\n```json\n" + json.dumps(body, indent=2) + "\n```\n"
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel, selected with GEMINI_MODEL_CLASS=fake_upstreams:FakeGenerativeModel"""
+
+    faults = UpstreamFaults(latency_ms=1500.0)
+    stream_chunk_chars = 40
+    # Like the real API, a streamed answer's first chunk comes after a share of the full latency
+    first_chunk_share = 0.25
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", **kwargs):
+        self.model_name = model_name
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        return cls()
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        outcome = self.faults.outcome()
+        if outcome == "rate_limited":
+            await asyncio.sleep(0.01)
+            raise api_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if outcome == "error":
+            await asyncio.sleep(self.faults.delay() / 2)
+            raise api_exceptions.InternalServerError("500 An internal error has occurred.")
+
+        text = fake_response_text(str(contents), self.faults._random)
+        if stream:
+            return self._stream(text, self.faults.delay())
+        await asyncio.sleep(self.faults.delay())
+        return FakeResponse(text)
+
+    async def _stream(self, text: str, duration: float):
+        chunks = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        first = duration * self.first_chunk_share if len(chunks) > 1 else duration
+        for number, chunk in enumerate(chunks):
+            await asyncio.sleep(first if number == 0 else (duration - first) / (len(chunks) - 1))
+            yield FakeResponse(chunk)
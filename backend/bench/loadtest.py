@@ -0,0 +1,358 @@
+"""
+Load test for /predict, /ask, /ask/stream and /predict/batch against fake upstreams.
+
+    python bench/loadtest.py                          # start bench/serve.py, run, compare to baseline.json
+    python bench/loadtest.py --save-baseline          # record the current numbers as the baseline
+    python bench/loadtest.py --url http://host:8800   # use a server that is already running
+    python bench/loadtest.py --gemini-429-rate 0.1 --nasa-error-rate 0.05 --no-compare
+
+Each scenario is run at each concurrency level in turn. At each level, that
+many workers send requests back to back for --duration seconds. The report
+shows p50/p95/p99 latency, requests per second and the error rate. When
+compared to the baseline, a latency percentile more than --threshold
+slower, or a throughput ratio more than --threshold lower, counts as a
+regression and the exit status is 1. Throughput is compared as the ratio
+of each level's rps to the lowest level's, i.e. how well it scales with
+concurrency, since absolute rps moves with the machine.
+
+For /ask/stream the report also shows the time to the first answer event
+(TTFT). When the ask scenario ran too, TTFT is set against the latency of
+the /ask questions that Gemini answered, at the same concurrency.
+
+The fake upstreams are deterministic for a given seed, but numbers still
+depend on the machine. Re-record the baseline when moving to other hardware;
+--save-baseline runs each level for at least BASELINE_MIN_DURATION seconds so
+the recorded percentiles aren't taken from a handful of requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Seconds per concurrency level when recording a baseline
+BASELINE_MIN_DURATION = 60.0
+
+SOIL_TYPES = ["Sandy", "Loamy", "Clayey", "Silty"]
+
+# Half the questions are lookups answered locally, half go to Gemini
+LOOKUP_QUESTIONS = [
+    "Which crop has the highest ROI?",
+    "What is the total water required for all crops?",
+]
+GEMINI_QUESTIONS = [
+    "Why are these crops suitable for my soil?",
+    "How should I prepare the field before sowing?",
+]
+QUESTIONS = LOOKUP_QUESTIONS + GEMINI_QUESTIONS
+
+
+class Workload:
+    """Deterministic request bodies: plots drawn from a fixed pool of locations in India"""
+
+    def __init__(self, locations: int = 200, seed: int = 0):
+        self._random = random.Random(seed)
+        self.locations = [
+            (round(self._random.uniform(8.0, 30.0), 4), round(self._random.uniform(70.0, 88.0), 4))
+            for _ in range(locations)
+        ]
+        self.prediction_ids = []
+
+    def plot(self) -> dict:
+        latitude, longitude = self._random.choice(self.locations)
+        return {
+            "land_area": self._random.choice([5000, 10890, 21780, 43560, 87120]),
+            "latitude": latitude,
+            "longitude": longitude,
+            "soil_type": self._random.choice(SOIL_TYPES),
+        }
+
+    def predict(self) -> tuple:
+        return "/predict", self.plot()
+
+    def batch(self, size: int = 8) -> tuple:
+        return "/predict/batch", {"items": [self.plot() for _ in range(size)]}
+
+    def ask(self) -> tuple:
+        return "/ask", {
+            "question": self._random.choice(QUESTIONS),
+            "prediction_id": self._random.choice(self.prediction_ids),
+            "language": "en",
+        }
+
+    def ask_stream(self) -> tuple:
+        # Only questions that go to Gemini: local answers arrive as one event and have nothing to stream
+        return "/ask/stream", {
+            "question": self._random.choice(GEMINI_QUESTIONS),
+            "prediction_id": self._random.choice(self.prediction_ids),
+            "language": "en",
+        }
+
+
+SCENARIOS = {
+    "predict": Workload.predict,
+    "ask": Workload.ask,
+    "ask_stream": Workload.ask_stream,
+    "batch": Workload.batch,
+}
+
+# Scenarios answered as Server-Sent Events; their time to first token is measured too
+STREAMING_SCENARIOS = {"ask_stream"}
+
+
+def percentiles_ms(seconds: list) -> tuple:
+    if not seconds:
+        return 0.0, 0.0, 0.0
+    return tuple(round(float(value), 1) for value in np.percentile(np.array(seconds) * 1000, [50, 95, 99]))
+
+
+def summarize(latencies: list, errors: int, elapsed: float, first_tokens: list = None) -> dict:
+    total = len(latencies) + errors
+    p50, p95, p99 = percentiles_ms(latencies)
+    summary = {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+    }
+    if first_tokens is not None:
+        summary["ttft_p50_ms"], summary["ttft_p95_ms"], summary["ttft_p99_ms"] = percentiles_ms(first_tokens)
+    return summary
+
+
+async def post_stream(client: httpx.AsyncClient, path: str, body: dict, sent: float) -> tuple:
+    """POST to a Server-Sent Events endpoint; returns (ok, seconds until the first answer event)"""
+    first_token = None
+    last_event = None
+    async with client.stream("POST", path, json=body) as response:
+        if response.status_code != 200:
+            return False, None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                last_event = line[len("event: "):]
+                if first_token is None and last_event in ("delta", "done"):
+                    first_token = time.perf_counter() - sent
+    return last_event == "done", first_token
+
+
+async def run_level(client: httpx.AsyncClient, workload: Workload, scenario: str,
+                    concurrency: int, duration: float) -> dict:
+    """concurrency closed-loop workers sending scenario requests for duration seconds"""
+    make_request = SCENARIOS[scenario]
+    streaming = scenario in STREAMING_SCENARIOS
+    latencies, first_tokens, errors = [], [], 0
+    gemini_latencies = []  # /ask requests that went to Gemini, to compare /ask/stream against
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            path, body = make_request(workload)
+            sent = time.perf_counter()
+            first_token = None
+            try:
+                if streaming:
+                    ok, first_token = await post_stream(client, path, body, sent)
+                else:
+                    response = await client.post(path, json=body)
+                    ok = response.status_code == 200
+                if ok and scenario == "batch":
+                    # Per-item failures don't change the status code
+                    ok = all(item["status_code"] == 200 for item in response.json()["results"])
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - sent)
+                if scenario == "ask" and body["question"] in GEMINI_QUESTIONS:
+                    gemini_latencies.append(latencies[-1])
+                if first_token is not None:
+                    first_tokens.append(first_token)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = summarize(latencies, errors, time.perf_counter() - started, first_tokens if streaming else None)
+    if scenario == "ask":
+        summary["gemini_p50_ms"], summary["gemini_p95_ms"], _ = percentiles_ms(gemini_latencies)
+    return summary
+
+
+async def prepare_ask(client: httpx.AsyncClient, workload: Workload, count: int = 5):
+    """Create predictions to ask about; /ask scenarios reference them by prediction_id"""
+    for _ in range(count):
+        response = await client.post("/predict", json=workload.plot())
+        response.raise_for_status()
+        workload.prediction_ids.append(response.json()["prediction_id"])
+
+
+async def run_benchmark(url: str, scenarios: list, levels: list, duration: float, seed: int) -> dict:
+    workload = Workload(seed=seed)
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = {}
+    async with httpx.AsyncClient(base_url=url, timeout=120.0, limits=limits) as client:
+        for scenario in scenarios:
+            if scenario in ("ask", "ask_stream") and not workload.prediction_ids:
+                await prepare_ask(client, workload)
+            results[scenario] = {}
+            for concurrency in levels:
+                summary = await run_level(client, workload, scenario, concurrency, duration)
+                results[scenario][str(concurrency)] = summary
+                ttft = f"  ttft p50 {summary['ttft_p50_ms']:8.1f} ms" if "ttft_p50_ms" in summary else ""
+                print(f"{scenario:10} c={concurrency:<4} {summary['rps']:8.2f} rps  "
+                      f"p50 {summary['p50_ms']:8.1f}  p95 {summary['p95_ms']:8.1f}  "
+                      f"p99 {summary['p99_ms']:8.1f} ms  errors {summary['error_rate']:.1%}{ttft}")
+    report_first_token(results)
+    return results
+
+
+def report_first_token(results: dict):
+    """Compare /ask/stream time to first token with the latency of /ask questions that went to Gemini"""
+    if "ask" not in results or "ask_stream" not in results:
+        return
+    for concurrency, streamed in results["ask_stream"].items():
+        asked = results["ask"].get(concurrency)
+        if asked is None or not asked["gemini_p50_ms"]:
+            continue
+        print(f"ask_stream c={concurrency:<4} first token p50 {streamed['ttft_p50_ms']:.1f} ms "
+              f"vs /ask p50 {asked['gemini_p50_ms']:.1f} ms ({streamed['ttft_p50_ms'] / asked['gemini_p50_ms']:.0%}); "
+              f"p95 {streamed['ttft_p95_ms']:.1f} vs {asked['gemini_p95_ms']:.1f} ms")
+
+
+def throughput_ratios(levels: dict, reference: str) -> dict:
+    """rps at each concurrency level divided by the rps at the reference level"""
+    base = levels[reference]["rps"]
+    return {concurrency: round(summary["rps"] / base, 3) if base else 0.0 for concurrency, summary in levels.items()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Regressions as readable strings; levels missing from the baseline are skipped"""
+    regressions = []
+    for scenario, levels in results.items():
+        previous_levels = baseline.get(scenario, {})
+        shared = [concurrency for concurrency in levels if concurrency in previous_levels]
+        # Throughput relative to the lowest level both runs have
+        reference = min(shared, key=int) if shared else None
+        ratios = throughput_ratios(levels, reference) if reference else {}
+        previous_ratios = throughput_ratios(previous_levels, reference) if reference else {}
+        for concurrency in shared:
+            current, previous = levels[concurrency], previous_levels[concurrency]
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms", "ttft_p99_ms"):
+                if previous.get(metric) and current[metric] > previous[metric] * (1 + threshold):
+                    regressions.append(f"{scenario} c={concurrency} {metric}: "
+                                       f"{previous[metric]} -> {current[metric]}")
+            if previous_ratios[concurrency] and ratios[concurrency] < previous_ratios[concurrency] * (1 - threshold):
+                regressions.append(f"{scenario} c={concurrency} rps vs c={reference}: "
+                                   f"{previous_ratios[concurrency]}x -> {ratios[concurrency]}x")
+            if current["error_rate"] > previous["error_rate"] + threshold:
+                regressions.append(f"{scenario} c={concurrency} error_rate: "
+                                   f"{previous['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+
+def start_server(args) -> subprocess.Popen:
+    """Start bench/serve.py with the requested fault injection and wait until it answers"""
+    env = {
+        **os.environ,
+        "BENCH_SEED": str(args.seed),
+        "BENCH_NASA_LATENCY_MS": str(args.nasa_latency_ms),
+        "BENCH_NASA_ERROR_RATE": str(args.nasa_error_rate),
+        "BENCH_NASA_429_RATE": str(args.nasa_429_rate),
+        "BENCH_NASA_GAP_RATE": str(args.nasa_gap_rate),
+        "BENCH_GEMINI_LATENCY_MS": str(args.gemini_latency_ms),
+        "BENCH_GEMINI_ERROR_RATE": str(args.gemini_error_rate),
+        "BENCH_GEMINI_429_RATE": str(args.gemini_429_rate),
+    }
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "serve.py"), "--port", str(args.port),
+         "--nasa-port", str(args.port + 1)],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    for _ in range(300):
+        if server.poll() is not None:
+            raise RuntimeError("Benchmark server exited during startup")
+        try:
+            httpx.get(url + "/", timeout=1.0)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Benchmark server did not start within 30 seconds")
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the API against fake NASA POWER and Gemini upstreams")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting bench/serve.py")
+    parser.add_argument("--port", type=int, default=8800, help="Port for the started server (fake NASA uses port + 1)")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        default=["predict", "ask", "ask_stream", "batch"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nasa-latency-ms", type=float, default=150.0)
+    parser.add_argument("--nasa-error-rate", type=float, default=0.0)
+    parser.add_argument("--nasa-429-rate", type=float, default=0.0)
+    parser.add_argument("--nasa-gap-rate", type=float, default=0.05, help="Share of -999 daily values")
+    parser.add_argument("--gemini-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (default 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--no-compare", action="store_true", help="Only report, never fail")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    if args.save_baseline and args.duration < BASELINE_MIN_DURATION:
+        print(f"Recording the baseline with {BASELINE_MIN_DURATION:.0f}s per level instead of {args.duration:g}s")
+        args.duration = BASELINE_MIN_DURATION
+
+    server = None if args.url else start_server(args)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        results = asyncio.run(run_benchmark(url, args.scenarios, args.concurrency, args.duration, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if args.no_compare:
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
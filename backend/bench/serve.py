@@ -0,0 +1,72 @@
+"""
+Run the API against the fake NASA POWER and Gemini upstreams.
+
+    python bench/serve.py --port 8800
+
+The fake POWER server listens on --nasa-port in a background thread and the
+app is pointed at it through NASA_POWER_URL. Gemini calls go to
+FakeGenerativeModel in-process, selected through GEMINI_MODEL_CLASS. Fault
+injection is read from the environment:
+
+    BENCH_NASA_LATENCY_MS, BENCH_NASA_JITTER, BENCH_NASA_ERROR_RATE, BENCH_NASA_429_RATE,
+    BENCH_NASA_GAP_RATE (share of -999 values), BENCH_GEMINI_LATENCY_MS, BENCH_GEMINI_JITTER,
+    BENCH_GEMINI_ERROR_RATE, BENCH_GEMINI_429_RATE, BENCH_SEED
+
+Caches are in memory only and the climate grid is off, so every run starts
+cold. Other app settings (GEMINI_RPM, CROP_ENGINE_MODE, ...) pass through.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_upstreams import FakeGenerativeModel, UpstreamFaults, create_power_app  # noqa: E402
+
+
+def start_power_server(port: int, faults: UpstreamFaults, gap_rate: float) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(
+        create_power_app(faults, gap_rate), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Serve the API with fake NASA POWER and Gemini upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--nasa-port", type=int, default=8801)
+    args = parser.parse_args(argv)
+
+    seed = int(os.getenv("BENCH_SEED", "0"))
+    nasa_faults = UpstreamFaults.from_env(os.environ, "BENCH_NASA", latency_ms=150.0, seed=seed)
+    FakeGenerativeModel.faults = UpstreamFaults.from_env(os.environ, "BENCH_GEMINI", latency_ms=1500.0, seed=seed + 1)
+    start_power_server(args.nasa_port, nasa_faults, float(os.getenv("BENCH_NASA_GAP_RATE", "0.05")))
+
+    # Must be set before app is imported; it reads its configuration at import time
+    os.environ["NASA_POWER_URL"] = f"http://127.0.0.1:{args.nasa_port}/api/temporal/daily/point"
+    os.environ["GEMINI_API_KEY"] = os.environ.get("GEMINI_API_KEY") or "bench-key"
+    os.environ["GEMINI_MODEL_CLASS"] = "fake_upstreams:FakeGenerativeModel"
+    os.environ["CLIMATE_CACHE_PATH"] = ""
+    os.environ["CLIMATE_GRID_PATH"] = ""
+    os.environ.pop("PREDICTION_SESSION_SPILL_PATH", None)
+    os.environ.setdefault("GEMINI_RPM", "100000")
+    os.environ.setdefault("GEMINI_QUEUE_SIZE", "1000")
+
+    import app as app_module
+
+    print(f"Benchmark server on http://{args.host}:{args.port} "
+          f"(fake NASA POWER on :{args.nasa_port}, fake Gemini in-process)")
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
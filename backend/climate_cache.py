@@ -0,0 +1,370 @@
+"""
+Caching for NASA POWER climate data.
+
+ClimateCache holds finished aggregates keyed by the POWER grid cell a point
+falls into plus the requested date window, so nearby farms and repeat visits
+on the same day share one upstream call. The in-memory LRU tier serves hot
+cells; the SQLite tier survives restarts.
+
+DailySeriesStore sits underneath it and keeps the raw daily series per cell,
+so a warm cell only needs the days that are new since its last fetch. Its
+methods all touch SQLite, so async callers run them with asyncio.to_thread.
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# POWER meteorology comes from MERRA-2, whose native grid is 0.5° lat x 0.625° lon
+CELL_LAT_DEG = 0.5
+CELL_LON_DEG = 0.625
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "climate_cache.db")
+
+
+def cell_for(lat: float, lon: float) -> tuple:
+    """
+    Return the (lat, lon) of the POWER grid point nearest a point. MERRA-2 values sit on the
+    grid points (multiples of 0.5° and 0.625°), so each is the centre of the cell it stands for.
+    """
+    # floor(x + 0.5) rounds halves up, so a point on a cell edge always lands in the same cell
+    cell_lat = math.floor(lat / CELL_LAT_DEG + 0.5) * CELL_LAT_DEG
+    cell_lon = math.floor(lon / CELL_LON_DEG + 0.5) * CELL_LON_DEG
+    return round(cell_lat, 4) + 0.0, round(cell_lon, 4) + 0.0
+
+
+def next_refresh_time(now: float = None) -> float:
+    """POWER publishes new daily values once a day, so entries expire at the next UTC midnight"""
+    current = datetime.fromtimestamp(now if now is not None else time.time(), tz=timezone.utc)
+    tomorrow = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return tomorrow.timestamp()
+
+
+class ClimateCache:
+    """
+    In-memory LRU in front of an on-disk SQLite store, with hit/miss counters.
+    The *_async methods serve the memory tier on the event loop and run SQLite
+    reads and writes in a worker thread.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_memory_entries: int = 1024):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        # Separate locks so the memory tier never waits behind disk I/O in another thread
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "last_known_served": 0}
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS climate_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(lat: float, lon: float, start: str, end: str) -> str:
+        cell_lat, cell_lon = cell_for(lat, lon)
+        return f"{cell_lat}:{cell_lon}:{start}:{end}"
+
+    def get(self, key: str):
+        value = self._get_memory(key)
+        return value if value is not None else self._get_disk(key)
+
+    async def get_async(self, key: str):
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        if self._db is None:
+            return self._get_disk(key)
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def _get_memory(self, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at > time.time():
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return dict(value)
+            del self._memory[key]
+            self.stats["expired"] += 1
+            return None
+
+    def _get_disk(self, key: str):
+        """The SQLite tier of get(), counting the miss if the key isn't there either"""
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM climate_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] <= time.time():
+                    self._db.execute("DELETE FROM climate_cache WHERE key = ?", (key,))
+                    self._db.commit()
+            if row is not None:
+                with self._lock:
+                    if row[1] > time.time():
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        self.stats["disk_hits"] += 1
+                        return dict(value)
+                    self.stats["expired"] += 1
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: dict, expires_at: float = None):
+        expires_at = self._set_memory(key, value, expires_at)
+        self._set_disk(key, value, expires_at)
+
+    async def set_async(self, key: str, value: dict, expires_at: float = None):
+        expires_at = self._set_memory(key, value, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, expires_at)
+
+    def _set_memory(self, key: str, value: dict, expires_at: float = None) -> float:
+        if expires_at is None:
+            expires_at = next_refresh_time()
+        with self._lock:
+            self._remember(key, dict(value), expires_at)
+        return expires_at
+
+    def _set_disk(self, key: str, value: dict, expires_at: float):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO climate_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._db.commit()
+
+    def get_last_known(self, lat: float, lon: float):
+        """
+        Most recent aggregate stored for the point's cell, expired or not. Used when
+        NASA POWER is unavailable; returns None if the cell was never fetched.
+        """
+        cell_lat, cell_lon = cell_for(lat, lon)
+        prefix = f"{cell_lat}:{cell_lon}:"
+        best = None
+        with self._lock:
+            for key, (value, expires_at) in self._memory.items():
+                if key.startswith(prefix) and (best is None or expires_at > best[1]):
+                    best = (value, expires_at)
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM climate_cache WHERE key LIKE ? ORDER BY expires_at DESC LIMIT 1",
+                    (prefix + "%",),
+                ).fetchone()
+            if row is not None and (best is None or row[1] > best[1]):
+                best = (json.loads(row[0]), row[1])
+        if best is None:
+            return None
+        with self._lock:
+            self.stats["last_known_served"] += 1
+        return dict(best[0])
+
+    async def get_last_known_async(self, lat: float, lon: float):
+        if self._db is None:
+            return self.get_last_known(lat, lon)
+        return await asyncio.to_thread(self.get_last_known, lat, lon)
+
+    def _remember(self, key: str, value: dict, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        disk_entries = 0
+        if self._db is not None:
+            with self._db_lock:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM climate_cache").fetchone()[0]
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = lookups - self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.max_memory_entries,
+                "disk_entries": disk_entries,
+            }
+
+
+# Daily POWER parameters kept per cell, in the order they are stored
+DAILY_PARAMETERS = ("T2M", "PRECTOTCORR", "GWETTOP", "TS")
+FILL_VALUE = -999
+
+# POWER back-fills its most recent days; fill values newer than this are re-requested
+FILL_RECHECK_DAYS = 7
+
+
+class RollingWindow:
+    """Running sums and counts of valid daily values over a sliding date window for one cell"""
+
+    def __init__(self):
+        self.days = {}
+        self.sums = {param: 0.0 for param in DAILY_PARAMETERS}
+        self.counts = {param: 0 for param in DAILY_PARAMETERS}
+
+    def put(self, day: str, values: dict):
+        if day in self.days:
+            self._apply(self.days[day], -1)
+        self.days[day] = values
+        self._apply(values, 1)
+
+    def drop_outside(self, start: str, end: str):
+        for day in [d for d in self.days if d < start or d > end]:
+            self._apply(self.days.pop(day), -1)
+
+    def _apply(self, values: dict, sign: int):
+        for param in DAILY_PARAMETERS:
+            value = values.get(param, FILL_VALUE)
+            if value != FILL_VALUE:
+                self.sums[param] += sign * value
+                self.counts[param] += sign
+
+    def aggregates(self) -> dict:
+        if not self.counts["T2M"]:
+            raise ValueError("No valid climate data found for the requested period")
+
+        def mean(param):
+            if not self.counts[param]:
+                raise ValueError(f"No valid {param} values found for the requested period")
+            return self.sums[param] / self.counts[param]
+
+        return {
+            "avg_temp": round(mean("T2M"), 2),
+            "avg_soil_moisture": round(mean("GWETTOP"), 4),
+            "avg_surface_temp": round(mean("TS"), 2),
+            "total_rainfall": round(self.sums["PRECTOTCORR"], 2)
+        }
+
+
+class DailySeriesStore:
+    """
+    Per-cell daily POWER series persisted in SQLite.
+
+    Callers ask for the ranges of days still missing from a window, fetch only
+    those ranges upstream, and then read aggregates from a per-cell RollingWindow
+    that is slid forward instead of being recomputed from scratch.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_cells_in_memory: int = 4096):
+        self.max_cells_in_memory = max_cells_in_memory
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"days_fetched": 0, "days_reused": 0}
+
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS climate_daily ("
+            " cell_lat REAL NOT NULL, cell_lon REAL NOT NULL, day TEXT NOT NULL,"
+            " t2m REAL, prectotcorr REAL, gwettop REAL, ts REAL,"
+            " PRIMARY KEY (cell_lat, cell_lon, day))"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _is_complete(day: str, values: dict, recheck_from: str) -> bool:
+        if day < recheck_from:
+            return True
+        return all(values.get(param, FILL_VALUE) != FILL_VALUE for param in DAILY_PARAMETERS)
+
+    def _load(self, cell: tuple, start: str, end: str) -> dict:
+        rows = self._db.execute(
+            "SELECT day, t2m, prectotcorr, gwettop, ts FROM climate_daily"
+            " WHERE cell_lat = ? AND cell_lon = ? AND day BETWEEN ? AND ?",
+            (cell[0], cell[1], start, end),
+        ).fetchall()
+        return {row[0]: dict(zip(DAILY_PARAMETERS, row[1:])) for row in rows}
+
+    def missing_ranges(self, cell: tuple, start: str, end: str) -> list:
+        """Return the contiguous (first, last) day ranges in the window that still need fetching"""
+        recheck_from = (datetime.now() - timedelta(days=FILL_RECHECK_DAYS)).strftime("%Y%m%d")
+        with self._lock:
+            stored = self._load(cell, start, end)
+
+        ranges = []
+        day = datetime.strptime(start, "%Y%m%d")
+        last = datetime.strptime(end, "%Y%m%d")
+        previous_missing = False
+        while day <= last:
+            key = day.strftime("%Y%m%d")
+            is_missing = key not in stored or not self._is_complete(key, stored[key], recheck_from)
+            if is_missing:
+                if previous_missing:
+                    ranges[-1] = (ranges[-1][0], key)
+                else:
+                    ranges.append((key, key))
+            else:
+                self.stats["days_reused"] += 1
+            previous_missing = is_missing
+            day += timedelta(days=1)
+        return ranges
+
+    def save_days(self, cell: tuple, days: dict):
+        """Persist daily values ({"YYYYMMDD": {"T2M": ..., ...}}) and fold them into the live window"""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO climate_daily"
+                " (cell_lat, cell_lon, day, t2m, prectotcorr, gwettop, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (cell[0], cell[1], day, *(values.get(p, FILL_VALUE) for p in DAILY_PARAMETERS))
+                    for day, values in days.items()
+                ],
+            )
+            self._db.commit()
+            self.stats["days_fetched"] += len(days)
+
+            # Days outside the window's range are trimmed on the next aggregate()
+            window = self._windows.get(cell)
+            if window is not None:
+                for day, values in days.items():
+                    window.put(day, values)
+
+    def aggregate(self, cell: tuple, start: str, end: str) -> dict:
+        """Slide the cell's window to start..end and return the climate aggregates"""
+        with self._lock:
+            window = self._windows.get(cell)
+            if window is None:
+                window = RollingWindow()
+                self._windows[cell] = window
+            self._windows.move_to_end(cell)
+            while len(self._windows) > self.max_cells_in_memory:
+                self._windows.popitem(last=False)
+
+            window.drop_outside(start, end)
+            if window.days:
+                # Only days outside the span already held need to be read back
+                held_start, held_end = min(window.days), max(window.days)
+                stored = {}
+                if start < held_start:
+                    stored.update(self._load(cell, start, held_start))
+                if end > held_end:
+                    stored.update(self._load(cell, held_end, end))
+            else:
+                stored = self._load(cell, start, end)
+            for day, values in stored.items():
+                if day not in window.days:
+                    window.put(day, values)
+
+            return window.aggregates()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stored_days = self._db.execute("SELECT COUNT(*) FROM climate_daily").fetchone()[0]
+            return {**self.stats, "cells_in_memory": len(self._windows), "stored_days": stored_days}
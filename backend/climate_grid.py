@@ -0,0 +1,276 @@
+"""
+Precomputed regional climate grid.
+
+A bounding box of POWER grid cells is bulk-loaded from local POWER exports
+(JSON or CSV) into one float32 array of shape (lat cells, lon cells, days,
+parameters) saved as .npy next to a small grid.json describing it. The app
+opens the array with mmap, so every uvicorn worker shares the same page-cache
+copy, and climate for any point inside the box is a slice of that array with
+no network I/O. Points outside the box, or windows the grid doesn't cover,
+return None and go to the live API.
+
+Build a grid with the command below; workers load it at startup, so restart
+them after re-ingesting:
+
+    python climate_grid.py ingest --bbox 6 68 37 98 --out climate_grid exports/*.json exports/*.csv
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from climate_cache import CELL_LAT_DEG, CELL_LON_DEG, DAILY_PARAMETERS, FILL_VALUE, cell_for
+
+DEFAULT_GRID_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "climate_grid")
+META_FILE = "grid.json"
+DATA_FILE = "daily.npy"
+
+
+def _day(text: str) -> datetime:
+    return datetime.strptime(text, "%Y%m%d")
+
+
+class ClimateGrid:
+    """Read-only, memory-mapped daily POWER values for a rectangle of grid cells"""
+
+    def __init__(self, path: str, max_age_days: int = 45):
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        self.path = path
+        self.max_age_days = max_age_days
+        self.lat0, self.lon0 = meta["lat0"], meta["lon0"]  # Centre of the south-west cell
+        self.start_day = _day(meta["start"])
+        self.parameters = meta["parameters"]
+        self.data = np.load(os.path.join(path, DATA_FILE), mmap_mode="r")
+        self.n_lat, self.n_lon, self.n_days, _ = self.data.shape
+        self.end_day = self.start_day + timedelta(days=self.n_days - 1)
+        self._columns = [self.parameters.index(param) for param in DAILY_PARAMETERS]
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "outside": 0, "stale": 0, "empty": 0}
+
+    @classmethod
+    def open(cls, path: str, max_age_days: int = 45):
+        """The grid stored at path, or None if there isn't one"""
+        if not path or not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        grid = cls(path, max_age_days)
+        if cell_for(grid.lat0, grid.lon0) != (grid.lat0, grid.lon0):
+            # Built when cells were keyed by their corners; its rows would be off by half a cell
+            print(f"Warning: climate grid at {path} is not on the POWER grid points, re-ingest it; not using it")
+            return None
+        return grid
+
+    def cell_index(self, lat: float, lon: float):
+        """(row, column) of the cell containing the point, or None if it is outside the grid"""
+        cell_lat, cell_lon = cell_for(lat, lon)
+        row = round((cell_lat - self.lat0) / CELL_LAT_DEG)
+        col = round((cell_lon - self.lon0) / CELL_LON_DEG)
+        if 0 <= row < self.n_lat and 0 <= col < self.n_lon:
+            return row, col
+        return None
+
+    def aggregate(self, lat: float, lon: float, start: str, end: str):
+        """
+        Climate aggregates for the window start..end (YYYYMMDD) at a point, in the format
+        fetch_climate_data returns. If the grid stops before end, the same-length window
+        ending on the grid's last day is used, as long as that is within max_age_days.
+        Returns None when the point or window isn't covered.
+        """
+        index = self.cell_index(lat, lon)
+        if index is None:
+            return self._count("outside")
+
+        window_start, window_end = _day(start), _day(end)
+        if window_end > self.end_day:
+            if (window_end - self.end_day).days > self.max_age_days:
+                return self._count("stale")
+            window_start -= window_end - self.end_day
+            window_end = self.end_day
+        first = (window_start - self.start_day).days
+        last = (window_end - self.start_day).days
+        if first < 0 or last < first:
+            return self._count("stale")
+
+        values = np.asarray(self.data[index[0], index[1], first:last + 1][:, self._columns], dtype=np.float64)
+        valid = ~np.isnan(values)
+        counts = dict(zip(DAILY_PARAMETERS, valid.sum(axis=0)))
+        sums = dict(zip(DAILY_PARAMETERS, np.where(valid, values, 0.0).sum(axis=0)))
+        # Same rules as RollingWindow.aggregates: the averaged parameters need at least one valid
+        # day, while rainfall is a total, so a window with none of it valid has 0
+        if not all(counts[param] for param in ("T2M", "GWETTOP", "TS")):
+            return self._count("empty")
+        means = {param: sums[param] / counts[param] for param in ("T2M", "GWETTOP", "TS")}
+
+        self._count("hits")
+        return {
+            "avg_temp": round(float(means["T2M"]), 2),
+            "avg_soil_moisture": round(float(means["GWETTOP"]), 4),
+            "avg_surface_temp": round(float(means["TS"]), 2),
+            "total_rainfall": round(float(sums["PRECTOTCORR"]), 2)
+        }
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] += 1
+        return None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "cells": self.n_lat * self.n_lon,
+                "first_day": self.start_day.strftime("%Y%m%d"),
+                "last_day": self.end_day.strftime("%Y%m%d"),
+                "bytes": int(self.data.nbytes),
+            }
+
+
+def read_power_json(path: str) -> list:
+    """[(lat, lon, {day: {param: value}})] from a POWER daily point JSON export"""
+    with open(path, "r") as f:
+        data = json.load(f)
+    features = data.get("features", [data])  # Multi-point exports are a FeatureCollection
+    points = []
+    for feature in features:
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        daily = {}
+        for param, series in feature["properties"]["parameter"].items():
+            for day, value in series.items():
+                daily.setdefault(day, {})[param] = value
+        points.append((float(lat), float(lon), daily))
+    return points
+
+
+def read_power_csv(path: str) -> list:
+    """
+    [(lat, lon, {day: {param: value}})] from a POWER CSV export. Regional exports have
+    LAT/LON columns; point exports give the location in the header block instead.
+    Dates are YEAR,MO,DY or YEAR,DOY columns.
+    """
+    with open(path, "r", newline="") as f:
+        lines = f.read().splitlines()
+
+    header_lat = header_lon = None
+    if lines and lines[0].startswith("-BEGIN HEADER-"):
+        end = lines.index("-END HEADER-")
+        for line in lines[1:end]:
+            if "Latitude" in line and "Longitude" in line:
+                words = line.replace(",", " ").split()
+                header_lat = float(words[words.index("Latitude") + 1])
+                header_lon = float(words[words.index("Longitude") + 1])
+        lines = lines[end + 1:]
+
+    by_location = {}
+    for row in csv.DictReader(lines):
+        lat = float(row["LAT"]) if "LAT" in row else header_lat
+        lon = float(row["LON"]) if "LON" in row else header_lon
+        if lat is None or lon is None:
+            raise ValueError(f"{path}: no LAT/LON columns and no location in the header")
+        if "DOY" in row:
+            day = datetime(int(row["YEAR"]), 1, 1) + timedelta(days=int(row["DOY"]) - 1)
+        else:
+            day = datetime(int(row["YEAR"]), int(row["MO"]), int(row["DY"]))
+        values = {param: float(row[param]) for param in DAILY_PARAMETERS if row.get(param) not in (None, "")}
+        by_location.setdefault((lat, lon), {})[day.strftime("%Y%m%d")] = values
+    return [(lat, lon, daily) for (lat, lon), daily in by_location.items()]
+
+
+def ingest(files: list, bbox: tuple, out: str, start: str = None, end: str = None) -> dict:
+    """
+    Build the grid for bbox (south, west, north, east) from POWER export files and write it
+    to out, replacing any grid already there. Points outside the box are skipped; -999
+    fills and days with no export are stored as NaN. Returns a summary.
+    """
+    south, west, north, east = bbox
+    lat0, lon0 = cell_for(south, west)
+    lat1, lon1 = cell_for(north, east)
+    n_lat = round((lat1 - lat0) / CELL_LAT_DEG) + 1
+    n_lon = round((lon1 - lon0) / CELL_LON_DEG) + 1
+
+    points = []
+    for path in files:
+        reader = read_power_csv if path.lower().endswith(".csv") else read_power_json
+        points.extend(reader(path))
+    if not points:
+        raise ValueError("No POWER data found in the input files")
+
+    all_days = sorted({day for _, _, daily in points for day in daily})
+    first_day = _day(start or all_days[0])
+    last_day = _day(end or all_days[-1])
+    n_days = (last_day - first_day).days + 1
+    if n_days <= 0:
+        raise ValueError("The end date is before the start date")
+
+    os.makedirs(out, exist_ok=True)
+    tmp_data = os.path.join(out, DATA_FILE + ".tmp")
+    data = np.lib.format.open_memmap(
+        tmp_data, mode="w+", dtype=np.float32, shape=(n_lat, n_lon, n_days, len(DAILY_PARAMETERS))
+    )
+    data[:] = np.nan
+
+    cells, skipped = set(), 0
+    for lat, lon, daily in points:
+        cell_lat, cell_lon = cell_for(lat, lon)
+        row = round((cell_lat - lat0) / CELL_LAT_DEG)
+        col = round((cell_lon - lon0) / CELL_LON_DEG)
+        if not (0 <= row < n_lat and 0 <= col < n_lon):
+            skipped += 1
+            continue
+        cells.add((row, col))
+        days = list(daily)
+        offsets = np.array([(_day(day) - first_day).days for day in days], dtype=int)
+        values = np.array(
+            [[daily[day].get(param, FILL_VALUE) for param in DAILY_PARAMETERS] for day in days], dtype=np.float64
+        ).reshape(len(days), len(DAILY_PARAMETERS))
+        values[values == FILL_VALUE] = np.nan
+        keep = (offsets >= 0) & (offsets < n_days)
+        data[row, col, offsets[keep]] = values[keep]
+    data.flush()
+    del data
+
+    # Swap the new files in so running workers never see a half-written grid
+    meta = {
+        "lat0": lat0, "lon0": lon0, "start": first_day.strftime("%Y%m%d"),
+        "parameters": list(DAILY_PARAMETERS), "cell_deg": [CELL_LAT_DEG, CELL_LON_DEG]
+    }
+    tmp_meta = os.path.join(out, META_FILE + ".tmp")
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_data, os.path.join(out, DATA_FILE))
+    os.replace(tmp_meta, os.path.join(out, META_FILE))
+
+    return {
+        "grid_cells": n_lat * n_lon,
+        "cells_with_data": len(cells),
+        "points_outside_bbox": skipped,
+        "first_day": meta["start"],
+        "last_day": last_day.strftime("%Y%m%d"),
+        "bytes": n_lat * n_lon * n_days * len(DAILY_PARAMETERS) * 4,
+    }
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Build the memory-mapped climate grid from POWER exports")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Load POWER JSON/CSV exports for a bounding box")
+    ingest_parser.add_argument("files", nargs="+", help="POWER export files or glob patterns")
+    ingest_parser.add_argument("--bbox", nargs=4, type=float, required=True,
+                               metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    ingest_parser.add_argument("--out", default=DEFAULT_GRID_PATH, help="Grid directory (default: %(default)s)")
+    ingest_parser.add_argument("--start", help="First day to keep, YYYYMMDD (default: earliest in the files)")
+    ingest_parser.add_argument("--end", help="Last day to keep, YYYYMMDD (default: latest in the files)")
+
+    args = parser.parse_args(argv)
+    files = sorted({path for pattern in args.files for path in (glob.glob(pattern) or [pattern])})
+    summary = ingest(files, tuple(args.bbox), args.out, args.start, args.end)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Offline crop recommendation engine.
+
+Scores every crop in crop_catalog.json against the climate aggregates and the
+full soil record from iot_data.json in one vectorized NumPy pass, and builds a
+prediction in the same shape get_gemini_prediction returns. Used when Gemini
+is throttled, as the primary engine, or to narrow the crop list sent to Gemini.
+"""
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_catalog.json")
+
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+# Drainage classes from wettest to driest, as used in iot_data.json
+DRAINAGE_CLASSES = ["Poorly Drained", "Moderately Well Drained", "Well Drained", "Excessively Drained"]
+
+# Relative importance of each factor in the combined score
+FACTOR_WEIGHTS = {
+    "temperature": 0.22,
+    "rainfall": 0.12,
+    "soil_moisture": 0.10,
+    "pH": 0.14,
+    "nutrients": 0.14,
+    "drainage": 0.10,
+    "organic_matter": 0.04,
+    "soil_temperature": 0.04,
+    "sowing_window": 0.10,
+}
+
+# Scores never drop below this, so one poor factor lowers a crop without zeroing it
+SCORE_FLOOR = 0.05
+
+SQFT_PER_ACRE = 43560
+
+
+def _range_suitability(value: float, low: np.ndarray, high: np.ndarray, tolerance: np.ndarray) -> np.ndarray:
+    """1 inside [low, high], falling linearly to 0 at tolerance outside it"""
+    distance = np.maximum(np.maximum(low - value, value - high), 0.0)
+    return np.clip(1.0 - distance / tolerance, 0.0, 1.0)
+
+
+def _parse_range(text, default: tuple) -> tuple:
+    """Parse "15-28" style ranges from the soil data"""
+    try:
+        low, high = str(text).split("-")
+        return float(low), float(high)
+    except (ValueError, AttributeError):
+        return default
+
+
+class CropScorer:
+    """Crop catalog held as column arrays so all crops are scored at once"""
+
+    def __init__(self, catalog_path: str = DEFAULT_CATALOG_PATH):
+        with open(catalog_path, "r") as f:
+            self.crops = json.load(f)["crops"]
+
+        def column(key, index=None):
+            values = [crop[key] if index is None else crop[key][index] for crop in self.crops]
+            return np.array(values, dtype=float)
+
+        self.names = [crop["name"] for crop in self.crops]
+        self.temp_low, self.temp_high = column("temp_range_celsius", 0), column("temp_range_celsius", 1)
+        self.rain_low, self.rain_high = column("rainfall_range_mm_30d", 0), column("rainfall_range_mm_30d", 1)
+        self.moisture_low, self.moisture_high = column("soil_moisture_range", 0), column("soil_moisture_range", 1)
+        self.ph_low, self.ph_high = column("pH_range", 0), column("pH_range", 1)
+        self.nutrient_need = np.stack([
+            column("nitrogen_need_mg_kg"), column("phosphorus_need_mg_kg"), column("potassium_need_mg_kg")
+        ], axis=1)
+        self.organic_matter_min = column("organic_matter_min_percent")
+        self.drainage_low = np.array([DRAINAGE_CLASSES.index(c["drainage_range"][0]) for c in self.crops], dtype=float)
+        self.drainage_high = np.array([DRAINAGE_CLASSES.index(c["drainage_range"][1]) for c in self.crops], dtype=float)
+        self.sowing_months = np.array(
+            [[month in crop["suitable_months"] for month in MONTHS] for crop in self.crops], dtype=bool
+        )
+        self.water_per_sqft = column("water_liters_per_sqft")
+        self.yield_per_acre = column("yield_kg_per_acre")
+        self.market_rate = column("market_rate_per_kg")
+        self.cost_per_acre = column("cost_of_growing_per_acre")
+
+    def factor_scores(self, climate_data: dict, soil_record: dict = None, month: int = None) -> dict:
+        """Per-factor suitability arrays (one value per crop, 0..1)"""
+        n = len(self.crops)
+        neutral = np.full(n, 0.7)  # Used for soil factors when the soil type is unknown
+
+        temp = float(climate_data["avg_temp"])
+        rain = float(climate_data["total_rainfall"])
+        moisture = float(climate_data["avg_soil_moisture"])
+        scores = {
+            "temperature": _range_suitability(temp, self.temp_low, self.temp_high, np.full(n, 8.0)),
+            "rainfall": _range_suitability(
+                rain, self.rain_low, self.rain_high, np.maximum(self.rain_high - self.rain_low, 40.0)
+            ),
+            "soil_moisture": _range_suitability(moisture, self.moisture_low, self.moisture_high, np.full(n, 0.3)),
+        }
+
+        if soil_record:
+            ph = float(soil_record.get("pH_level", 6.5))
+            scores["pH"] = _range_suitability(ph, self.ph_low, self.ph_high, np.full(n, 1.5))
+
+            available = np.array([
+                soil_record.get("nitrogen_content_mg_kg", 0),
+                soil_record.get("phosphorus_content_mg_kg", 0),
+                soil_record.get("potassium_content_mg_kg", 0),
+            ], dtype=float)
+            # Shortfall in the most limiting nutrient, softened since fertiliser can make up some of it
+            sufficiency = np.clip(available / self.nutrient_need, 0.0, 1.0).min(axis=1)
+            scores["nutrients"] = 0.4 + 0.6 * sufficiency
+
+            drainage = soil_record.get("drainage_capacity")
+            if drainage in DRAINAGE_CLASSES:
+                scores["drainage"] = _range_suitability(
+                    float(DRAINAGE_CLASSES.index(drainage)), self.drainage_low, self.drainage_high, np.full(n, 3.0)
+                )
+            else:
+                scores["drainage"] = neutral
+
+            organic_matter = float(soil_record.get("organic_matter_percent", 0))
+            scores["organic_matter"] = np.clip(0.5 + 0.5 * organic_matter / self.organic_matter_min, 0.0, 1.0)
+
+            soil_low, soil_high = _parse_range(soil_record.get("temperature_range_celsius"), (temp, temp))
+            overlap = np.minimum(soil_high, self.temp_high) - np.maximum(soil_low, self.temp_low)
+            scores["soil_temperature"] = np.clip(overlap / max(soil_high - soil_low, 1.0), 0.0, 1.0)
+        else:
+            for factor in ("pH", "nutrients", "drainage", "organic_matter", "soil_temperature"):
+                scores[factor] = neutral
+
+        # Favour crops that can be sown this month or in the next two
+        month = datetime.now().month if month is None else month
+        upcoming = [(month - 1 + offset) % 12 for offset in range(3)]
+        scores["sowing_window"] = np.where(self.sowing_months[:, upcoming].any(axis=1), 1.0, 0.5)
+        return scores
+
+    def score(self, climate_data: dict, soil_record: dict = None, month: int = None) -> np.ndarray:
+        """Weighted geometric mean of the factor scores for every crop"""
+        factors = self.factor_scores(climate_data, soil_record, month)
+        log_total = np.zeros(len(self.crops))
+        for factor, weight in FACTOR_WEIGHTS.items():
+            log_total += weight * np.log(np.maximum(factors[factor], SCORE_FLOOR))
+        return np.exp(log_total / sum(FACTOR_WEIGHTS.values()))
+
+    def rank(self, climate_data: dict, soil_record: dict = None, top_n: int = 5, month: int = None) -> tuple:
+        """(indices of the top_n crops best first, scores for every crop)"""
+        scores = self.score(climate_data, soil_record, month)
+        top = np.argsort(-scores, kind="stable")[:top_n]
+        return [int(i) for i in top], scores
+
+    def candidate_names(self, climate_data: dict, soil_record: dict = None, top_n: int = 8) -> list:
+        top, _ = self.rank(climate_data, soil_record, top_n)
+        return [self.names[i] for i in top]
+
+    def recommend(self, land_area: int, climate_data: dict, soil_record: dict = None, top_n: int = 5) -> dict:
+        """Prediction for land_area sq ft in the format returned by get_gemini_prediction"""
+        top, scores = self.rank(climate_data, soil_record, top_n)
+        idx = np.array(top, dtype=int)
+        acres = land_area / SQFT_PER_ACRE
+
+        # Expected yield drops with suitability; a perfectly suited crop reaches the catalog yield
+        yields = self.yield_per_acre[idx] * acres * (0.5 + 0.5 * scores[idx])
+        revenue = yields * self.market_rate[idx]
+        cost = self.cost_per_acre[idx] * acres
+        roi = np.where(cost > 0, (revenue - cost) / np.where(cost > 0, cost, 1.0) * 100, 0.0)
+        water = self.water_per_sqft[idx] * land_area
+
+        crops, yield_data, timeline = [], [], []
+        for position, i in enumerate(top):
+            crop = self.crops[i]
+            crops.append({"name": crop["name"], "water_required_liters": round(float(water[position]), 2)})
+            yield_data.append({
+                "crop_name": crop["name"],
+                "yield_amount": round(float(yields[position]), 2),
+                "market_rate_per_unit": crop["market_rate_per_kg"],
+                "cost_of_selling": round(float(revenue[position]), 2),
+                "cost_of_growing": round(float(cost[position]), 2),
+                "roi": round(float(roi[position]), 2)
+            })
+            timeline.append({
+                "crop": crop["name"],
+                "season": crop["season"],
+                "suitable_months": crop["suitable_months"]
+            })
+
+        sowing_parts = [
+            f"{crop['name']}: {crop['season']} ({', '.join(crop['suitable_months'])})"
+            for crop in (self.crops[i] for i in top)
+        ]
+        return {
+            "crops": crops,
+            "yield_data": yield_data,
+            "crop_timeline": timeline,
+            "best_sowing_time": "; ".join(sowing_parts) if sowing_parts else "Not specified"
+        }
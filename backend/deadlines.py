@@ -0,0 +1,83 @@
+"""
+End-to-end request deadlines.
+
+A request's deadline is set once at the endpoint and kept in a context
+variable, so every stage below it (climate fetch, Gemini call) sizes its own
+timeout from the time that is left, without the deadline being passed down
+through each call. A stage may also be capped at its own budget and made to
+leave a reserve for the stages after it. Code running outside a request,
+such as batch jobs, has no deadline and is not limited.
+"""
+import asyncio
+import contextlib
+import contextvars
+import time
+
+import metrics
+
+
+class DeadlineExceeded(ValueError):
+    """A stage ran out of the request's time budget"""
+
+
+_deadline = contextvars.ContextVar("greenbyte_deadline", default=None)
+
+
+def start(seconds: float):
+    """Give the request running in this context a deadline seconds from now"""
+    return _deadline.set(time.monotonic() + seconds)
+
+
+def reset(token):
+    _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def replaced(seconds: float = None):
+    """
+    Within the block, swap the current deadline for one seconds from now, or for none.
+    Tasks started in the block keep it, e.g. work shared by requests with different deadlines.
+    """
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left until the current deadline, or None if there is none"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+async def run_within(awaitable, stage: str, budget: float = None, reserve: float = 0.0):
+    """
+    Await awaitable within the time left, capped at budget and leaving up to reserve seconds
+    for later stages. Raises DeadlineExceeded, after cancelling it, if the time runs out.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+
+    # On a short deadline the reserve can't take more than half of what is left
+    timeout = left - min(reserve, left / 2)
+    if budget is not None:
+        timeout = min(timeout, budget)
+    if timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        metrics.deadline_exceeded.inc(stage=stage)
+        raise DeadlineExceeded(f"DEADLINE_EXCEEDED: no time left for {stage}")
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        task.cancel()
+        metrics.deadline_exceeded.inc(stage=stage)
+        raise DeadlineExceeded(f"DEADLINE_EXCEEDED: {stage} did not finish within {timeout:.1f}s")
+    return task.result()
@@ -0,0 +1,312 @@
+"""
+Admission control for Gemini calls.
+
+Every Gemini request goes through one GeminiScheduler. Each API key has a
+requests-per-minute and a tokens-per-minute bucket; a request is admitted on
+the least-loaded key that has room in both, otherwise it waits in a bounded
+priority queue (interactive /ask ahead of /predict ahead of batch work).
+When the queue is full, or a request has waited too long, it fails fast with
+an API_KEY_LIMIT_EXCEEDED error instead of piling up behind the quota. An
+upstream 429 puts the key into exponential backoff with jitter and the call
+is retried, on another key when there is one.
+
+With several keys, each key's calls go through its own async client. The
+SDK only builds those through private names, so that is confined to
+GenaiClientAdapter, which checks the names up front and fails loudly when an
+SDK upgrade removes them.
+"""
+import asyncio
+import bisect
+import itertools
+import random
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREDICT = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_PREDICT: "predict", PRIORITY_BATCH: "batch"}
+
+QUEUE_FULL_ERROR = "API_KEY_LIMIT_EXCEEDED: Gemini request queue is full. Please try again later."
+QUEUE_TIMEOUT_ERROR = "API_KEY_LIMIT_EXCEEDED: Timed out waiting for Gemini quota. Please try again later."
+
+
+def estimate_tokens(text: str, output_tokens: int = 0) -> int:
+    """Rough token count for quota accounting: about 4 characters per token, plus the expected output"""
+    return len(text) // 4 + output_tokens
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """True if a Gemini client error is the upstream telling us to slow down"""
+    if isinstance(e, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+        return True
+    return "429" in str(e)
+
+
+class TokenBucket:
+    """Refills continuously up to a per-minute limit"""
+
+    def __init__(self, per_minute: float, now: float = None):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)"""
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+class GenaiClientAdapter:
+    """
+    Per-key async clients for google.generativeai GenerativeModels. The SDK only configures
+    one global key, so this uses its private client._ClientManager and the model's
+    _async_client attribute; nothing else in the app touches private SDK names.
+    """
+
+    def __init__(self):
+        try:
+            from google.generativeai.client import _ClientManager
+        except ImportError:
+            _ClientManager = None
+        if not all(hasattr(_ClientManager, name) for name in ("configure", "get_default_client")):
+            raise RuntimeError(
+                "google.generativeai no longer provides client._ClientManager, which per-key Gemini "
+                "clients rely on; update GenaiClientAdapter for this SDK version or use a single key"
+            )
+        self._client_manager = _ClientManager
+
+    def client_for(self, api_key: str):
+        manager = self._client_manager()
+        manager.configure(api_key=api_key)
+        return manager.get_default_client("generative_async")
+
+    def attach(self, model, client):
+        if not hasattr(model, "_async_client"):
+            raise RuntimeError(
+                f"{type(model).__name__} has no _async_client attribute; update GenaiClientAdapter "
+                "for this SDK version or use a single key"
+            )
+        model._async_client = client
+        return model
+
+
+class ApiKey:
+    """One Gemini API key: its quota buckets, backoff state, usage counters and client"""
+
+    def __init__(self, index: int, api_key: str, rpm: float, tpm: float, client_adapter=None, now: float = None):
+        self.index = index
+        self.api_key = api_key
+        self.client_adapter = client_adapter
+        self.requests = TokenBucket(rpm, now)
+        self.tokens = TokenBucket(tpm, now)
+        self.in_flight = 0
+        self.backoff_until = 0.0
+        self.consecutive_throttles = 0
+        self.stats = {"requests": 0, "tokens": 0, "throttled": 0}
+        self._async_client = None
+
+    @property
+    def label(self) -> str:
+        return f"key{self.index}:...{self.api_key[-4:]}"
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.backoff_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def load(self, now: float) -> float:
+        """Lower is less loaded: calls in flight, then share of the minute's requests already used"""
+        self.requests.wait_time(0, now)
+        return self.in_flight + 1.0 - self.requests.level / self.requests.capacity
+
+    def bind(self, model):
+        """Point a GenerativeModel at this key instead of the globally configured one (no-op without an adapter)"""
+        if self.client_adapter is None:
+            return model
+        if self._async_client is None:
+            self._async_client = self.client_adapter.client_for(self.api_key)
+        return self.client_adapter.attach(model, self._async_client)
+
+
+class GeminiScheduler:
+    """
+    Token-bucket admission, least-loaded key selection and a bounded priority queue for Gemini calls.
+    client_adapter binds models to their key's client (e.g. a GenaiClientAdapter); without one,
+    models are used as given. clock is the time source for quotas and backoff.
+    """
+
+    def __init__(self, api_keys: list, rpm: float = 60, tpm: float = 1000000, max_queue: int = 100,
+                 queue_timeout: float = 10.0, max_retries: int = 2, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, client_adapter=None, clock=time.monotonic):
+        if not api_keys:
+            raise ValueError("GeminiScheduler needs at least one API key")
+        self.clock = clock
+        self.keys = [ApiKey(index, key, rpm, tpm, client_adapter, clock()) for index, key in enumerate(api_keys)]
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._waiters = []  # Sorted (priority, seq, tokens, pinned key index, future)
+        self._seq = itertools.count()
+        self._timer = None
+        self.stats = {
+            "admitted": 0, "queued": 0, "rejected_queue_full": 0,
+            "rejected_timeout": 0, "upstream_throttled": 0, "retries": 0
+        }
+
+    async def run(self, call, priority: int = PRIORITY_PREDICT, tokens: int = 0, pinned: int = None):
+        """
+        Await call(key) once the request is admitted, where key is the ApiKey to use.
+        Upstream 429s back the key off and retry up to max_retries times.
+        pinned restricts the call to one key (e.g. for content cached under that key).
+        """
+        for attempt in range(self.max_retries + 1):
+            key = await self.acquire(priority, tokens, pinned)
+            throttled = False
+            try:
+                return await call(key)
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+            finally:
+                self.release(key, throttled)
+
+    async def stream(self, call, priority: int = PRIORITY_PREDICT, tokens: int = 0, pinned: int = None):
+        """
+        Like run, for streaming calls: call(key) returns an async iterable whose items are
+        yielded. A 429 is only retried if it arrives before the first item.
+        """
+        for attempt in range(self.max_retries + 1):
+            key = await self.acquire(priority, tokens, pinned)
+            started = False
+            throttled = False
+            try:
+                response = await call(key)
+                async for item in response:
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                if not throttled or started or attempt == self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+            finally:
+                self.release(key, throttled)
+
+    async def acquire(self, priority: int, tokens: int = 0, pinned: int = None) -> ApiKey:
+        """Wait for quota and return the key the request was admitted on"""
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise ValueError(QUEUE_FULL_ERROR)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), tokens, pinned, future)
+        bisect.insort(self._waiters, entry)
+        self._dispatch()
+        if not future.done():
+            self.stats["queued"] += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Admitted just as the wait ended; hand the slot back
+                self.release(future.result())
+            else:
+                future.cancel()
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["rejected_timeout"] += 1
+                raise ValueError(QUEUE_TIMEOUT_ERROR)
+            raise
+
+    def release(self, key: ApiKey, throttled: bool = False):
+        """Return a key after its call; throttled=True starts (or extends) its backoff"""
+        key.in_flight -= 1
+        if throttled:
+            key.stats["throttled"] += 1
+            self.stats["upstream_throttled"] += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** key.consecutive_throttles)
+            # Equal jitter: at least half the delay, so retries from many requests spread out
+            key.backoff_until = self.clock() + delay / 2 + random.uniform(0, delay / 2)
+            key.consecutive_throttles += 1
+        else:
+            key.consecutive_throttles = 0
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit queued requests in priority order while some key has room for them"""
+        now = self.clock()
+        next_check = None
+        for entry in list(self._waiters):
+            priority, _, tokens, pinned, future = entry
+            if future.done():
+                self._waiters.remove(entry)
+                continue
+
+            candidates = self.keys if pinned is None else [self.keys[pinned]]
+            ready = [key for key in candidates if key.wait_time(tokens, now) == 0]
+            if ready:
+                key = min(ready, key=lambda k: k.load(now))
+                key.requests.take(1, now)
+                key.tokens.take(tokens, now)
+                key.in_flight += 1
+                key.stats["requests"] += 1
+                key.stats["tokens"] += tokens
+                self.stats["admitted"] += 1
+                self._waiters.remove(entry)
+                future.set_result(key)
+                continue
+
+            wait = min(key.wait_time(tokens, now) for key in candidates)
+            next_check = wait if next_check is None else min(next_check, wait)
+            if pinned is None:
+                # Nothing lower priority may overtake a request that is waiting for any key
+                break
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if next_check is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_check, self._dispatch)
+
+    def get_stats(self) -> dict:
+        now = self.clock()
+        queued_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, *_ in self._waiters:
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            queued_by_priority[name] = queued_by_priority.get(name, 0) + 1
+        return {
+            **self.stats,
+            "queue_depth": len(self._waiters),
+            "queue_capacity": self.max_queue,
+            "queued_by_priority": queued_by_priority,
+            "keys": [
+                {
+                    "key": key.label,
+                    **key.stats,
+                    "in_flight": key.in_flight,
+                    "requests_available": round(key.requests.level, 2),
+                    "tokens_available": round(key.tokens.level),
+                    "backoff_seconds": round(max(0.0, key.backoff_until - now), 2),
+                    "wait_seconds": round(key.wait_time(0, now), 2),
+                }
+                for key in self.keys
+            ],
+        }
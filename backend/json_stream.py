@@ -0,0 +1,112 @@
+"""
+Incremental parser for a JSON object arriving in pieces.
+
+Gemini streams its answer as text chunks, usually wrapped in a ```json fence.
+Rather than waiting for the full text and regex-matching the outermost
+braces, the parser walks the text as it arrives and hands back each
+top-level member of the first JSON object as soon as its value is complete.
+"""
+import json
+
+
+class IncrementalJsonObjectParser:
+    """Feed text chunks in; get (key, value) pairs out as top-level members complete"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.state = "seek"  # seek -> key -> colon -> value -> key ... -> done
+        self.key = None
+        self.value_start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.members = {}
+
+    @property
+    def done(self) -> bool:
+        return self.state == "done"
+
+    def feed(self, text: str) -> list:
+        """Add text and return the members completed by it, in order"""
+        self.buffer += text
+        completed = []
+        while self.pos < len(self.buffer) and self.state != "done":
+            char = self.buffer[self.pos]
+
+            if self.state == "seek":
+                if char == "{":
+                    self.state = "key"
+                self.pos += 1
+
+            elif self.state == "key":
+                if char == "}":
+                    self.state = "done"
+                    self.pos += 1
+                elif char == '"':
+                    end = self._string_end(self.pos)
+                    if end is None:
+                        break  # Key not fully received yet
+                    self.key = json.loads(self.buffer[self.pos:end + 1])
+                    self.state = "colon"
+                    self.pos = end + 1
+                else:
+                    self.pos += 1  # Whitespace or the comma between members
+
+            elif self.state == "colon":
+                if char == ":":
+                    self.state = "value"
+                    self.value_start = self.pos + 1
+                    self.depth = 0
+                    self.in_string = False
+                    self.escaped = False
+                self.pos += 1
+
+            elif self.state == "value":
+                if self.in_string:
+                    if self.escaped:
+                        self.escaped = False
+                    elif char == "\\":
+                        self.escaped = True
+                    elif char == '"':
+                        self.in_string = False
+                    self.pos += 1
+                elif char == '"':
+                    self.in_string = True
+                    self.pos += 1
+                elif char in "[{":
+                    self.depth += 1
+                    self.pos += 1
+                elif char in "]}" and self.depth > 0:
+                    self.depth -= 1
+                    self.pos += 1
+                elif char in ",}" and self.depth == 0:
+                    self._finish_value(completed)
+                    self.state = "done" if char == "}" else "key"
+                    self.pos += 1
+                else:
+                    self.pos += 1
+
+        return completed
+
+    def _finish_value(self, completed: list):
+        raw = self.buffer[self.value_start:self.pos].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return  # Skip a malformed member rather than failing the whole object
+        self.members[self.key] = value
+        completed.append((self.key, value))
+
+    def _string_end(self, start: int):
+        """Index of the closing quote for the string opening at start, or None if incomplete"""
+        escaped = False
+        for index in range(start + 1, len(self.buffer)):
+            char = self.buffer[index]
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                return index
+        return None
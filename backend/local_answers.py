@@ -0,0 +1,244 @@
+"""
+Local answers for chatbot questions that are plain lookups or arithmetic over
+the prediction data ("which crop has the highest ROI", "profit for wheat",
+"total water needed").
+
+answer_locally() recognises a small set of intents and returns a templated
+answer in en/hi/kn, or None when the question needs the LLM. It errs on the
+side of returning None: anything open-ended, comparative or ambiguous goes
+to Gemini.
+"""
+import functools
+import re
+
+# Metric phrases, checked in order; a matched phrase is removed so that e.g.
+# "cost of selling" is not also read as "cost"
+METRIC_PHRASES = [
+    ("revenue", ["cost of selling", "sell value", "selling value", "revenue", "sales",
+                 "बिक्री मूल्य", "बिक्री", "राजस्व", "ಮಾರಾಟ ಮೌಲ್ಯ", "ಮಾರಾಟ"]),
+    ("roi", ["return on investment", "roi", "आरओआई", "निवेश पर लाभ", "ಆರ್‌ಒಐ", "ಆರ್ಒಐ", "ಹೂಡಿಕೆಯ ಮೇಲಿನ ಲಾಭ"]),
+    ("profit", ["net income", "profit", "earnings", "earn", "मुनाफ़ा", "मुनाफा", "लाभ", "कमाई", "ಲಾಭ", "ಗಳಿಕೆ"]),
+    ("rate", ["market rate", "market price", "price", "rate", "बाजार भाव", "भाव", "कीमत", "ಮಾರುಕಟ್ಟೆ ದರ", "ಬೆಲೆ", "ದರ"]),
+    ("cost", ["cost of growing", "growing cost", "cultivation cost", "cost", "expense", "investment",
+              "लागत", "खर्च", "ವೆಚ್ಚ", "ಖರ್ಚು"]),
+    ("yield", ["yield", "production", "harvest", "उपज", "पैदावार", "ಇಳುವರಿ"]),
+    ("water", ["water", "irrigation", "पानी", "सिंचाई", "ನೀರು", "ನೀರಾವರಿ"]),
+    ("sowing", ["best sowing time", "best time to sow", "best time to plant", "sowing", "sow", "planting", "plant", "बुवाई", "बोने", "बोना", "ಬಿತ್ತನೆ", "ಬಿತ್ತ"]),
+]
+
+HIGH_PHRASES = ["highest", "most", "maximum", "max", "best", "top", "largest", "biggest",
+                "सबसे अधिक", "सबसे ज्यादा", "सबसे ज़्यादा", "सर्वाधिक", "अधिकतम", "ಅತಿ ಹೆಚ್ಚು", "ಗರಿಷ್ಠ"]
+LOW_PHRASES = ["lowest", "least", "minimum", "min", "cheapest", "smallest", "fewest",
+               "सबसे कम", "न्यूनतम", "ಅತಿ ಕಡಿಮೆ", "ಕನಿಷ್ಠ"]
+TOTAL_PHRASES = ["total", "overall", "altogether", "combined", "कुल", "ಒಟ್ಟು"]
+
+# Questions asking for reasoning, advice or comparison always go to the LLM
+OPEN_ENDED_PHRASES = ["why", "how to", "how can", "how do", "explain", "should", "compare", "versus", "vs",
+                      "better than", "instead", "if ", "क्यों", "कैसे", "तुलना", "ಏಕೆ", "ಹೇಗೆ", "ಹೋಲಿಕೆ"]
+
+# Per-unit questions ("profit per acre", "cost per kg") too: the data only holds whole-plot figures
+PER_UNIT_PHRASES = ["per", "/acre", "/kg", "/hectare", "/quintal", "प्रति", "ಪ್ರತಿ"]
+
+# Words that may be left over once the crop, metric and qualifier are taken out. Anything else
+# ("price of rice seeds", "is rice water intensive") asks something the figures don't answer
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "what", "what's", "whats", "which", "crop", "crops", "has", "have", "give",
+    "gives", "of", "for", "in", "to", "grow", "growing", "me", "my", "i", "tell", "show", "terms", "required",
+    "needed", "need", "percentage", "time", "month", "months", "value", "amount", "all", "among", "with",
+    "किस", "कौन", "कौनसी", "कौन-सी", "फसल", "फसलों", "का", "की", "के", "है", "क्या", "में", "से", "को", "लिए",
+    "ಯಾವ", "ಯಾವುದು", "ಬೆಳೆ", "ಬೆಳೆಗೆ", "ಬೆಳೆಗಳ", "ಏನು", "ಇದೆ", "ಹೊಂದಿದೆ",
+}
+
+# Metrics read from yield_data entries, or computed from them
+YIELD_METRICS = {
+    "roi": lambda y: float(y["roi"]),
+    "profit": lambda y: float(y["cost_of_selling"]) - float(y["cost_of_growing"]),
+    "revenue": lambda y: float(y["cost_of_selling"]),
+    "cost": lambda y: float(y["cost_of_growing"]),
+    "yield": lambda y: float(y["yield_amount"]),
+    "rate": lambda y: float(y["market_rate_per_unit"]),
+}
+
+# Metrics where a sum across crops is meaningful
+SUMMABLE_METRICS = {"profit", "revenue", "cost", "yield", "water"}
+
+METRIC_LABELS = {
+    "en": {"roi": "ROI", "profit": "profit", "revenue": "sell value", "cost": "growing cost",
+           "yield": "yield", "rate": "market rate", "water": "water requirement"},
+    "hi": {"roi": "आरओआई", "profit": "मुनाफा", "revenue": "बिक्री मूल्य", "cost": "उगाने की लागत",
+           "yield": "उपज", "rate": "बाजार भाव", "water": "पानी की आवश्यकता"},
+    "kn": {"roi": "ಆರ್‌ಒಐ", "profit": "ಲಾಭ", "revenue": "ಮಾರಾಟ ಮೌಲ್ಯ", "cost": "ಬೆಳೆಯುವ ವೆಚ್ಚ",
+           "yield": "ಇಳುವರಿ", "rate": "ಮಾರುಕಟ್ಟೆ ದರ", "water": "ನೀರಿನ ಅಗತ್ಯ"},
+}
+
+UNITS = {
+    "en": {"kg": "kg", "liters": "liters"},
+    "hi": {"kg": "किलो", "liters": "लीटर"},
+    "kn": {"kg": "ಕೆಜಿ", "liters": "ಲೀಟರ್"},
+}
+
+TEMPLATES = {
+    "en": {
+        "crop_value": "The {label} for {crop} is {value}.",
+        "highest": "{crop} has the highest {label}: {value}.",
+        "lowest": "{crop} has the lowest {label}: {value}.",
+        "total": "The total {label} for all recommended crops is {value}.",
+        "sowing": "The best sowing time is {value}.",
+        "crop_months": "{crop} can be sown in: {value}.",
+    },
+    "hi": {
+        "crop_value": "{crop} के लिए {label} {value} है।",
+        "highest": "{crop} का {label} सबसे अधिक है: {value}।",
+        "lowest": "{crop} का {label} सबसे कम है: {value}।",
+        "total": "सभी अनुशंसित फसलों के लिए कुल {label} {value} है।",
+    },
+    "kn": {
+        "crop_value": "{crop} ಗೆ {label} {value} ಆಗಿದೆ.",
+        "highest": "{crop} ಅತಿ ಹೆಚ್ಚು {label} ಹೊಂದಿದೆ: {value}.",
+        "lowest": "{crop} ಅತಿ ಕಡಿಮೆ {label} ಹೊಂದಿದೆ: {value}.",
+        "total": "ಶಿಫಾರಸು ಮಾಡಿದ ಎಲ್ಲಾ ಬೆಳೆಗಳಿಗೆ ಒಟ್ಟು {label} {value} ಆಗಿದೆ.",
+    },
+}
+
+stats = {"answered": 0, "fallback": 0}
+
+
+@functools.lru_cache(maxsize=1024)
+def _phrase_pattern(phrase: str) -> re.Pattern:
+    """
+    Match phrase as whole words. Lookarounds rather than \\b, which needs a word character on the
+    phrase side and so never matches names ending in punctuation like "Gram (Chickpea)"
+    """
+    start = r"(?<!\w)" if re.match(r"\w", phrase) else ""
+    end = r"(?!\w)" if re.search(r"\w$", phrase) else ""
+    return re.compile(start + re.escape(phrase) + end)
+
+
+def _contains(text: str, phrase: str) -> bool:
+    if phrase.isascii():
+        return _phrase_pattern(phrase).search(text) is not None
+    return phrase in text
+
+
+def _remove(text: str, phrase: str) -> str:
+    if phrase.isascii():
+        return _phrase_pattern(phrase).sub(" ", text)
+    return text.replace(phrase, " ")
+
+
+def _format_value(metric: str, value: float, language: str) -> str:
+    units = UNITS[language]
+    if metric == "roi":
+        return f"{value:.2f}%"
+    if metric in ("profit", "revenue", "cost"):
+        return f"₹{value:,.2f}"
+    if metric == "rate":
+        return f"₹{value:,.2f}/{units['kg']}"
+    if metric == "yield":
+        return f"{value:,.2f} {units['kg']}"
+    return f"{value:,.2f} {units['liters']}"
+
+
+def _metric_values(metric: str, prediction_data) -> dict:
+    """{crop name: value} for a metric across the recommended crops"""
+    if metric == "water":
+        return {crop["name"]: float(crop["water_required_liters"]) for crop in prediction_data.crops}
+    compute = YIELD_METRICS[metric]
+    return {entry["crop_name"]: compute(entry) for entry in prediction_data.yield_data}
+
+
+def _detect(question: str, crop_names: list) -> tuple:
+    text = question.lower()
+
+    # Crop names first, so a name like "Sweet Potato" isn't misread as a metric
+    crops = []
+    for name in sorted(crop_names, key=len, reverse=True):
+        if name and _contains(text, name.lower()):
+            crops.append(name)
+            text = _remove(text, name.lower())
+
+    metrics = []
+    for metric, phrases in METRIC_PHRASES:
+        for phrase in phrases:
+            if _contains(text, phrase):
+                if metric not in metrics:
+                    metrics.append(metric)
+                text = _remove(text, phrase)
+
+    qualifiers = []
+    for phrases in (HIGH_PHRASES, LOW_PHRASES, TOTAL_PHRASES):
+        qualifiers.append(any(_contains(text, phrase) for phrase in phrases))
+        for phrase in phrases:
+            text = _remove(text, phrase)
+    high, low, total = qualifiers
+
+    rest = [word for word in re.split(r"[\s?.,!;:।]+", text) if word]
+    return crops, metrics, high, low, total, rest
+
+
+def _answer(question: str, prediction_data, language: str):
+    lowered = question.lower()
+    if any(_contains(lowered, phrase.strip()) for phrase in OPEN_ENDED_PHRASES + PER_UNIT_PHRASES):
+        return None
+
+    crop_names = [crop["name"] for crop in prediction_data.crops]
+    crop_names += [entry["crop_name"] for entry in prediction_data.yield_data if entry["crop_name"] not in crop_names]
+    crops, metrics, high, low, total, rest = _detect(question, crop_names)
+
+    # Exactly one metric, at most one crop and nothing else of substance; anything broader is left to the LLM
+    if len(metrics) != 1 or len(crops) > 1 or any(word not in STOP_WORDS for word in rest):
+        return None
+    metric = metrics[0]
+    templates = TEMPLATES[language]
+
+    if metric == "sowing":
+        # The sowing text comes from the dataset in English, so only answer English questions locally
+        # "best"/"most" without the phrase "best sowing time" is about crops, not dates ("which crop is best to plant")
+        if language != "en" or high or low or total:
+            return None
+        if crops:
+            for entry in prediction_data.crop_timeline:
+                if str(entry.get("crop", "")).lower() == crops[0].lower() and entry.get("suitable_months"):
+                    return templates["crop_months"].format(crop=crops[0], value=", ".join(entry["suitable_months"]))
+            return None
+        return templates["sowing"].format(value=prediction_data.best_sowing_time)
+
+    values = _metric_values(metric, prediction_data)
+    if not values:
+        return None
+    label = METRIC_LABELS[language][metric]
+
+    if crops:
+        if high or low or total or crops[0] not in values:
+            return None
+        return templates["crop_value"].format(
+            crop=crops[0], label=label, value=_format_value(metric, values[crops[0]], language)
+        )
+
+    if total and not (high or low):
+        if metric not in SUMMABLE_METRICS:
+            return None
+        return templates["total"].format(label=label, value=_format_value(metric, sum(values.values()), language))
+
+    if high != low and not total:
+        pick = max if high else min
+        crop = pick(values, key=values.get)
+        return templates["highest" if high else "lowest"].format(
+            crop=crop, label=label, value=_format_value(metric, values[crop], language)
+        )
+
+    return None
+
+
+def answer_locally(question: str, prediction_data, language: str = "en"):
+    """Answer a computable question from the prediction data, or return None to use the LLM"""
+    if language not in TEMPLATES:
+        language = "en"
+    try:
+        answer = _answer(question, prediction_data, language)
+    except (KeyError, TypeError, ValueError):
+        # Incomplete or non-numeric prediction data; the LLM can still explain what's there
+        answer = None
+
+    stats["answered" if answer else "fallback"] += 1
+    return answer
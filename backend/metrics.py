@@ -0,0 +1,295 @@
+"""
+Request instrumentation: counters, gauges and histograms rendered in the
+Prometheus text format, per-request stage timings for the Server-Timing
+header, and an optional sampling profiler that reports where the event loop
+spent its time during slow requests.
+
+Code on the hot path wraps each step in `with stage("climate"):`. The timing
+is added to the current request's Server-Timing entries and to the
+greenbyte_stage_duration_seconds histogram, labelled with the endpoint.
+"""
+import contextvars
+import logging
+import math
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self, kind: str) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {kind}"]
+
+
+class Counter(Metric):
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        lines = self._header("counter")
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Metric):
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list:
+        lines = self._header("gauge")
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][position] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def render(self) -> list:
+        lines = self._header("histogram")
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry["counts"]):
+                    cumulative += count
+                    bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(entry['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {entry['count']}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collector callbacks that turn existing stats dicts into gauges at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, documentation: str, kind: str = "gauge"):
+        """Decorator for a function returning [(labels dict, value)], evaluated on every scrape"""
+        def register(function):
+            self._collectors.append((name, documentation, kind, function))
+            return function
+        return register
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, kind, function in self._collectors:
+            try:
+                samples = function()
+            except Exception as e:
+                print(f"Warning: metrics collector {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "greenbyte_request_duration_seconds", "HTTP request latency", ("endpoint", "method", "status")
+)
+requests_in_flight = registry.gauge("greenbyte_requests_in_flight", "HTTP requests being handled", ("endpoint",))
+stage_duration = registry.histogram(
+    "greenbyte_stage_duration_seconds", "Time spent in each stage of a request", ("endpoint", "stage")
+)
+upstream_errors = registry.counter(
+    "greenbyte_upstream_errors_total", "Failed calls to NASA POWER and Gemini", ("upstream", "kind")
+)
+fallbacks = registry.counter(
+    "greenbyte_fallbacks_total", "Requests served from a fallback instead of the primary source", ("kind",)
+)
+deadline_exceeded = registry.counter(
+    "greenbyte_deadline_exceeded_total", "Stages cut short by the request deadline", ("stage",)
+)
+client_disconnects = registry.counter(
+    "greenbyte_client_disconnects_total", "Requests cancelled because the client went away", ("endpoint",)
+)
+slow_requests = registry.counter(
+    "greenbyte_slow_requests_total", "Requests over the slow-request profiling threshold", ("endpoint", "method")
+)
+
+# Per-request state: endpoint label and (stage, seconds) entries for Server-Timing
+_current = contextvars.ContextVar("greenbyte_request_timing", default=None)
+
+
+def begin_request(endpoint: str):
+    """Start collecting stage timings for the request running in this context"""
+    return _current.set({"endpoint": endpoint, "stages": []})
+
+
+def end_request(token) -> list:
+    timing = _current.get()
+    _current.reset(token)
+    return timing["stages"] if timing else []
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one stage of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timing = _current.get()
+        endpoint = timing["endpoint"] if timing else "background"
+        stage_duration.observe(elapsed, endpoint=endpoint, stage=name)
+        if timing is not None:
+            timing["stages"].append((name, elapsed))
+
+
+def server_timing_header(stages: list, total: float) -> str:
+    """Server-Timing value; repeated stages (e.g. retries) are summed"""
+    totals = {}
+    for name, elapsed in stages:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    parts = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in totals.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class SlowRequestProfiler:
+    """
+    Samples the event loop thread's stack every interval seconds while requests are in
+    flight. When a request takes longer than threshold seconds, the samples taken during
+    it are summarised into the hottest call paths, counted in greenbyte_slow_requests_total and
+    passed to on_report (logged as a warning by default).
+    The loop thread is shared, so the report covers everything that ran during the request.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.005, max_samples: int = 20000,
+                 top: int = 10, depth: int = 4, on_report=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.depth = depth
+        self.on_report = on_report or logger.warning
+        self._samples = deque(maxlen=max_samples)
+        self._active = 0
+        self._thread_id = None
+        self._sampler = None
+        self._lock = threading.Lock()
+        self.reports = deque(maxlen=20)
+
+    def request_started(self):
+        with self._lock:
+            self._thread_id = threading.get_ident()
+            self._active += 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, daemon=True)
+                self._sampler.start()
+
+    def request_finished(self, endpoint: str, method: str, started: float, duration: float):
+        with self._lock:
+            self._active -= 1
+        if duration < self.threshold:
+            return
+        slow_requests.inc(endpoint=endpoint, method=method)
+        window = [stack for at, stack in list(self._samples) if at >= started]
+        # Innermost few frames of each sample, so the hottest call paths stand out
+        tally = _Tally(" <- ".join(stack[:self.depth]) for stack in window)
+        lines = [f"Slow request: {method} {endpoint} took {duration * 1000:.0f} ms ({len(window)} samples)"]
+        for path, count in tally.most_common(self.top):
+            lines.append(f"  {count / max(len(window), 1):6.1%}  {path}")
+        report = "\n".join(lines)
+        self.reports.append(report)
+        self.on_report(report)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), tuple(stack)))
@@ -0,0 +1,227 @@
+"""
+Resilient client for the NASA POWER daily point API.
+
+One keep-alive connection pool is shared by all requests. Transient failures
+(timeouts, connection errors, 5xx and 429) are retried with exponential
+backoff and jitter inside an overall deadline, and a request that is slower
+than hedge_delay gets a second copy sent in parallel, with whichever answers
+first winning. A circuit breaker opens after repeated failed fetches; while
+it is open, fetches fail immediately with CircuitOpenError so callers can
+serve stale or default climate data without paying the timeout.
+"""
+import asyncio
+import random
+import time
+
+import httpx
+
+BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling NASA POWER while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold consecutive failures -> half_open after reset_timeout"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.stats = {"opened": 0, "short_circuited": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; in half_open only one trial call is let through"""
+        if self.state == "open":
+            if self.clock() - self.opened_at < self.reset_timeout:
+                self.stats["short_circuited"] += 1
+                return False
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                self.stats["short_circuited"] += 1
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def abandon(self):
+        """Forget a call that says nothing about upstream health (cancelled, or rejected as a bad request)"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = self.clock()
+
+    def get_stats(self) -> dict:
+        retry_in = 0.0
+        if self.state == "open":
+            retry_in = max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(retry_in, 2),
+        }
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class NasaPowerClient:
+    """Pooled NASA POWER client with retries, hedging and a circuit breaker"""
+
+    def __init__(self, timeout: float = 5.0, total_timeout: float = 8.0, max_retries: int = 2,
+                 backoff_base: float = 0.25, hedge_delay: float = 1.5, max_connections: int = 20,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, transport=None,
+                 base_url: str = BASE_URL):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.hedge_delay = hedge_delay
+        self.max_connections = max_connections
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._transport = transport
+        self._client = None
+        self._client_loop = None
+        self.stats = {
+            "requests": 0, "successes": 0, "failures": 0, "retries": 0,
+            "hedges_sent": 0, "hedge_wins": 0
+        }
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            stale, stale_loop = self._client, self._client_loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                transport=self._transport,
+            )
+            self._client_loop = loop
+            if stale is not None:
+                await self._close_stale(stale, stale_loop)
+        return self._client
+
+    @staticmethod
+    async def _close_stale(client: httpx.AsyncClient, loop):
+        """Close a client opened on an earlier event loop, on that loop if it is still running"""
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        try:
+            await client.aclose()
+        except RuntimeError:
+            # Its loop is closed, so the sockets can't be shut down cleanly; they go with the client
+            pass
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_daily(self, cell: tuple, start: str, end: str, parameters) -> dict:
+        """Return the POWER "parameter" block ({param: {YYYYMMDD: value}}) for a cell and date range"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("NASA POWER circuit breaker is open")
+
+        params = {
+            "request": "execute",
+            "parameters": ",".join(parameters),
+            "community": "AG",
+            "longitude": cell[1],
+            "latitude": cell[0],
+            "start": start,
+            "end": end,
+            "format": "JSON"
+        }
+        self.stats["requests"] += 1
+        try:
+            data = await asyncio.wait_for(self._get_with_retries(params), self.total_timeout)
+            result = data["properties"]["parameter"]
+        except Exception as e:
+            self.stats["failures"] += 1
+            # Only upstream trouble trips the breaker. A bad request from our side neither trips it
+            # nor counts as the half-open trial succeeding
+            if _is_transient(e) or isinstance(e, (KeyError, TypeError, ValueError)):
+                self.breaker.record_failure()
+            else:
+                self.breaker.abandon()
+            raise
+        except asyncio.CancelledError:
+            # The caller went away; that says nothing about NASA's health
+            self.breaker.abandon()
+            raise
+
+        self.stats["successes"] += 1
+        self.breaker.record_success()
+        return result
+
+    async def _get_with_retries(self, params: dict) -> dict:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._hedged_get(params)
+            except Exception as e:
+                if not _is_transient(e) or attempt == self.max_retries:
+                    raise
+            self.stats["retries"] += 1
+            delay = self.backoff_base * 2 ** attempt
+            await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+    async def _get(self, params: dict) -> dict:
+        client = await self._get_client()
+        response = await client.get(self.base_url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _hedged_get(self, params: dict) -> dict:
+        """Send the request, and a second copy if the first hasn't answered within hedge_delay"""
+        primary = asyncio.ensure_future(self._get(params))
+        if self.hedge_delay <= 0:
+            return await primary
+
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if not done:
+                self.stats["hedges_sent"] += 1
+                tasks.append(asyncio.ensure_future(self._get(params)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "circuit_breaker": self.breaker.get_stats()}
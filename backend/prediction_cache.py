@@ -0,0 +1,114 @@
+"""
+Cache for Gemini crop predictions.
+
+Predictions are stored per square foot so one Gemini answer can serve any
+land area for the same soil, climate cell and prompt version. Water, yield,
+revenue and growing cost scale linearly with area; ROI is recomputed from
+the rescaled figures before they are rounded.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+# Fields that scale linearly with land area
+CROP_AREA_FIELDS = ("water_required_liters",)
+YIELD_AREA_FIELDS = ("yield_amount", "cost_of_selling", "cost_of_growing")
+
+
+def compute_roi(cost_of_selling: float, cost_of_growing: float) -> float:
+    if not cost_of_growing:
+        return 0.0
+    return round(((cost_of_selling - cost_of_growing) / cost_of_growing) * 100, 2)
+
+
+def _rescale(prediction: dict, factor: float, ndigits=None):
+    """Return a copy of prediction with the area-dependent fields multiplied by factor"""
+    scaled = copy.deepcopy(prediction)
+    for crop in scaled["crops"]:
+        for field in CROP_AREA_FIELDS:
+            value = float(crop[field]) * factor
+            crop[field] = round(value, ndigits) if ndigits is not None else value
+    for entry in scaled["yield_data"]:
+        values = {field: float(entry[field]) * factor for field in YIELD_AREA_FIELDS}
+        # From the unrounded figures, so tiny areas whose costs round to 0 keep their ROI
+        entry["roi"] = compute_roi(values["cost_of_selling"], values["cost_of_growing"])
+        for field, value in values.items():
+            entry[field] = round(value, ndigits) if ndigits is not None else value
+    return scaled
+
+
+def normalize_prediction(prediction: dict, land_area: int):
+    """Convert a prediction for land_area sq ft to per-sq-ft figures, or None if it can't be scaled"""
+    if land_area <= 0 or not prediction.get("crops") or not prediction.get("yield_data"):
+        return None
+    try:
+        return _rescale(prediction, 1 / land_area)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def scale_prediction(per_unit: dict, land_area: int) -> dict:
+    """Expand a per-sq-ft prediction to land_area sq ft"""
+    return _rescale(per_unit, land_area, ndigits=2)
+
+
+class PredictionCache:
+    """LRU cache of per-unit-area predictions with a fixed time-to-live"""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "bypassed": 0, "uncacheable": 0}
+
+    @staticmethod
+    def make_key(soil_type: str, cell: tuple, climate_data: dict, prompt_version: str) -> tuple:
+        climate = tuple(sorted(climate_data.items()))
+        return (soil_type.strip().lower(), cell, climate, prompt_version)
+
+    def get(self, key: tuple, land_area: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                per_unit, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return scale_prediction(per_unit, land_area)
+                del self._entries[key]
+                self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def contains(self, key: tuple) -> bool:
+        """Whether an unexpired entry exists, without counting a lookup"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.time()
+
+    def set(self, key: tuple, prediction: dict, land_area: int):
+        per_unit = normalize_prediction(prediction, land_area)
+        with self._lock:
+            if per_unit is None:
+                self.stats["uncacheable"] += 1
+                return
+            self._entries[key] = (per_unit, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+            }
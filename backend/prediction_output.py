@@ -0,0 +1,308 @@
+"""
+Typed parsing of Gemini's crop prediction output.
+
+The prediction prompt is sent with a JSON response schema derived from the
+models below, so Gemini returns a bare JSON object of the right shape. The
+reply is still checked here entry by entry:
+- Types and ranges are enforced by the models in strict mode.
+- Month names are normalized.
+- cost_of_selling and roi are recomputed from the other yield figures, so
+  they are always consistent.
+
+Invalid entries are reported as problems instead of discarding the whole
+answer. The caller can send create_repair_prompt for just those entries
+and merge the reply back with apply_repair. For a packed answer covering
+several plots, create_batch_repair_prompt asks for every plot's repairs in
+one call and split_batch_repair hands each plot its part.
+"""
+import json
+import math
+import re
+from typing import Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December"]
+LIST_SECTIONS = ("crops", "yield_data", "crop_timeline")
+
+# A Gemini cost_of_selling/roi further than this from the recomputed value counts as corrected
+CONSISTENCY_TOLERANCE = 0.01
+
+# Outcomes of get_gemini_prediction; entry and number counts cover first answers, not repairs
+stats = {"valid": 0, "repaired": 0, "partial": 0, "undecodable": 0, "entries_invalid": 0, "numbers_corrected": 0}
+
+
+class CropData(BaseModel):
+    name: str = Field(min_length=1)
+    water_required_liters: float = Field(ge=0, allow_inf_nan=False)
+
+
+class YieldData(BaseModel):
+    crop_name: str = Field(min_length=1)
+    yield_amount: float = Field(gt=0, allow_inf_nan=False)
+    market_rate_per_unit: float = Field(gt=0, allow_inf_nan=False)
+    cost_of_selling: float = Field(allow_inf_nan=False)
+    cost_of_growing: float = Field(gt=0, allow_inf_nan=False)
+    roi: float = Field(allow_inf_nan=False)
+
+
+class CropTimelineData(BaseModel):
+    crop: str = Field(min_length=1)
+    season: str
+    suitable_months: list[str] = Field(min_length=1)
+
+
+class GeminiPrediction(BaseModel):
+    """The object the prediction prompt asks for"""
+    crops: list[CropData] = Field(min_length=1)
+    yield_data: list[YieldData]
+    crop_timeline: list[CropTimelineData]
+    best_sowing_time: str = Field(min_length=1)
+
+
+class GeminiBatchPrediction(BaseModel):
+    plots: list[GeminiPrediction]
+
+
+class IndexedCropData(CropData):
+    index: int
+
+
+class IndexedYieldData(YieldData):
+    index: int
+
+
+class IndexedCropTimelineData(CropTimelineData):
+    index: int
+
+
+class GeminiPredictionRepair(BaseModel):
+    """Corrected entries only, each carrying the index of the entry it replaces"""
+    crops: list[IndexedCropData]
+    yield_data: list[IndexedYieldData]
+    crop_timeline: list[IndexedCropTimelineData]
+    best_sowing_time: Optional[str]
+
+
+class PlotRepair(GeminiPredictionRepair):
+    plot: int
+
+
+class GeminiBatchPredictionRepair(BaseModel):
+    """Repairs for several plots of a packed answer, each carrying its plot number"""
+    plots: list[PlotRepair]
+
+
+ENTRY_MODELS = {"crops": CropData, "yield_data": YieldData, "crop_timeline": CropTimelineData}
+
+# Keys of a JSON schema that Gemini's response_schema understands
+_SCHEMA_KEYS = ("type", "format", "nullable", "enum", "properties", "items", "required")
+
+
+def response_schema(model) -> dict:
+    """
+    Gemini response_schema for a pydantic model: $refs inlined, Optional fields marked
+    nullable, every field required and validation-only keywords (minimum, minLength...) dropped.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def convert(node: dict) -> dict:
+        if "$ref" in node:
+            return convert(definitions[node["$ref"].rsplit("/", 1)[-1]])
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            return {**convert(options[0]), "nullable": True}
+        result = {key: value for key, value in node.items() if key in _SCHEMA_KEYS}
+        if "properties" in result:
+            result["properties"] = {name: convert(value) for name, value in result["properties"].items()}
+            result["required"] = list(result["properties"])
+        if "items" in result:
+            result["items"] = convert(result["items"])
+        return result
+
+    return convert(schema)
+
+
+def extract_json(text: str) -> dict:
+    """The JSON object in a Gemini reply, with or without a ```json fence; ValueError if there is none"""
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
+    if fenced:
+        text = fenced.group(1).strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # Prose around the object; take the outermost braces
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            raise ValueError("No JSON object in the response")
+        try:
+            data = json.loads(text[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in the response: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("The response JSON is not an object")
+    return data
+
+
+def _problem(section: str, index, error: str) -> dict:
+    return {"section": section, "index": index, "error": error}
+
+
+def _normalize_months(entry: dict) -> dict:
+    months = []
+    for month in entry["suitable_months"]:
+        name = month.strip().lower()
+        # Full names or abbreviations like "Jun" and "Sept"
+        match = next((full for full in MONTHS if len(name) >= 3 and full.lower().startswith(name)), None)
+        if match is None:
+            raise ValueError(f"suitable_months: {month!r} is not a month")
+        if match not in months:
+            months.append(match)
+    return {**entry, "suitable_months": months}
+
+
+def _recompute_yield(entry: dict, record: bool) -> dict:
+    """Replace cost_of_selling and roi with the values the other figures imply"""
+    cost_of_selling = round(entry["yield_amount"] * entry["market_rate_per_unit"], 2)
+    roi = round((cost_of_selling - entry["cost_of_growing"]) / entry["cost_of_growing"] * 100, 2)
+    for field, value in (("cost_of_selling", cost_of_selling), ("roi", roi)):
+        if record and not math.isclose(entry[field], value, rel_tol=CONSISTENCY_TOLERANCE, abs_tol=0.5):
+            stats["numbers_corrected"] += 1
+    return {**entry, "cost_of_selling": cost_of_selling, "roi": roi}
+
+
+def check_prediction(data: dict, record: bool = True) -> tuple:
+    """
+    Validate a decoded prediction. Returns (prediction, problems): the prediction holds only
+    the valid entries (cost_of_selling and roi recomputed), and each problem names an invalid
+    entry (index set) or a missing or unusable section (index None). With record=False, as
+    when re-checking a repaired answer, nothing is added to stats.
+    """
+    prediction = {section: [] for section in LIST_SECTIONS}
+    problems = []
+
+    for section in LIST_SECTIONS:
+        entries = data.get(section)
+        if not isinstance(entries, list) or (section == "crops" and not entries):
+            problems.append(_problem(section, None, "missing or empty"))
+            continue
+        for index, entry in enumerate(entries):
+            try:
+                valid = ENTRY_MODELS[section].model_validate(entry, strict=True).model_dump()
+                if section == "yield_data":
+                    valid = _recompute_yield(valid, record)
+                elif section == "crop_timeline":
+                    valid = _normalize_months(valid)
+            except ValidationError as e:
+                details = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'entry'}: {error['msg']}"
+                                    for error in e.errors())
+                problems.append(_problem(section, index, details))
+                continue
+            except ValueError as e:
+                problems.append(_problem(section, index, str(e)))
+                continue
+            prediction[section].append(valid)
+
+    best_sowing_time = data.get("best_sowing_time")
+    if isinstance(best_sowing_time, str) and best_sowing_time.strip():
+        prediction["best_sowing_time"] = best_sowing_time.strip()
+    else:
+        prediction["best_sowing_time"] = "Not specified"
+        problems.append(_problem("best_sowing_time", None, "missing or empty"))
+
+    if record:
+        stats["entries_invalid"] += sum(1 for problem in problems if problem["index"] is not None)
+    return prediction, problems
+
+
+REPAIR_INSTRUCTIONS = (
+    'Put each corrected entry in its list ("crops", "yield_data" or "crop_timeline") with the "index" shown '
+    'above, and leave the other lists empty. Set "best_sowing_time" only if it is listed above, otherwise null. '
+    "Use exact positive numbers, not ranges, for yield_amount, market_rate_per_unit and cost_of_growing, "
+    "and full English month names in suitable_months."
+)
+
+
+def _problem_lines(data: dict, problems: list) -> str:
+    lines = []
+    for problem in problems:
+        section, index = problem["section"], problem["index"]
+        if index is None:
+            if section in LIST_SECTIONS:
+                lines.append(f"- {section}: {problem['error']}. Provide the complete list, numbering entries from 0.")
+            else:
+                lines.append(f"- {section}: {problem['error']}.")
+        else:
+            current = json.dumps(data[section][index], ensure_ascii=False)
+            lines.append(f"- {section}[{index}]: {problem['error']}\n  Current value: {current}")
+    return "\n".join(lines)
+
+
+def create_repair_prompt(prompt: str, data: dict, problems: list) -> str:
+    """Ask Gemini to correct only the entries listed in problems"""
+    return f"""
+You answered the crop recommendation request below, but some parts of your JSON were invalid.
+
+**Invalid parts:**
+{_problem_lines(data, problems)}
+
+Return corrected versions of only these parts. {REPAIR_INSTRUCTIONS}
+
+**Original request:**
+{prompt.strip()}
+"""
+
+
+def create_batch_repair_prompt(prompts: list, plots: dict, problems: dict) -> str:
+    """
+    Ask Gemini to correct the invalid entries of several plots of a packed answer in one reply.
+    plots and problems are keyed by the plot's position in prompts.
+    """
+    sections = "\n".join(
+        f"=== PLOT {position + 1} ===\n**Invalid parts:**\n{_problem_lines(plots[position], problems[position])}\n\n"
+        f"**Original request:**\n{prompts[position].strip()}\n"
+        for position in sorted(problems)
+    )
+
+    return f"""
+You answered the crop recommendation requests below in one reply, but some parts of your JSON were invalid.
+
+{sections}
+Return a single JSON object of the form {{"plots": [...]}} with one entry for each plot above, with "plot" set to its plot number. In each entry, return corrected versions of only that plot's invalid parts. {REPAIR_INSTRUCTIONS}
+"""
+
+
+def split_batch_repair(repair: dict) -> dict:
+    """The repair for each plot of a batch repair reply, keyed by position (plot number - 1)"""
+    plots = repair.get("plots")
+    if not isinstance(plots, list):
+        return {}
+    return {entry["plot"] - 1: entry for entry in plots if isinstance(entry, dict) and isinstance(entry.get("plot"), int)}
+
+
+def apply_repair(data: dict, repair: dict, problems: list) -> dict:
+    """The original decoded prediction with the repaired parts put in place"""
+    merged = {section: list(data.get(section)) if isinstance(data.get(section), list) else []
+              for section in LIST_SECTIONS}
+    merged["best_sowing_time"] = data.get("best_sowing_time")
+
+    whole = {problem["section"] for problem in problems if problem["index"] is None}
+    invalid = {(problem["section"], problem["index"]) for problem in problems if problem["index"] is not None}
+    for section in LIST_SECTIONS:
+        entries = [entry for entry in repair.get(section) or []
+                   if isinstance(entry, dict) and isinstance(entry.get("index"), int)]
+        fixes = {entry["index"]: {key: value for key, value in entry.items() if key != "index"} for entry in entries}
+        if section in whole:
+            if fixes:
+                merged[section] = [fixes[index] for index in sorted(fixes)]
+        else:
+            for index, entry in fixes.items():
+                if (section, index) in invalid:
+                    merged[section][index] = entry
+
+    if "best_sowing_time" in whole and isinstance(repair.get("best_sowing_time"), str):
+        merged["best_sowing_time"] = repair["best_sowing_time"]
+    return merged
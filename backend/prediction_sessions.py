@@ -0,0 +1,195 @@
+"""
+Server-side store for /predict results.
+
+/predict hands back a prediction_id so /ask can refer to a prediction
+instead of re-uploading it with every question. Ids are content hashes, so
+identical predictions share one entry. Entries live in a bounded LRU; when
+a spill path is configured, evicted entries are written to SQLite and
+loaded back on demand; async callers use the *_async methods so that
+SQLite work runs in a worker thread. Derived per-prediction data (such as
+the formatted chatbot context) is cached alongside each entry.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from single_flight import canonical_key
+
+
+class PredictionSessionStore:
+    """
+    Bounded in-memory prediction store with optional SQLite spill. The *_async methods
+    serve the memory tier on the event loop and run spill reads and writes in a worker thread.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400, spill_path: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        # Separate locks so the memory tier never waits behind spill I/O in another thread
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.stats = {"created": 0, "hits": 0, "spill_hits": 0, "misses": 0, "spilled": 0}
+
+        self._db = None
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS prediction_sessions ("
+                " id TEXT PRIMARY KEY, prediction TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def save(self, prediction: dict) -> str:
+        """Store a prediction payload and return its id"""
+        prediction_id, evicted = self._save_memory(prediction)
+        self._spill(evicted)
+        return prediction_id
+
+    async def save_async(self, prediction: dict) -> str:
+        prediction_id, evicted = self._save_memory(prediction)
+        if evicted and self._db is not None:
+            await asyncio.to_thread(self._spill, evicted)
+        return prediction_id
+
+    def get(self, prediction_id: str):
+        """Return the stored prediction payload, or None if unknown or expired"""
+        entry = self._entry(prediction_id)
+        return entry["prediction"] if entry is not None else None
+
+    async def get_async(self, prediction_id: str):
+        entry = await self._entry_async(prediction_id)
+        return entry["prediction"] if entry is not None else None
+
+    def get_derived(self, prediction_id: str, name: str, build=None):
+        """
+        Return a value derived from the prediction. If it isn't cached yet and build is
+        given, build(prediction) is called once and its result kept with the entry.
+        """
+        return self._derive(self._entry(prediction_id), name, build)
+
+    async def get_derived_async(self, prediction_id: str, name: str, build=None):
+        return self._derive(await self._entry_async(prediction_id), name, build)
+
+    def set_derived(self, prediction_id: str, name: str, value):
+        # Derived values aren't spilled, so only entries in memory can take one
+        with self._lock:
+            entry = self._entries.get(prediction_id)
+            if entry is not None:
+                entry["derived"][name] = value
+
+    @staticmethod
+    def _derive(entry: dict, name: str, build):
+        if entry is None:
+            return None
+        derived = entry["derived"]
+        if name not in derived and build is not None:
+            derived[name] = build(entry["prediction"])
+        return derived.get(name)
+
+    def _save_memory(self, prediction: dict) -> tuple:
+        prediction_id = canonical_key("prediction", prediction)[:32]
+        with self._lock:
+            entry = self._entries.get(prediction_id)
+            if entry is None:
+                entry = {"prediction": prediction, "derived": {}}
+                self.stats["created"] += 1
+            entry["expires_at"] = time.time() + self.ttl_seconds
+            return prediction_id, self._insert(prediction_id, entry)
+
+    def _entry(self, prediction_id: str):
+        entry = self._get_memory(prediction_id)
+        if entry is None and self._db is not None:
+            entry = self._take_spilled(prediction_id)
+            if entry is not None:
+                self._spill(self._reinsert(prediction_id, entry))
+        return entry if entry is not None else self._count_miss()
+
+    async def _entry_async(self, prediction_id: str):
+        entry = self._get_memory(prediction_id)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._take_spilled, prediction_id)
+            if entry is not None:
+                evicted = self._reinsert(prediction_id, entry)
+                if evicted:
+                    await asyncio.to_thread(self._spill, evicted)
+        return entry if entry is not None else self._count_miss()
+
+    def _get_memory(self, prediction_id: str):
+        with self._lock:
+            entry = self._entries.get(prediction_id)
+            if entry is None:
+                return None
+            if entry["expires_at"] > time.time():
+                self._entries.move_to_end(prediction_id)
+                self.stats["hits"] += 1
+                return entry
+            del self._entries[prediction_id]
+            return None
+
+    def _take_spilled(self, prediction_id: str):
+        """Remove a spilled entry from disk and return it, or None if absent or expired"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT prediction, expires_at FROM prediction_sessions WHERE id = ?", (prediction_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("DELETE FROM prediction_sessions WHERE id = ?", (prediction_id,))
+            self._db.commit()
+        if row[1] <= time.time():
+            return None
+        return {"prediction": json.loads(row[0]), "derived": {}, "expires_at": row[1]}
+
+    def _reinsert(self, prediction_id: str, entry: dict) -> list:
+        with self._lock:
+            self.stats["spill_hits"] += 1
+            # A save may have brought it back meanwhile; keep that entry and its derived values
+            if prediction_id in self._entries:
+                return []
+            return self._insert(prediction_id, entry)
+
+    def _count_miss(self):
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _insert(self, prediction_id: str, entry: dict) -> list:
+        """Put an entry in the LRU (caller holds _lock); return the evicted entries worth spilling"""
+        self._entries[prediction_id] = entry
+        self._entries.move_to_end(prediction_id)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted_id, evicted_entry = self._entries.popitem(last=False)
+            if self._db is not None and evicted_entry["expires_at"] > time.time():
+                evicted.append((evicted_id, evicted_entry))
+        return evicted
+
+    def _spill(self, evicted: list):
+        if not evicted or self._db is None:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO prediction_sessions (id, prediction, expires_at) VALUES (?, ?, ?)",
+                [(evicted_id, json.dumps(entry["prediction"], ensure_ascii=False), entry["expires_at"])
+                 for evicted_id, entry in evicted],
+            )
+            self._db.commit()
+        with self._lock:
+            self.stats["spilled"] += len(evicted)
+
+    def get_stats(self) -> dict:
+        spilled_entries = 0
+        if self._db is not None:
+            with self._db_lock:
+                spilled_entries = self._db.execute("SELECT COUNT(*) FROM prediction_sessions").fetchone()[0]
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "spilled_entries": spilled_entries,
+            }
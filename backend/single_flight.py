@@ -0,0 +1,85 @@
+"""
+Request coalescing for identical in-flight work.
+
+The first caller for a key starts the work; concurrent callers with the
+same key await the same task and receive its result or its exception.
+The work does not inherit the first caller's request deadline, which would
+cut it short for callers with more time; it runs under the deadline given
+to run(), and each caller's own deadline only bounds how long that caller
+waits. If every caller waiting on a task leaves (cancelled because its
+client disconnected, or out of time), the task is cancelled too.
+"""
+import asyncio
+import hashlib
+import json
+
+import deadlines
+import metrics
+from deadlines import DeadlineExceeded
+
+
+def canonical_key(*parts) -> str:
+    """Stable hash of JSON-serialisable parts, independent of dict key order"""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Share one running task between concurrent callers with the same key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks = {}
+        self._callers = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "errors": 0, "abandoned": 0, "deadline_exceeded": 0}
+
+    async def run(self, key, work, deadline: float = None):
+        """
+        Run work() for key, or join the call already in flight for it. A new call runs with a
+        deadline seconds from its start (None: no deadline). Raises DeadlineExceeded if the
+        caller's own deadline passes first; the work carries on for the other callers.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            with deadlines.replaced(deadline):
+                task = asyncio.ensure_future(work())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.stats["coalesced"] += 1
+
+        # Wait without cancelling, so one caller leaving doesn't cancel the work for everyone
+        # else, but cancel it once nobody is waiting for the result any more
+        self._callers[task] = self._callers.get(task, 0) + 1
+        try:
+            left = deadlines.remaining()
+            done, _ = await asyncio.wait({task}, timeout=None if left is None else max(0.0, left))
+            if not done:
+                self.stats["deadline_exceeded"] += 1
+                metrics.deadline_exceeded.inc(stage=self.name)
+                raise DeadlineExceeded(f"DEADLINE_EXCEEDED: {self.name} did not finish within the request deadline")
+            return task.result()
+        except (asyncio.CancelledError, DeadlineExceeded):
+            if self._callers[task] == 1 and not task.done():
+                self.stats["abandoned"] += 1
+                task.cancel()
+            raise
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+
+    def _finished(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+
+    def get_stats(self) -> dict:
+        total = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._tasks),
+            "coalesced_ratio": round(self.stats["coalesced"] / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,149 @@
+"""
+In-memory soil profile store.
+
+iot_data.json is read once into an immutable snapshot indexed by id and by
+lower-cased soil type, with the coordinates of located records (regional
+surveys, IoT sensors) held in NumPy arrays for nearest-record lookups. The
+file's mtime is checked at most every check_interval seconds; a change is
+loaded on a background thread and the new snapshot swapped in whole, so
+requests never wait on the disk or see a half-loaded file.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_SOIL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "iot_data.json")
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class SoilSnapshot:
+    """One loaded version of the soil data"""
+
+    def __init__(self, records: list):
+        self.records = records
+        self.by_id = {str(record["id"]): record for record in records if "id" in record}
+        self.by_type = {}
+        for record in records:
+            key = str(record.get("type", "")).strip().lower()
+            # A type's general profile (no coordinates) wins over individual sensor records
+            if key not in self.by_type or (_location(self.by_type[key]) and not _location(record)):
+                self.by_type[key] = record
+
+        self.located = [record for record in records if _location(record)]
+        coords = np.radians(np.array([_location(record) for record in self.located], dtype=float).reshape(-1, 2))
+        self.lat, self.lon = coords[:, 0], coords[:, 1]
+        self.located_types = np.array([str(record.get("type", "")).strip().lower() for record in self.located])
+
+
+def _location(record: dict):
+    if record.get("latitude") is None or record.get("longitude") is None:
+        return None
+    return float(record["latitude"]), float(record["longitude"])
+
+
+class SoilStore:
+    """Soil records by id, type and nearest location, reloaded when the file changes"""
+
+    def __init__(self, path: str = DEFAULT_SOIL_PATH, check_interval: float = 2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.stats = {"reloads": 0, "reload_errors": 0, "id_hits": 0, "nearest_hits": 0, "type_hits": 0, "misses": 0}
+        self._reload_lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._mtime = None
+        self._snapshot = SoilSnapshot([])
+        try:
+            self._mtime = os.stat(path).st_mtime
+            self._snapshot = self._load()
+        except FileNotFoundError:
+            print(f"Warning: soil data file {path} not found; soil lookups will return unknown")
+
+    def _load(self) -> SoilSnapshot:
+        with open(self.path, "r") as f:
+            return SoilSnapshot(json.load(f)["soil_data"])
+
+    def _check_for_changes(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime and self._reload_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload, args=(mtime,), daemon=True).start()
+
+    def _reload(self, mtime: float):
+        try:
+            self._snapshot = self._load()
+            self._mtime = mtime
+            self.stats["reloads"] += 1
+        except Exception as e:
+            # Keep serving the previous data; the mtime is left as it was, so the next check tries again
+            self.stats["reload_errors"] += 1
+            print(f"Warning: could not reload soil data, keeping the previous version: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def snapshot(self) -> SoilSnapshot:
+        self._check_for_changes()
+        return self._snapshot
+
+    def get(self, soil_id):
+        return self.snapshot().by_id.get(str(soil_id))
+
+    def by_type(self, soil_type: str):
+        return self.snapshot().by_type.get(soil_type.strip().lower())
+
+    def nearest(self, latitude: float, longitude: float, soil_type: str = None, max_distance_km: float = None):
+        """The located record closest to a point (optionally of one type), or None"""
+        snapshot = self.snapshot()
+        if not snapshot.located:
+            return None
+
+        lat, lon = np.radians(latitude), np.radians(longitude)
+        # Haversine distance to every located record at once
+        a = (np.sin((snapshot.lat - lat) / 2) ** 2
+             + np.cos(lat) * np.cos(snapshot.lat) * np.sin((snapshot.lon - lon) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        if soil_type:
+            distances = np.where(snapshot.located_types == soil_type.strip().lower(), distances, np.inf)
+        if max_distance_km is not None:
+            distances = np.where(distances <= max_distance_km, distances, np.inf)
+
+        best = int(np.argmin(distances))
+        return snapshot.located[best] if np.isfinite(distances[best]) else None
+
+    def find(self, soil_type: str, soil_id=None, latitude: float = None, longitude: float = None,
+             max_distance_km: float = None):
+        """
+        Best record for a request: the record with soil_id if given, else the nearest located
+        record of the soil type within max_distance_km, else the type's profile. None if unknown.
+        """
+        if soil_id is not None:
+            record = self.get(soil_id)
+            if record is not None:
+                self.stats["id_hits"] += 1
+                return record
+        if latitude is not None and longitude is not None:
+            record = self.nearest(latitude, longitude, soil_type, max_distance_km)
+            if record is not None:
+                self.stats["nearest_hits"] += 1
+                return record
+        record = self.by_type(soil_type)
+        self.stats["type_hits" if record is not None else "misses"] += 1
+        return record
+
+    def get_stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            **self.stats,
+            "records": len(snapshot.records),
+            "types": len(snapshot.by_type),
+            "located_records": len(snapshot.located),
+        }
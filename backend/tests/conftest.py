@@ -0,0 +1,67 @@
+"""
+Shared fixtures. app reads its configuration at import time, so the
+environment is set up here before anything imports it.
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+os.environ["GEMINI_API_KEY"] = "test-key"
+os.environ["CLIMATE_CACHE_PATH"] = ""
+os.environ["CLIMATE_GRID_PATH"] = ""
+os.environ["GEMINI_RPM"] = "100000"
+os.environ["GEMINI_QUEUE_SIZE"] = "1000"
+os.environ["GEMINI_MODEL_CLASS"] = "fake_upstreams:FakeGenerativeModel"
+for name in ("GEMINI_API_KEYS", "PREDICTION_SESSION_SPILL_PATH", "REQUEST_KEY_LOG", "WARMUP_SOURCES"):
+    os.environ.pop(name, None)
+
+from fake_upstreams import FakeGenerativeModel, UpstreamFaults, create_power_app  # noqa: E402
+
+FAKE_POWER_URL = "http://power.test/api/temporal/daily/point"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def fixed_latency(latency_ms: float, **kwargs) -> UpstreamFaults:
+    return UpstreamFaults(latency_ms=latency_ms, jitter=0.0, **kwargs)
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    """
+    The app module with fresh caches, NASA POWER served by the fake POWER app
+    in-process and Gemini answered by FakeGenerativeModel. Both upstreams
+    answer in 50 ms unless a test sets its own faults.
+    """
+    import app
+    from climate_cache import ClimateCache, DailySeriesStore
+    from prediction_cache import PredictionCache
+    from prediction_sessions import PredictionSessionStore
+
+    monkeypatch.setattr(app, "climate_cache", ClimateCache(db_path=""))
+    monkeypatch.setattr(app, "climate_series", DailySeriesStore(db_path=""))
+    monkeypatch.setattr(app, "prediction_cache", PredictionCache())
+    monkeypatch.setattr(app, "prediction_sessions", PredictionSessionStore())
+    monkeypatch.setattr(app, "nasa_client", fake_nasa_client(fixed_latency(50)))
+    monkeypatch.setattr(FakeGenerativeModel, "faults", fixed_latency(50))
+    return app
+
+
+def fake_nasa_client(faults: UpstreamFaults, gap_rate: float = 0.0, **kwargs):
+    from nasa_client import NasaPowerClient
+
+    transport = httpx.ASGITransport(app=create_power_app(faults, gap_rate))
+    return NasaPowerClient(transport=transport, base_url=FAKE_POWER_URL, **kwargs)
+
+
+def api_client(app_module) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://api.test")
@@ -0,0 +1,118 @@
+"""/ask/stream: delta and done events, language clean-up, empty answers and Gemini failures"""
+import json
+import random
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from conftest import api_client, run
+from fake_upstreams import FakeGenerativeModel, FakeResponse, fake_prediction
+from gemini_scheduler import GeminiScheduler
+
+QUESTION = "Explain how I can improve my soil before sowing"
+
+
+class ChunkedModel(FakeGenerativeModel):
+    """Streams chunks one by one, or raises error (after the chunks, if there are any)"""
+
+    chunks = []
+    error = None
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        if self.error is not None and not self.chunks:
+            raise self.error
+        return self._chunks()
+
+    async def _chunks(self):
+        for chunk in self.chunks:
+            yield FakeResponse(chunk)
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture
+def stream_app(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "gemini_scheduler", GeminiScheduler(["test-key"], rpm=100000, max_retries=0))
+    monkeypatch.setattr(app_module, "gemini_model_class", ChunkedModel)
+    monkeypatch.setattr(ChunkedModel, "chunks", [])
+    monkeypatch.setattr(ChunkedModel, "error", None)
+    return app_module
+
+
+def ask_stream(app_module, language: str = "en", question: str = QUESTION) -> list:
+    prediction = {
+        **fake_prediction(43560, random.Random(0)),
+        "climate_data": {"avg_temp": 26.0, "avg_soil_moisture": 0.4, "avg_surface_temp": 27.0, "total_rainfall": 90.0},
+        "soil_info": {"type": "Loamy", "water_retention": "Medium", "nutrient_content": "High", "pH_level": 6.5},
+    }
+
+    async def scenario():
+        async with api_client(app_module) as client:
+            return await client.post("/ask/stream", json={
+                "question": question, "prediction_data": prediction, "language": language
+            })
+
+    response = run(scenario())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_deltas_are_followed_by_the_full_answer(stream_app):
+    ChunkedModel.chunks = ["Add compost ", "and ", "", "test the pH. "]
+
+    events = ask_stream(stream_app)
+
+    assert [name for name, _ in events] == ["delta", "delta", "delta", "done"]
+    assert [data["text"] for name, data in events if name == "delta"] == ["Add compost ", "and ", "test the pH. "]
+    assert events[-1][1] == {"answer": "Add compost and test the pH."}
+
+
+def test_the_full_answer_is_cleaned_for_the_requested_language(stream_app, monkeypatch):
+    ChunkedModel.chunks = ["खाद ", "डालें"]
+    cleaned = []
+
+    def clean(response: str, language: str) -> str:
+        cleaned.append((response, language))
+        return f"[{language}] {response}"
+
+    monkeypatch.setattr(stream_app, "clean_response_language", clean)
+
+    assert ask_stream(stream_app, language="hi")[-1] == ("done", {"answer": "[hi] खाद डालें"})
+    assert cleaned == [("खाद डालें", "hi")]
+    # English answers are left as they are
+    ChunkedModel.chunks = ["Add compost."]
+    assert ask_stream(stream_app)[-1] == ("done", {"answer": "Add compost."})
+    assert len(cleaned) == 1
+
+
+@pytest.mark.parametrize("language", ["en", "kn"])
+def test_an_empty_answer_gets_the_localized_message(stream_app, language):
+    ChunkedModel.chunks = ["  ", "\n"]
+
+    events = ask_stream(stream_app, language=language)
+
+    assert events[-1] == ("done", {"answer": stream_app.chatbot_empty_answer(language)})
+
+
+def test_a_failed_gemini_call_ends_with_an_error_event(stream_app):
+    ChunkedModel.error = api_exceptions.InternalServerError("500 An internal error has occurred.")
+
+    events = ask_stream(stream_app, language="hi")
+
+    assert [name for name, _ in events] == ["error"]
+    assert events[0][1]["answer"].startswith(stream_app.chatbot_error_answer("hi", Exception(""))[:20])
+    assert "500" in events[0][1]["answer"]
+
+
+def test_a_failure_mid_stream_ends_with_an_error_event_after_the_deltas(stream_app):
+    ChunkedModel.chunks = ["Add compost "]
+    ChunkedModel.error = api_exceptions.ServiceUnavailable("503 The service is currently unavailable.")
+
+    events = ask_stream(stream_app)
+
+    assert [name for name, _ in events] == ["delta", "error"]
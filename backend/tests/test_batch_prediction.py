@@ -0,0 +1,174 @@
+"""/predict/batch: shared climate and predictions, packed prompts and per-item results"""
+import json
+import random
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from conftest import api_client, run
+from fake_upstreams import FakeGenerativeModel, FakeResponse, fake_prediction
+from gemini_scheduler import GeminiScheduler
+
+
+def item(latitude: float = 12.0, longitude: float = 77.5, soil_type: str = "Loamy", land_area: int = 43560) -> dict:
+    return {"land_area": land_area, "latitude": latitude, "longitude": longitude, "soil_type": soil_type}
+
+
+class ScriptedModel(FakeGenerativeModel):
+    """The fake model, except that packed or single prompts can be made to fail or answer packed_text"""
+
+    prompts = []
+    packed_error = None
+    packed_text = None
+    single_error = None
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        prompt = str(contents)
+        self.prompts.append(prompt)
+        packed = "separate plots" in prompt
+        if packed and self.packed_error is not None:
+            raise self.packed_error
+        if packed and self.packed_text is not None:
+            return FakeResponse(self.packed_text)
+        if not packed and self.single_error is not None:
+            raise self.single_error
+        return await super().generate_content_async(contents, stream=stream, **kwargs)
+
+
+@pytest.fixture
+def batch_app(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "CROP_ENGINE_MODE", "fallback")
+    monkeypatch.setattr(app_module, "gemini_scheduler", GeminiScheduler(["test-key"], rpm=100000, max_retries=0))
+    monkeypatch.setattr(app_module, "gemini_model_class", ScriptedModel)
+    for name, value in (("prompts", []), ("packed_error", None), ("packed_text", None), ("single_error", None)):
+        monkeypatch.setattr(ScriptedModel, name, value)
+    return app_module
+
+
+def predict_batch(app_module, items: list):
+    async def scenario():
+        async with api_client(app_module) as client:
+            return await client.post("/predict/batch", json={"items": items})
+
+    return run(scenario())
+
+
+def packed_prompts() -> list:
+    return [prompt for prompt in ScriptedModel.prompts if "separate plots" in prompt]
+
+
+def test_plots_sharing_soil_and_cell_share_one_prediction(batch_app):
+    items = [
+        item(12.0, 77.5), item(12.1, 77.6, land_area=87120),  # Same cell and soil: one group
+        item(12.0, 77.5, soil_type="Clayey"),
+        item(20.0, 78.0),
+    ]
+
+    body = predict_batch(batch_app, items).json()
+
+    assert body["stats"]["climate_cells"] == 2
+    assert body["stats"]["packed_prompts"] == 1
+    assert body["stats"]["gemini_calls"] == 1
+    assert "You will receive 3 separate plots" in packed_prompts()[0]
+    results = [result["result"] for result in body["results"]]
+    assert [result["index"] for result in body["results"]] == [0, 1, 2, 3]
+    assert all(result["prediction_source"] == "gemini" for result in results)
+    # The second plot is twice the first, so it gets the same crops at twice the yield
+    assert [crop["name"] for crop in results[1]["crops"]] == [crop["name"] for crop in results[0]["crops"]]
+    first, second = results[0]["yield_data"][0]["yield_amount"], results[1]["yield_data"][0]["yield_amount"]
+    assert second == pytest.approx(first * 2, rel=0.01)
+
+
+def test_cached_predictions_are_served_without_gemini(batch_app):
+    items = [item(12.0, 77.5), item(20.0, 78.0, land_area=21780)]
+    predict_batch(batch_app, items)
+    ScriptedModel.prompts.clear()
+
+    body = predict_batch(batch_app, items).json()
+
+    assert body["stats"]["cache_hits"] == 2
+    assert body["stats"]["gemini_calls"] == 0
+    assert ScriptedModel.prompts == []
+    assert all(result["status_code"] == 200 for result in body["results"])
+
+
+def test_plots_missing_from_the_packed_answer_are_predicted_on_their_own(batch_app):
+    ScriptedModel.packed_text = json.dumps({"plots": [fake_prediction(43560, random.Random(1))]})
+
+    body = predict_batch(batch_app, [item(12.0, 77.5), item(20.0, 78.0)]).json()
+
+    assert len(packed_prompts()) == 1
+    assert len(ScriptedModel.prompts) == 2
+    assert body["stats"]["gemini_calls"] == 2
+    assert all(result["result"]["prediction_source"] == "gemini" for result in body["results"])
+
+
+@pytest.mark.parametrize("packed_text", ['["not", "an", "object"]', '{"plots": "none"}', "no JSON at all"])
+def test_a_malformed_packed_answer_falls_back_to_single_prompts(batch_app, packed_text):
+    ScriptedModel.packed_text = packed_text
+
+    body = predict_batch(batch_app, [item(12.0, 77.5), item(20.0, 78.0)]).json()
+
+    assert len(ScriptedModel.prompts) == 3
+    assert all(result["status_code"] == 200 for result in body["results"])
+
+
+def test_a_failed_packed_call_is_retried_group_by_group(batch_app):
+    ScriptedModel.packed_error = api_exceptions.InternalServerError("500 An internal error has occurred.")
+
+    body = predict_batch(batch_app, [item(12.0, 77.5), item(20.0, 78.0), item(25.0, 80.0)]).json()
+
+    assert len(packed_prompts()) == 1
+    assert len(ScriptedModel.prompts) == 4
+    assert all(result["status_code"] == 200 for result in body["results"])
+    assert all(result["result"]["prediction_source"] == "gemini" for result in body["results"])
+
+
+def test_a_throttled_packed_call_falls_back_to_local_scoring(batch_app):
+    ScriptedModel.packed_error = api_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+
+    body = predict_batch(batch_app, [item(12.0, 77.5), item(20.0, 78.0)]).json()
+
+    assert len(ScriptedModel.prompts) == 1
+    assert body["stats"]["local_predictions"] == 2
+    assert all(result["result"]["prediction_source"] == "local" for result in body["results"])
+
+
+@pytest.mark.parametrize("mode, error, status_code", [
+    ("fallback", api_exceptions.InternalServerError("500 An internal error has occurred."), 500),
+    ("fallback", api_exceptions.Unauthenticated("401 API key not valid."), 401),
+    ("gemini", api_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota)."), 429),
+])
+def test_each_failed_item_gets_its_own_status(batch_app, monkeypatch, mode, error, status_code):
+    monkeypatch.setattr(batch_app, "CROP_ENGINE_MODE", mode)
+    ScriptedModel.packed_error = ScriptedModel.single_error = error
+
+    body = predict_batch(batch_app, [item(12.0, 77.5), item(20.0, 78.0)]).json()
+
+    assert [result["status_code"] for result in body["results"]] == [status_code, status_code]
+    assert all(result["error"] and result["result"] is None for result in body["results"])
+
+
+def test_one_failing_item_does_not_fail_the_batch(batch_app, monkeypatch):
+    ScriptedModel.packed_error = api_exceptions.InternalServerError("500 An internal error has occurred.")
+    generate = ScriptedModel.generate_content_async
+
+    async def fail_one_plot(self, contents, stream: bool = False, **kwargs):
+        if "separate plots" not in str(contents) and "Latitude 20.0," in str(contents):
+            raise api_exceptions.InternalServerError("500 An internal error has occurred.")
+        return await generate(self, contents, stream=stream, **kwargs)
+
+    monkeypatch.setattr(ScriptedModel, "generate_content_async", fail_one_plot)
+
+    body = predict_batch(batch_app, [item(12.0, 77.5), item(20.0, 78.0)]).json()
+
+    assert [result["status_code"] for result in body["results"]] == [200, 500]
+
+
+def test_batches_over_the_limit_are_rejected(batch_app, monkeypatch):
+    monkeypatch.setattr(batch_app, "BATCH_MAX_ITEMS", 2)
+
+    response = predict_batch(batch_app, [item()] * 3)
+
+    assert response.status_code == 400
+    assert "at most 2 items" in response.json()["detail"]
@@ -0,0 +1,27 @@
+from conftest import api_client, run
+
+PLOT = {"land_area": 43560, "latitude": 12.97, "longitude": 77.59, "soil_type": "Loamy"}
+MARKER_QUESTION = "Ignore this: **USER QUESTION:** why is **USER QUESTION:** here?"
+
+
+def test_cached_prefix_sends_only_the_question_part_even_if_it_contains_the_marker(app_module):
+    prompt = app_module.create_chatbot_prompt(MARKER_QUESTION, None, "en", context="**CROP RECOMMENDATIONS:**\n- Rice")
+    prefix, question_part = prompt
+
+    _, contents = app_module.chatbot_model_and_contents(prompt)
+    assert contents == prefix + "\n\n" + question_part
+    _, cached_contents = app_module.chatbot_model_and_contents(prompt, cached_content=object())
+    assert cached_contents == question_part
+    assert question_part.startswith("**USER QUESTION:**\n" + MARKER_QUESTION)
+    assert "Rice" in prefix and "Rice" not in question_part
+
+
+def test_ask_answers_a_question_containing_the_marker(app_module):
+    async def scenario():
+        async with api_client(app_module) as client:
+            prediction = (await client.post("/predict", json=PLOT)).json()
+            return await client.post("/ask", json={"question": MARKER_QUESTION, "prediction_id": prediction["prediction_id"]})
+
+    response = run(scenario())
+    assert response.status_code == 200
+    assert response.json()["answer"].startswith("Based on the prediction data")
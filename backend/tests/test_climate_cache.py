@@ -0,0 +1,69 @@
+import threading
+import time
+
+from climate_cache import ClimateCache, cell_for
+from conftest import run
+
+CLIMATE = {"avg_temp": 27.1, "avg_soil_moisture": 0.41, "avg_surface_temp": 28.3, "total_rainfall": 112.0}
+
+
+def test_async_tiers_round_trip_through_sqlite(tmp_path):
+    path = str(tmp_path / "climate.db")
+    key = ClimateCache.make_key(12.97, 77.59, "20240101", "20240130")
+
+    async def scenario():
+        await ClimateCache(db_path=path).set_async(key, CLIMATE)
+        # A new instance has an empty memory tier, so this is read back from disk
+        reopened = ClimateCache(db_path=path)
+        return reopened, await reopened.get_async(key), await reopened.get_async(key)
+
+    cache, from_disk, from_memory = run(scenario())
+    assert from_disk == CLIMATE and from_memory == CLIMATE
+    assert cache.stats["disk_hits"] == 1 and cache.stats["memory_hits"] == 1
+
+
+def test_sqlite_runs_off_the_event_loop(tmp_path, monkeypatch):
+    cache = ClimateCache(db_path=str(tmp_path / "climate.db"))
+    threads = []
+    read_disk = cache._get_disk
+    monkeypatch.setattr(cache, "_get_disk", lambda key: threads.append(threading.get_ident()) or read_disk(key))
+
+    async def scenario():
+        return threading.get_ident(), await cache.get_async("missing")
+
+    loop_thread, value = run(scenario())
+    assert value is None and cache.stats["misses"] == 1
+    assert threads and threads[0] != loop_thread
+
+
+def test_expired_disk_entry_is_a_miss_and_last_known_still_serves_it(tmp_path):
+    cache = ClimateCache(db_path=str(tmp_path / "climate.db"))
+    key = ClimateCache.make_key(12.97, 77.59, "20240101", "20240130")
+    cache.set(key, CLIMATE, expires_at=time.time() - 1)
+    cache._memory.clear()
+
+    assert cache.get(key) is None
+    assert cache.stats["expired"] == 1 and cache.stats["misses"] == 1
+    assert run(cache.get_last_known_async(12.9, 77.6)) is None  # Expired rows are deleted on read
+    cache.set(key, CLIMATE, expires_at=time.time() - 1)
+    assert run(cache.get_last_known_async(12.9, 77.6)) == CLIMATE
+
+
+def test_points_in_one_native_cell_share_a_key_and_neighbours_do_not():
+    # The cell around the grid point (12.0, 77.5) spans 11.75-12.25 N and 77.1875-77.8125 E
+    inside = [(12.0, 77.5), (11.76, 77.19), (12.24, 77.81), (12.01, 77.59)]
+    neighbours = [(12.26, 77.5), (11.74, 77.5), (12.0, 77.82), (12.0, 77.18)]
+
+    assert {cell_for(lat, lon) for lat, lon in inside} == {(12.0, 77.5)}
+    assert len({cell_for(lat, lon) for lat, lon in neighbours}) == 4
+    assert (12.0, 77.5) not in {cell_for(lat, lon) for lat, lon in neighbours}
+    key = ClimateCache.make_key(12.01, 77.59, "20240101", "20240130")
+    assert key == ClimateCache.make_key(12.24, 77.7, "20240101", "20240130")
+    assert key != ClimateCache.make_key(12.49, 77.59, "20240101", "20240130")
+
+
+def test_cells_are_snapped_to_grid_points_that_nasa_serves():
+    lat, lon = cell_for(-8.3, 115.1)
+
+    assert (lat / 0.5).is_integer() and (lon / 0.625).is_integer()
+    assert cell_for(0.0, -0.1) == (0.0, 0.0)
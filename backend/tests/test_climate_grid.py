@@ -0,0 +1,209 @@
+"""Memory-mapped climate grid: ingesting POWER exports and looking points up in it"""
+import json
+
+import pytest
+
+from climate_cache import FILL_VALUE
+from climate_grid import META_FILE, ClimateGrid, ingest, read_power_csv, read_power_json
+
+DAYS = ["20240101", "20240102", "20240103"]
+
+
+def feature(lat: float, lon: float, values: dict) -> dict:
+    """A POWER point feature; values[param] is one value for every day or a {day: value} dict"""
+    series = {param: value if isinstance(value, dict) else {day: value for day in DAYS}
+              for param, value in values.items()}
+    return {"geometry": {"coordinates": [lon, lat, 900.0]}, "properties": {"parameter": series}}
+
+
+def power_json(path, lat: float, lon: float, values: dict):
+    """A POWER daily point JSON export"""
+    path.write_text(json.dumps(feature(lat, lon, values)))
+    return str(path)
+
+
+def point_values(t2m: float) -> dict:
+    return {"T2M": t2m, "PRECTOTCORR": 1.0, "GWETTOP": 0.4, "TS": t2m + 1}
+
+
+def build_grid(tmp_path, points: list, **kwargs) -> ClimateGrid:
+    files = [power_json(tmp_path / f"point{index}.json", lat, lon, point_values(t2m))
+             for index, (lat, lon, t2m) in enumerate(points)]
+    out = str(tmp_path / "grid")
+    ingest(files, (11.0, 77.0, 13.0, 78.5), out)
+    return ClimateGrid.open(out, **kwargs)
+
+
+def test_points_are_looked_up_in_the_nearest_native_cell(tmp_path):
+    grid = build_grid(tmp_path, [(12.0, 77.5, 20.0), (12.5, 77.5, 30.0)])
+
+    assert grid.aggregate(12.2, 77.7, DAYS[0], DAYS[-1])["avg_temp"] == 20.0
+    assert grid.aggregate(11.8, 77.2, DAYS[0], DAYS[-1])["avg_temp"] == 20.0
+    assert grid.aggregate(12.3, 77.5, DAYS[0], DAYS[-1])["avg_temp"] == 30.0
+    assert grid.cell_index(12.2, 77.7) != grid.cell_index(12.3, 77.5)
+
+
+def test_a_window_without_valid_rainfall_has_none_but_one_without_temperatures_is_empty(tmp_path):
+    files = [power_json(tmp_path / "dry.json", 12.0, 77.5, {**point_values(20.0), "PRECTOTCORR": FILL_VALUE}),
+             power_json(tmp_path / "blank.json", 12.5, 77.5, {**point_values(20.0), "T2M": FILL_VALUE})]
+    ingest(files, (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"))
+    grid = ClimateGrid.open(str(tmp_path / "grid"))
+
+    # As on the live path, where RollingWindow sums no valid rainfall days to 0
+    assert grid.aggregate(12.0, 77.5, DAYS[0], DAYS[-1]) == {
+        "avg_temp": 20.0, "avg_soil_moisture": 0.4, "avg_surface_temp": 21.0, "total_rainfall": 0.0
+    }
+    assert grid.aggregate(12.5, 77.5, DAYS[0], DAYS[-1]) is None
+    assert grid.stats["empty"] == 1
+
+
+# --- ingest ---
+
+def test_ingest_summarises_the_grid_it_wrote(tmp_path):
+    files = [power_json(tmp_path / "inside.json", 12.0, 77.5, point_values(20.0)),
+             power_json(tmp_path / "outside.json", 20.0, 77.5, point_values(30.0))]
+
+    summary = ingest(files, (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"))
+
+    # 11..13 is 5 rows of 0.5 degrees; 76.875..78.75 is 4 columns of 0.625
+    assert summary == {
+        "grid_cells": 20, "cells_with_data": 1, "points_outside_bbox": 1,
+        "first_day": "20240101", "last_day": "20240103", "bytes": 20 * 3 * 4 * 4,
+    }
+    grid = ClimateGrid.open(str(tmp_path / "grid"))
+    assert grid.get_stats()["cells"] == 20
+    assert grid.aggregate(12.0, 77.5, DAYS[0], DAYS[-1])["total_rainfall"] == 3.0
+
+
+def test_fill_values_and_days_without_data_are_left_out(tmp_path):
+    values = {**point_values(20.0), "T2M": {DAYS[0]: 10.0, DAYS[1]: FILL_VALUE}}
+    files = [power_json(tmp_path / "point.json", 12.0, 77.5, values)]
+
+    ingest(files, (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"))
+    grid = ClimateGrid.open(str(tmp_path / "grid"))
+
+    assert grid.aggregate(12.0, 77.5, DAYS[0], DAYS[-1])["avg_temp"] == 10.0
+    assert grid.aggregate(12.0, 77.5, DAYS[1], DAYS[-1]) is None
+
+
+def test_ingest_keeps_only_the_days_asked_for(tmp_path):
+    files = [power_json(tmp_path / "point.json", 12.0, 77.5, point_values(20.0))]
+
+    summary = ingest(files, (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"), start=DAYS[1], end="20240105")
+
+    assert (summary["first_day"], summary["last_day"]) == (DAYS[1], "20240105")
+    grid = ClimateGrid.open(str(tmp_path / "grid"))
+    assert grid.aggregate(12.0, 77.5, DAYS[1], DAYS[-1])["total_rainfall"] == 2.0
+    assert grid.aggregate(12.0, 77.5, DAYS[0], DAYS[-1]) is None
+
+
+def test_ingest_without_data_is_an_error(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": []}))
+
+    with pytest.raises(ValueError):
+        ingest([str(path)], (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"))
+
+
+# --- POWER export readers ---
+
+def test_a_feature_collection_gives_every_point(tmp_path):
+    path = tmp_path / "region.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        feature(12.0, 77.5, {"T2M": 20.0}), feature(12.5, 78.125, {"T2M": 30.0}),
+    ]}))
+
+    points = read_power_json(str(path))
+
+    assert [(lat, lon) for lat, lon, _ in points] == [(12.0, 77.5), (12.5, 78.125)]
+    assert points[1][2] == {day: {"T2M": 30.0} for day in DAYS}
+
+
+def test_a_regional_csv_has_lat_lon_and_month_day_columns(tmp_path):
+    path = tmp_path / "region.csv"
+    path.write_text(
+        "-BEGIN HEADER-\n"
+        "NASA/POWER CERES/MERRA2 Native Resolution Daily Data\n"
+        "-END HEADER-\n"
+        "LAT,LON,YEAR,MO,DY,T2M,PRECTOTCORR,GWETTOP,TS\n"
+        "12.0,77.5,2024,1,1,20.5,1.2,0.41,21.5\n"
+        "12.0,77.5,2024,1,2,21.0,,0.42,22.0\n"
+        "12.5,77.5,2024,1,1,19.0,0.0,0.39,20.0\n"
+    )
+
+    points = read_power_csv(str(path))
+
+    assert points == [
+        (12.0, 77.5, {"20240101": {"T2M": 20.5, "PRECTOTCORR": 1.2, "GWETTOP": 0.41, "TS": 21.5},
+                      "20240102": {"T2M": 21.0, "GWETTOP": 0.42, "TS": 22.0}}),
+        (12.5, 77.5, {"20240101": {"T2M": 19.0, "PRECTOTCORR": 0.0, "GWETTOP": 0.39, "TS": 20.0}}),
+    ]
+
+
+def test_a_point_csv_has_its_location_in_the_header_and_day_of_year_dates(tmp_path):
+    path = tmp_path / "point.csv"
+    path.write_text(
+        "-BEGIN HEADER-\n"
+        "NASA/POWER CERES/MERRA2 Native Resolution Daily Data\n"
+        "Dates (month/day/year): 02/28/2024 through 03/01/2024\n"
+        "Location: Latitude  12.0   Longitude 77.5\n"
+        "-END HEADER-\n"
+        "YEAR,DOY,T2M,PRECTOTCORR,GWETTOP,TS\n"
+        "2024,59,20.0,0.0,0.4,21.0\n"
+        "2024,60,21.0,2.5,0.4,22.0\n"
+        "2024,61,22.0,-999,0.4,23.0\n"
+    )
+
+    [(lat, lon, daily)] = read_power_csv(str(path))
+
+    assert (lat, lon) == (12.0, 77.5)
+    # 2024 is a leap year, so day 60 is 29 February
+    assert list(daily) == ["20240228", "20240229", "20240301"]
+    assert daily["20240301"]["PRECTOTCORR"] == FILL_VALUE
+
+    ingest([str(path)], (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"))
+    grid = ClimateGrid.open(str(tmp_path / "grid"))
+    assert grid.aggregate(12.0, 77.5, "20240228", "20240301") == {
+        "avg_temp": 21.0, "avg_soil_moisture": 0.4, "avg_surface_temp": 22.0, "total_rainfall": 2.5
+    }
+
+
+def test_a_csv_without_a_location_is_rejected(tmp_path):
+    path = tmp_path / "nowhere.csv"
+    path.write_text("YEAR,DOY,T2M\n2024,1,20.0\n")
+
+    with pytest.raises(ValueError):
+        read_power_csv(str(path))
+
+
+# --- Lookups ---
+
+def test_a_stale_grid_serves_its_last_window_up_to_the_max_age(tmp_path):
+    values = {**point_values(0.0), "T2M": {DAYS[0]: 10.0, DAYS[1]: 20.0, DAYS[2]: 30.0}}
+    files = [power_json(tmp_path / "point.json", 12.0, 77.5, values)]
+    ingest(files, (11.0, 77.0, 13.0, 78.5), str(tmp_path / "grid"))
+    grid = ClimateGrid.open(str(tmp_path / "grid"), max_age_days=5)
+
+    # A two-day window ending 5 days after the grid does becomes its last two days
+    assert grid.aggregate(12.0, 77.5, "20240107", "20240108")["avg_temp"] == 25.0
+    assert grid.aggregate(12.0, 77.5, "20240108", "20240109") is None
+    # A window longer than the grid can't be served even when shifted
+    assert grid.aggregate(12.0, 77.5, "20240101", "20240105") is None
+    assert grid.stats == {"hits": 1, "outside": 0, "stale": 2, "empty": 0}
+
+
+def test_points_outside_the_grid_are_not_served(tmp_path):
+    grid = build_grid(tmp_path, [(12.0, 77.5, 20.0)])
+
+    assert grid.aggregate(20.0, 77.5, DAYS[0], DAYS[-1]) is None
+    assert grid.stats["outside"] == 1
+
+
+def test_a_grid_keyed_by_cell_corners_is_not_used(tmp_path):
+    build_grid(tmp_path, [(12.0, 77.5, 20.0)])
+    meta_path = tmp_path / "grid" / META_FILE
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({**meta, "lat0": meta["lat0"] - 0.25, "lon0": meta["lon0"] - 0.3125}))
+
+    assert ClimateGrid.open(str(tmp_path / "grid")) is None
+    assert ClimateGrid.open(str(tmp_path / "missing")) is None
@@ -0,0 +1,146 @@
+"""Incremental climate refresh: missing day ranges, the sliding window and -999 fills"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from climate_cache import FILL_RECHECK_DAYS, FILL_VALUE, DailySeriesStore
+from conftest import run
+
+CELL = (12.0, 77.5)
+
+
+def day(days_ago: int) -> str:
+    return (datetime.now() - timedelta(days=days_ago)).strftime("%Y%m%d")
+
+
+def values_for(key: str) -> dict:
+    ordinal = datetime.strptime(key, "%Y%m%d").toordinal()
+    return {"T2M": 20 + ordinal % 7, "PRECTOTCORR": ordinal % 3 * 1.5, "GWETTOP": 0.3 + ordinal % 5 / 100,
+            "TS": 22 + ordinal % 4}
+
+
+class StubPower:
+    """Stands in for NasaPowerClient.get_daily; fills holds (day, param) pairs to answer with -999"""
+
+    def __init__(self, fills: set = ()):
+        self.fills = set(fills)
+        self.calls = []
+
+    async def get_daily(self, cell: tuple, start: str, end: str, parameters) -> dict:
+        self.calls.append((start, end))
+        result = {param: {} for param in parameters}
+        current, last = datetime.strptime(start, "%Y%m%d"), datetime.strptime(end, "%Y%m%d")
+        while current <= last:
+            key = current.strftime("%Y%m%d")
+            for param in parameters:
+                result[param][key] = FILL_VALUE if (key, param) in self.fills else values_for(key)[param]
+            current += timedelta(days=1)
+        return result
+
+
+@pytest.fixture
+def series_app(app_module, monkeypatch):
+    power = StubPower()
+    monkeypatch.setattr(app_module, "nasa_client", power)
+    return app_module, power
+
+
+def refresh(app_module, start: str, end: str) -> dict:
+    return run(app_module.refresh_climate_data(CELL, start, end, f"test:{start}:{end}"))
+
+
+def recomputed(start: str, end: str, skip: set = ()) -> dict:
+    """The aggregates computed from scratch over start..end, leaving out the (day, param) pairs in skip"""
+    days = []
+    current = datetime.strptime(start, "%Y%m%d")
+    while current.strftime("%Y%m%d") <= end:
+        days.append(current.strftime("%Y%m%d"))
+        current += timedelta(days=1)
+
+    def valid(param):
+        return [values_for(key)[param] for key in days if (key, param) not in skip]
+
+    return {
+        "avg_temp": round(sum(valid("T2M")) / len(valid("T2M")), 2),
+        "avg_soil_moisture": round(sum(valid("GWETTOP")) / len(valid("GWETTOP")), 4),
+        "avg_surface_temp": round(sum(valid("TS")) / len(valid("TS")), 2),
+        "total_rainfall": round(sum(valid("PRECTOTCORR")), 2),
+    }
+
+
+def test_a_cold_cell_is_fetched_in_one_range(series_app):
+    app_module, power = series_app
+
+    refresh(app_module, day(40), day(10))
+
+    assert power.calls == [(day(40), day(10))]
+
+
+def test_a_warm_cell_fetches_only_the_new_days(series_app):
+    app_module, power = series_app
+    refresh(app_module, day(40), day(10))
+
+    refresh(app_module, day(38), day(8))
+
+    assert power.calls[1:] == [(day(9), day(8))]
+    assert app_module.climate_series.stats["days_fetched"] == 33
+
+
+def test_gaps_inside_the_window_are_fetched_as_separate_ranges():
+    store = DailySeriesStore(db_path="")
+    store.save_days(CELL, {key: values_for(key) for key in (day(30), day(29), day(26), day(25))})
+
+    assert store.missing_ranges(CELL, day(31), day(24)) == [(day(31), day(31)), (day(28), day(27)),
+                                                             (day(24), day(24))]
+
+
+def test_sliding_aggregates_equal_a_full_recompute(series_app):
+    app_module, _ = series_app
+    refresh(app_module, day(60), day(30))
+
+    for offset in range(1, 6):
+        slid = refresh(app_module, day(60 - offset), day(30 - offset))
+        assert slid == recomputed(day(60 - offset), day(30 - offset))
+
+
+def test_fill_values_are_left_out_of_the_aggregates(series_app):
+    app_module, power = series_app
+    fills = {(day(20), "T2M"), (day(21), "T2M"), (day(22), "PRECTOTCORR")}
+    power.fills = fills
+
+    climate = refresh(app_module, day(30), day(15))
+
+    assert climate == recomputed(day(30), day(15), skip=fills)
+
+
+def test_recent_fill_values_are_refetched_and_older_ones_are_not(series_app):
+    app_module, power = series_app
+    recent, old = day(FILL_RECHECK_DAYS - 2), day(FILL_RECHECK_DAYS + 5)
+    power.fills = {(recent, "TS"), (old, "TS")}
+    refresh(app_module, day(20), day(1))
+
+    # POWER has back-filled the recent day since
+    power.fills = set()
+    climate = refresh(app_module, day(20), day(1))
+
+    assert power.calls[1:] == [(recent, recent)]
+    assert climate == recomputed(day(20), day(1), skip={(old, "TS")})
+
+
+def test_a_90_day_window_costs_one_fetch_once_warm(series_app):
+    app_module, power = series_app
+    refresh(app_module, day(100), day(11))
+    assert len(power.calls) == 1
+
+    climate = refresh(app_module, day(99), day(10))
+
+    assert power.calls[1:] == [(day(10), day(10))]
+    assert climate == recomputed(day(99), day(10))
+
+
+def test_a_window_with_no_valid_temperatures_is_an_error():
+    store = DailySeriesStore(db_path="")
+    store.save_days(CELL, {day(20): {**values_for(day(20)), "T2M": FILL_VALUE}})
+
+    with pytest.raises(ValueError):
+        store.aggregate(CELL, day(20), day(20))
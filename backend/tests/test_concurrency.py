@@ -0,0 +1,41 @@
+"""Overlapping /predict calls must not queue behind each other's upstream I/O"""
+import asyncio
+import time
+
+from conftest import api_client, fake_nasa_client, fixed_latency, run
+
+NASA_LATENCY_MS = 200
+GEMINI_LATENCY_MS = 300
+
+
+def plot(index: int) -> dict:
+    # Points a few cells apart so nothing is shared through the caches or request coalescing
+    return {"land_area": 43560, "latitude": 10.0 + index * 1.5, "longitude": 76.0 + index, "soil_type": "Loamy"}
+
+
+def test_overlapping_predicts_take_about_one_call(app_module, monkeypatch):
+    from fake_upstreams import FakeGenerativeModel
+
+    monkeypatch.setattr(app_module, "nasa_client", fake_nasa_client(fixed_latency(NASA_LATENCY_MS), hedge_delay=0))
+    monkeypatch.setattr(FakeGenerativeModel, "faults", fixed_latency(GEMINI_LATENCY_MS))
+    calls = 8
+
+    async def scenario():
+        async with api_client(app_module) as client:
+            started = time.perf_counter()
+            response = await client.post("/predict", json=plot(calls))
+            single = time.perf_counter() - started
+            assert response.status_code == 200
+
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(client.post("/predict", json=plot(i)) for i in range(calls)))
+            overlapped = time.perf_counter() - started
+        return single, overlapped, responses
+
+    single, overlapped, responses = run(scenario())
+
+    assert single >= (NASA_LATENCY_MS + GEMINI_LATENCY_MS) / 1000
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json()["prediction_source"] == "gemini" for response in responses)
+    # Serialized calls would take calls * single
+    assert overlapped < single * 1.5
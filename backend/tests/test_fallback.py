@@ -0,0 +1,111 @@
+"""In fallback mode local scoring covers for a throttled or slow Gemini, but not for a bad API key"""
+import json
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from conftest import api_client, run
+from fake_upstreams import FakeGenerativeModel, FakeResponse
+from gemini_scheduler import GeminiScheduler
+
+PLOT = {"land_area": 43560, "latitude": 12.97, "longitude": 77.59, "soil_type": "Loamy"}
+
+
+def failing_model(error: Exception):
+    class FailingModel(FakeGenerativeModel):
+        async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+            raise error
+
+    return FailingModel
+
+
+@pytest.fixture
+def fallback_app(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "CROP_ENGINE_MODE", "fallback")
+    # A fresh scheduler without retries, so a 429 doesn't leave the shared key backing off
+    monkeypatch.setattr(app_module, "gemini_scheduler", GeminiScheduler(["test-key"], rpm=100000, max_retries=0))
+    return app_module
+
+
+def predict(app_module, path: str = "/predict"):
+    async def scenario():
+        async with api_client(app_module) as client:
+            return await client.post(path, json=PLOT)
+
+    return run(scenario())
+
+
+def stream_events(response) -> dict:
+    events = {}
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events[lines["event"]] = json.loads(lines["data"])
+    return events
+
+
+@pytest.mark.parametrize("error", [
+    api_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota)."),
+    api_exceptions.DeadlineExceeded("504 Deadline Exceeded"),
+])
+def test_throttling_and_timeouts_fall_back_to_local_scoring(fallback_app, monkeypatch, error):
+    monkeypatch.setattr(fallback_app, "gemini_model_class", failing_model(error))
+
+    response = predict(fallback_app)
+
+    assert response.status_code == 200
+    assert response.json()["prediction_source"] == "local"
+    assert response.json()["crops"]
+
+
+@pytest.mark.parametrize("error", [
+    api_exceptions.PermissionDenied("403 Permission denied on resource project."),
+    api_exceptions.InvalidArgument("400 API key not valid. Please pass a valid API key."),
+    api_exceptions.Unauthenticated("Request had invalid authentication credentials."),
+])
+def test_auth_errors_are_not_hidden_by_local_scoring(fallback_app, monkeypatch, error):
+    monkeypatch.setattr(fallback_app, "gemini_model_class", failing_model(error))
+
+    response = predict(fallback_app)
+
+    assert response.status_code == 401
+    assert response.json()["detail"].startswith("API_KEY_ERROR")
+
+
+def test_other_gemini_errors_are_not_hidden_by_local_scoring(fallback_app, monkeypatch):
+    error = api_exceptions.InternalServerError("500 An internal error has occurred.")
+    monkeypatch.setattr(fallback_app, "gemini_model_class", failing_model(error))
+
+    assert predict(fallback_app).status_code == 500
+
+
+async def unusable_answer(self, contents, stream: bool = False, **kwargs):
+    return FakeResponse("I can't help with that.")
+
+
+def test_unusable_answer_falls_back_to_local_scoring(fallback_app, monkeypatch):
+    monkeypatch.setattr(FakeGenerativeModel, "generate_content_async", unusable_answer)
+
+    response = predict(fallback_app)
+
+    assert response.status_code == 200
+    assert response.json()["prediction_source"] == "local"
+
+
+def test_stream_reports_auth_errors(fallback_app, monkeypatch):
+    error = api_exceptions.PermissionDenied("403 Permission denied on resource project.")
+    monkeypatch.setattr(fallback_app, "gemini_model_class", failing_model(error))
+
+    events = stream_events(predict(fallback_app, "/predict/stream"))
+
+    assert "done" not in events
+    assert events["error"]["status_code"] == 401
+
+
+def test_stream_falls_back_when_throttled(fallback_app, monkeypatch):
+    error = api_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+    monkeypatch.setattr(fallback_app, "gemini_model_class", failing_model(error))
+
+    events = stream_events(predict(fallback_app, "/predict/stream"))
+
+    assert "error" not in events
+    assert events["done"]["prediction_source"] == "local"
@@ -0,0 +1,289 @@
+"""GeminiScheduler admission, priorities, timeouts and 429 backoff, on a fake clock with a fake client"""
+import asyncio
+import importlib
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from conftest import run
+from gemini_scheduler import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_PREDICT, QUEUE_FULL_ERROR, QUEUE_TIMEOUT_ERROR,
+    GeminiScheduler, GenaiClientAdapter
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class FakeClient:
+    """Stands in for a model call: records the key each call ran on and raises the queued errors"""
+
+    def __init__(self, errors: list = ()):
+        self.errors = list(errors)
+        self.keys = []
+
+    async def __call__(self, key):
+        self.keys.append(key.index)
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"answer from key{key.index}"
+
+
+def scheduler(keys: int = 1, **kwargs) -> GeminiScheduler:
+    kwargs.setdefault("clock", FakeClock())
+    return GeminiScheduler([f"test-key-{index}" for index in range(keys)], **kwargs)
+
+
+async def settle():
+    """Let woken tasks run until they block again"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def pending(coroutine):
+    """Start coroutine and let it run until it blocks"""
+    task = asyncio.ensure_future(coroutine)
+    await settle()
+    return task
+
+
+def test_requests_are_admitted_while_the_bucket_has_room():
+    async def scenario():
+        gemini = scheduler(rpm=2)
+        first = await gemini.acquire(PRIORITY_PREDICT)
+        second = await gemini.acquire(PRIORITY_PREDICT)
+        third = await pending(gemini.acquire(PRIORITY_PREDICT))
+        assert not third.done()
+
+        # 2 requests a minute refill one request every 30 seconds
+        gemini.clock.advance(29)
+        gemini._dispatch()
+        await settle()
+        assert not third.done()
+
+        gemini.clock.advance(2)
+        gemini._dispatch()
+        await settle()
+        assert third.done()
+        return first, second, await third, gemini
+
+    first, second, third, gemini = run(scenario())
+    assert first is second is third
+    assert gemini.stats["admitted"] == 3
+    assert gemini.stats["queued"] == 1
+
+
+def test_token_budget_limits_admission():
+    async def scenario():
+        gemini = scheduler(rpm=100, tpm=1000)
+        await gemini.acquire(PRIORITY_PREDICT, tokens=800)
+        waiting = await pending(gemini.acquire(PRIORITY_PREDICT, tokens=400))
+        assert not waiting.done()
+
+        # 1000 tokens a minute: the missing 200 take 12 seconds
+        gemini.clock.advance(11)
+        gemini._dispatch()
+        await settle()
+        assert not waiting.done()
+
+        gemini.clock.advance(2)
+        gemini._dispatch()
+        await settle()
+        return waiting.done()
+
+    assert run(scenario())
+
+
+def test_calls_go_to_the_least_loaded_key():
+    async def scenario():
+        gemini = scheduler(keys=2)
+        return [(await gemini.acquire(PRIORITY_PREDICT)).index for _ in range(4)]
+
+    assert sorted(run(scenario())) == [0, 0, 1, 1]
+
+
+def test_queued_requests_are_admitted_in_priority_order():
+    async def scenario():
+        gemini = scheduler(rpm=1)
+        key = await gemini.acquire(PRIORITY_PREDICT)
+        order = []
+
+        async def request(priority):
+            await gemini.acquire(priority)
+            order.append(priority)
+
+        # Queued lowest priority first
+        tasks = [await pending(request(priority))
+                 for priority in (PRIORITY_BATCH, PRIORITY_PREDICT, PRIORITY_INTERACTIVE)]
+        assert gemini.get_stats()["queued_by_priority"] == {"interactive": 1, "predict": 1, "batch": 1}
+
+        for _ in tasks:
+            gemini.clock.advance(60)
+            gemini.release(key)
+            await settle()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(scenario()) == [PRIORITY_INTERACTIVE, PRIORITY_PREDICT, PRIORITY_BATCH]
+
+
+def test_waiting_past_the_queue_timeout_fails_fast():
+    async def scenario():
+        gemini = scheduler(rpm=1, queue_timeout=0.05)
+        await gemini.acquire(PRIORITY_PREDICT)
+        with pytest.raises(ValueError, match="Timed out waiting") as error:
+            await gemini.acquire(PRIORITY_PREDICT)
+        return gemini, str(error.value)
+
+    gemini, message = run(scenario())
+    assert message == QUEUE_TIMEOUT_ERROR
+    assert gemini.stats["rejected_timeout"] == 1
+    assert gemini.get_stats()["queue_depth"] == 0
+
+
+def test_a_full_queue_rejects_new_requests():
+    async def scenario():
+        gemini = scheduler(rpm=1, max_queue=1)
+        await gemini.acquire(PRIORITY_PREDICT)
+        waiting = await pending(gemini.acquire(PRIORITY_PREDICT))
+        with pytest.raises(ValueError) as error:
+            await gemini.acquire(PRIORITY_INTERACTIVE)
+        waiting.cancel()
+        return gemini, str(error.value)
+
+    gemini, message = run(scenario())
+    assert message == QUEUE_FULL_ERROR
+    assert gemini.stats["rejected_queue_full"] == 1
+
+
+def test_a_429_backs_the_key_off_and_retries_on_another_key():
+    async def scenario():
+        gemini = scheduler(keys=2, backoff_base=1.0)
+        client = FakeClient([api_exceptions.ResourceExhausted("429 Resource has been exhausted")])
+        answer = await gemini.run(client)
+        return gemini, client, answer
+
+    gemini, client, answer = run(scenario())
+    throttled, retried = client.keys
+    assert retried != throttled
+    assert answer == f"answer from key{retried}"
+    assert gemini.stats["retries"] == 1
+    assert gemini.stats["upstream_throttled"] == 1
+    # Equal jitter: between half and all of the 1 s base delay
+    backoff = gemini.keys[throttled].backoff_until - gemini.clock()
+    assert 0.5 <= backoff <= 1.0
+    assert gemini.keys[retried].backoff_until == 0.0
+
+
+def test_backoff_doubles_per_consecutive_429_up_to_the_cap():
+    async def scenario():
+        gemini = scheduler(backoff_base=1.0, backoff_max=8.0)
+        backoffs = []
+        for _ in range(5):
+            key = await gemini.acquire(PRIORITY_PREDICT)
+            gemini.release(key, throttled=True)
+            backoffs.append(key.backoff_until - gemini.clock())
+            gemini.clock.advance(60)
+        key = await gemini.acquire(PRIORITY_PREDICT)
+        gemini.release(key)
+        return backoffs, key.consecutive_throttles
+
+    backoffs, consecutive = run(scenario())
+    for backoff, delay in zip(backoffs, (1, 2, 4, 8, 8)):
+        assert delay / 2 <= backoff <= delay
+    # A successful call resets the streak
+    assert consecutive == 0
+
+
+def test_a_429_is_raised_once_retries_are_used_up():
+    async def scenario():
+        gemini = scheduler(max_retries=1)
+        client = FakeClient([api_exceptions.ResourceExhausted("429 Resource has been exhausted")] * 2)
+        run_call = asyncio.ensure_future(gemini.run(client))
+        # The only key is backing off, so the retry waits for it
+        await settle()
+        assert len(client.keys) == 1
+        gemini.clock.advance(1)
+        gemini._dispatch()
+        with pytest.raises(api_exceptions.ResourceExhausted):
+            await run_call
+        return client
+
+    assert len(run(scenario()).keys) == 2
+
+
+def test_other_errors_are_not_retried():
+    async def scenario():
+        gemini = scheduler()
+        client = FakeClient([api_exceptions.PermissionDenied("403 Permission denied")])
+        with pytest.raises(api_exceptions.PermissionDenied):
+            await gemini.run(client)
+        return gemini, client
+
+    gemini, client = run(scenario())
+    assert len(client.keys) == 1
+    assert gemini.keys[0].backoff_until == 0.0
+    assert gemini.keys[0].in_flight == 0
+
+
+class FakeAdapter:
+    def __init__(self):
+        self.clients = []
+
+    def client_for(self, api_key):
+        self.clients.append(api_key)
+        return f"client for {api_key}"
+
+    def attach(self, model, client):
+        model.client = client
+        return model
+
+
+class Model:
+    pass
+
+
+def test_each_key_builds_its_client_once():
+    adapter = FakeAdapter()
+    gemini = GeminiScheduler(["key-a", "key-b"], client_adapter=adapter)
+
+    first = gemini.keys[1].bind(Model())
+    second = gemini.keys[1].bind(Model())
+
+    assert first.client == second.client == "client for key-b"
+    assert adapter.clients == ["key-b"]
+
+
+def test_keys_without_an_adapter_use_the_model_as_given():
+    model = Model()
+    assert scheduler().keys[0].bind(model) is model
+
+
+def test_adapter_fails_loudly_without_the_private_client_manager(monkeypatch):
+    client_module = importlib.import_module("google.generativeai.client")
+    monkeypatch.delattr(client_module, "_ClientManager")
+    with pytest.raises(RuntimeError, match="_ClientManager"):
+        GenaiClientAdapter()
+
+
+def test_adapter_fails_loudly_for_models_without_an_async_client():
+    with pytest.raises(RuntimeError, match="_async_client"):
+        GenaiClientAdapter().attach(Model(), object())
+
+
+def test_adapter_binds_a_real_model_to_the_keys_client():
+    import google.generativeai as genai
+
+    adapter = GenaiClientAdapter()
+    client = object()
+    model = adapter.attach(genai.GenerativeModel("gemini-2.5-flash"), client)
+
+    assert model._async_client is client
@@ -0,0 +1,99 @@
+"""The incremental parser must give json.loads' answer however the text is chunked"""
+import json
+import random
+
+import pytest
+
+from json_stream import IncrementalJsonObjectParser
+
+DOCUMENTS = [
+    {},
+    {"best_sowing_time": "June"},
+    {
+        "crops": [{"name": "Rice", "water_required_liters": 435600.5}, {"name": "Ragi", "water_required_liters": 1e5}],
+        "yield_data": [{"crop_name": "Rice", "roi": -12.5, "notes": None, "organic": True, "rotated": False}],
+        "crop_timeline": [{"crop": "Rice", "suitable_months": ["June", "July"], "nested": {"a": [[], {}, [1, [2]]]}}],
+        "best_sowing_time": "June to July",
+    },
+    {"text": "braces } { ] [ and commas , inside strings: \"quoted\", back\\slash \\\" , done"},
+    {"escapes": "line\nbreak\ttab é 🌾 \\u0041 \""},
+    {"हिंदी": "गेहूं की बुवाई अक्टूबर में", "ಕನ್ನಡ": "ರಾಗಿ", "emoji": "🌾🌧️"},
+    {"key \"with\" quotes": 1, "key\\with\\slashes": 2, "": 3},
+    {"numbers": [0, -0.5, 1.25e-3, 12345678901234567890], "empty": "", "list": []},
+]
+
+
+def serializations(document: dict) -> list:
+    compact = json.dumps(document, separators=(",", ":"), ensure_ascii=False)
+    return [
+        compact,
+        json.dumps(document, indent=2, ensure_ascii=True),
+        json.dumps(document, ensure_ascii=False),
+        # Gemini usually wraps the object in a fence with prose around it
+        "Here is the JSON:\n```json\n" + json.dumps(document, indent=4, ensure_ascii=False) + "\n```\nDone.",
+    ]
+
+
+# Escapes json.dumps never writes but Gemini may: \/ and surrogate pairs
+RAW_TEXTS = [r'{"solidus": "a\/b", "pair": "\ud83c\udf3e", "hindi": "\u0917\u0947\u0939\u0942\u0902", "z": "\\"}']
+
+CASES = [(document, text) for document in DOCUMENTS for text in serializations(document)]
+CASES += [(json.loads(text), text) for text in RAW_TEXTS]
+
+
+def parse(chunks: list) -> tuple:
+    parser = IncrementalJsonObjectParser()
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return parser, completed
+
+
+def expected_members(text: str) -> list:
+    start, end = text.index("{"), text.rindex("}")
+    return list(json.loads(text[start:end + 1]).items())
+
+
+@pytest.mark.parametrize("document, text", CASES)
+def test_every_two_way_split_matches_json_loads(document, text):
+    expected = expected_members(text)
+    for offset in range(len(text) + 1):
+        parser, completed = parse([text[:offset], text[offset:]])
+        assert completed == expected, f"split at {offset}: {text[:offset]!r} | {text[offset:]!r}"
+        assert parser.done
+        assert parser.members == dict(expected)
+
+
+@pytest.mark.parametrize("document, text", CASES)
+def test_character_by_character_and_random_chunks_match_json_loads(document, text):
+    expected = expected_members(text)
+    assert parse(list(text))[1] == expected
+
+    rng = random.Random(len(text))
+    for _ in range(50):
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(1, 8))))
+        chunks = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        assert parse(chunks)[1] == expected, chunks
+
+
+def test_members_are_returned_as_soon_as_they_complete():
+    parser = IncrementalJsonObjectParser()
+    assert parser.feed('{"crops": [{"name": "Rice"}') == []
+    assert parser.feed('], "best_sowing_time": "Ju') == [("crops", [{"name": "Rice"}])]
+    assert parser.feed('ne"') == []
+    assert parser.feed("}") == [("best_sowing_time", "June")]
+    assert parser.done
+    # Anything after the object is ignored
+    assert parser.feed(', "extra": 1}') == []
+
+
+def test_malformed_member_is_skipped_and_the_rest_still_parse():
+    parser, completed = parse(['{"crops": [1, 2,], "best_sowing_time": "June"}'])
+    assert completed == [("best_sowing_time", "June")]
+    assert parser.done
+
+
+def test_incomplete_object_keeps_the_members_completed_so_far():
+    parser, completed = parse(['```json\n{"crops": [], "yield_data": [{"crop_name": "Ri'])
+    assert completed == [("crops", [])]
+    assert not parser.done
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+
+import local_answers
+
+PREDICTION = SimpleNamespace(
+    crops=[
+        {"name": "Rice", "water_required_liters": 400000.0},
+        {"name": "Gram (Chickpea)", "water_required_liters": 150000.0},
+        {"name": "Sweet Potato", "water_required_liters": 250000.0},
+    ],
+    yield_data=[
+        {"crop_name": "Rice", "yield_amount": 1400.0, "market_rate_per_unit": 22.0,
+         "cost_of_selling": 30800.0, "cost_of_growing": 18000.0, "roi": 71.11},
+        {"crop_name": "Gram (Chickpea)", "yield_amount": 500.0, "market_rate_per_unit": 55.0,
+         "cost_of_selling": 27500.0, "cost_of_growing": 12000.0, "roi": 129.17},
+        {"crop_name": "Sweet Potato", "yield_amount": 2000.0, "market_rate_per_unit": 12.0,
+         "cost_of_selling": 24000.0, "cost_of_growing": 14000.0, "roi": 71.43},
+    ],
+    crop_timeline=[{"crop": "Rice", "season": "Kharif", "suitable_months": ["June", "July"]}],
+    best_sowing_time="June to July",
+)
+
+
+@pytest.mark.parametrize("question, language, answer", [
+    ("Which crop has the highest ROI?", "en", "Gram (Chickpea) has the highest ROI: 129.17%."),
+    ("which crop is cheapest to grow in terms of cost", "en", "Gram (Chickpea) has the lowest growing cost: ₹12,000.00."),
+    ("What is the total water required?", "en", "The total water requirement for all recommended crops is 800,000.00 liters."),
+    ("Profit for Gram (Chickpea)", "en", "The profit for Gram (Chickpea) is ₹15,500.00."),
+    ("What's the yield of gram (chickpea)?", "en", "The yield for Gram (Chickpea) is 500.00 kg."),
+    ("Sweet Potato revenue", "en", "The sell value for Sweet Potato is ₹24,000.00."),
+    ("What is the ROI percentage of Rice?", "en", "The ROI for Rice is 71.11%."),
+    ("When should I sow?", "en", None),
+    ("Best sowing time?", "en", "The best sowing time is June to July."),
+    ("What is the best time to sow Rice?", "en", "Rice can be sown in: June, July."),
+    ("sowing time", "en", "The best sowing time is June to July."),
+    ("Rice sowing months", "en", "Rice can be sown in: June, July."),
+    ("किस फसल का मुनाफा सबसे अधिक है", "hi", "Gram (Chickpea) का मुनाफा सबसे अधिक है: ₹15,500.00।"),
+    ("ಒಟ್ಟು ಇಳುವರಿ", "kn", "ಶಿಫಾರಸು ಮಾಡಿದ ಎಲ್ಲಾ ಬೆಳೆಗಳಿಗೆ ಒಟ್ಟು ಇಳುವರಿ 3,900.00 ಕೆಜಿ ಆಗಿದೆ."),
+])
+def test_lookup_questions_are_answered_locally(question, language, answer):
+    assert local_answers.answer_locally(question, PREDICTION, language) == answer
+
+
+@pytest.mark.parametrize("question, language", [
+    # Per-unit figures aren't in the data
+    ("What is the profit per acre for Rice?", "en"),
+    ("Rice cost per kg", "en"),
+    ("highest yield in kg/acre", "en"),
+    ("प्रति एकड़ चावल का मुनाफा", "hi"),
+    ("ಪ್ರತಿ ಎಕರೆ ಲಾಭ", "kn"),
+    # Open-ended, comparative or ambiguous
+    ("Why does Rice have the highest ROI?", "en"),
+    ("Compare the profit of Rice and Sweet Potato", "en"),
+    ("Rice or Gram (Chickpea) profit", "en"),
+    ("Which crop has the highest and lowest cost?", "en"),
+    ("Highest yield and profit?", "en"),
+    ("Tell me about the soil", "en"),
+    ("What is the total ROI?", "en"),
+    # Qualifiers the figures don't answer
+    ("Which crop is best to plant?", "en"),
+    ("What is the price of rice seeds?", "en"),
+    ("Is rice water intensive?", "en"),
+    ("बुवाई का समय", "hi"),
+])
+def test_other_questions_go_to_gemini(question, language):
+    assert local_answers.answer_locally(question, PREDICTION, language) is None
+
+
+def test_phrases_match_whole_words_only():
+    assert local_answers._contains("what is the percentage", "per") is False
+    assert local_answers._contains("a minimal cost", "min") is False
+    assert local_answers._contains("cost of gram (chickpea)?", "gram (chickpea)")
+    assert local_answers._contains("₹/acre", "/acre")
+    assert local_answers._remove("gram (chickpea) yield", "gram (chickpea)").split() == ["yield"]
+
+
+def test_incomplete_data_falls_back_and_counts(monkeypatch):
+    monkeypatch.setattr(local_answers, "stats", {"answered": 0, "fallback": 0})
+    broken = SimpleNamespace(**{**vars(PREDICTION), "yield_data": [{"crop_name": "Rice", "roi": "n/a"}]})
+
+    assert local_answers.answer_locally("Which crop has the highest ROI?", broken) is None
+    assert local_answers.answer_locally("Which crop has the highest ROI?", PREDICTION, "fr").endswith("129.17%.")
+    assert local_answers.stats == {"answered": 1, "fallback": 1}
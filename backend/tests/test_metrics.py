@@ -0,0 +1,125 @@
+"""Server-Timing headers, the /metrics exposition and the slow-request profiler"""
+import logging
+import re
+import time
+
+import metrics
+from conftest import api_client, run
+
+PLOT = {"land_area": 43560, "latitude": 12.0, "longitude": 77.5, "soil_type": "Loamy"}
+
+# A sample line: name, optional {label="value",...} and a float, +Inf/-Inf or integer value
+SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{([a-zA-Z_]+="([^"\\]|\\.)*",?)*\})? (\S+)$')
+
+
+def sample(exposition: str, name: str, **labels) -> float:
+    """The value of the sample with exactly these labels, or 0 if there is none yet"""
+    wanted = metrics._format_labels(labels)
+    for line in exposition.splitlines():
+        if line.startswith(f"{name}{wanted} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def predict_then_scrape(app_module):
+    async def scenario():
+        async with api_client(app_module) as client:
+            predicted = await client.post("/predict", json=PLOT)
+            return predicted, await client.get("/metrics")
+
+    return run(scenario())
+
+
+# --- Server-Timing ---
+
+def test_server_timing_has_each_stage_and_the_total(app_module):
+    predicted, _ = predict_then_scrape(app_module)
+
+    entries = dict(entry.split(";dur=") for entry in predicted.headers["Server-Timing"].split(", "))
+    assert {"soil", "climate", "cache", "gemini", "total"} <= set(entries)
+    assert list(entries)[-1] == "total"
+    durations = {name: float(value) for name, value in entries.items()}
+    # The fake upstreams take 50 ms each
+    assert durations["gemini"] >= 50
+    assert durations["total"] >= durations["climate"] + durations["gemini"]
+
+
+def test_repeated_stages_are_summed():
+    header = metrics.server_timing_header([("gemini", 0.1), ("parse", 0.002), ("gemini", 0.2)], 0.5)
+
+    assert header == "gemini;dur=300.0, parse;dur=2.0, total;dur=500.0"
+
+
+# --- /metrics ---
+
+def test_metrics_are_in_the_prometheus_text_format(app_module):
+    _, scraped = predict_then_scrape(app_module)
+    exposition = scraped.text
+
+    assert scraped.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert exposition.endswith("\n")
+    declared = set()
+    for line in exposition.splitlines():
+        if line.startswith("# TYPE "):
+            name, kind = line.split()[2:]
+            assert kind in ("counter", "gauge", "histogram")
+            declared.add(name)
+        elif not line.startswith("# HELP "):
+            match = SAMPLE_LINE.match(line)
+            assert match, line
+            name = re.sub(r"_(bucket|sum|count)$", "", match.group(1))
+            assert match.group(1) in declared or name in declared, line
+            float(match.group(5))
+
+
+def test_metrics_include_the_requests_and_their_stages(app_module):
+    _, scraped = predict_then_scrape(app_module)
+    exposition = scraped.text
+
+    labels = {"endpoint": "/predict", "method": "POST", "status": "200"}
+    count = sample(exposition, "greenbyte_request_duration_seconds_count", **labels)
+    assert count >= 1
+    assert sample(exposition, "greenbyte_request_duration_seconds_bucket", **labels, le="+Inf") == count
+    assert sample(exposition, "greenbyte_stage_duration_seconds_count", endpoint="/predict", stage="gemini") >= 1
+    # The scrape itself is the only request in flight
+    assert sample(exposition, "greenbyte_requests_in_flight", endpoint="/predict") == 0
+    assert sample(exposition, "greenbyte_requests_in_flight", endpoint="/metrics") == 1
+    assert sample(exposition, "greenbyte_coalesced_in_flight", group="predict") == 0
+
+
+# --- SlowRequestProfiler ---
+
+def busy(seconds: float):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def test_slow_requests_are_reported_and_counted():
+    reports = []
+    profiler = metrics.SlowRequestProfiler(threshold=0.02, interval=0.001, on_report=reports.append)
+    before = sample(metrics.registry.render(), "greenbyte_slow_requests_total", endpoint="/predict", method="POST")
+
+    started = time.perf_counter()
+    profiler.request_started()
+    busy(0.05)
+    profiler.request_finished("/predict", "POST", started, time.perf_counter() - started)
+
+    profiler.request_started()
+    profiler.request_finished("/predict", "POST", time.perf_counter(), 0.001)
+
+    assert len(reports) == 1
+    assert reports[0].startswith("Slow request: POST /predict took")
+    assert "busy (test_metrics.py:" in reports[0]
+    after = sample(metrics.registry.render(), "greenbyte_slow_requests_total", endpoint="/predict", method="POST")
+    assert after == before + 1
+
+
+def test_slow_request_reports_are_logged_by_default(caplog):
+    profiler = metrics.SlowRequestProfiler(threshold=0.0)
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        profiler.request_started()
+        profiler.request_finished("/ask", "POST", time.perf_counter(), 0.01)
+
+    assert [record.getMessage().split(" (")[0] for record in caplog.records] == ["Slow request: POST /ask took 10 ms"]
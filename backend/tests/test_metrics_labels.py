@@ -0,0 +1,20 @@
+"""Request metrics label requests by route path, with unknown paths folded into "other" """
+from conftest import api_client, run
+
+
+def test_route_paths_are_collected_once(app_module):
+    app_module.known_route_paths.cache_clear()
+
+    async def scenario():
+        async with api_client(app_module) as client:
+            for path in ("/", "/cache/stats", "/no-such-page", "/"):
+                await client.get(path)
+            return (await client.get("/metrics")).text
+
+    exposition = run(scenario())
+
+    assert app_module.known_route_paths.cache_info().misses == 1
+    assert "/predict" in app_module.known_route_paths()
+    assert "/no-such-page" not in app_module.known_route_paths()
+    assert 'endpoint="other",method="GET",status="404"' in exposition
+    assert 'endpoint="/cache/stats",method="GET",status="200"' in exposition
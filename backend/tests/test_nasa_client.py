@@ -0,0 +1,223 @@
+"""NasaPowerClient retries, hedging and circuit breaker against an httpx.MockTransport upstream"""
+import asyncio
+
+import httpx
+import pytest
+
+from conftest import run
+from nasa_client import CircuitBreaker, CircuitOpenError, NasaPowerClient
+
+CELL = (12.5, 77.5)
+BODY = {"properties": {"parameter": {"T2M": {"20240101": 25.1}}}}
+
+
+class FakePower:
+    """MockTransport handler answering with the queued (status, delay) replies, then 200s"""
+
+    def __init__(self, replies: list = ()):
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        status, delay = self.replies.pop(0) if self.replies else (200, 0)
+        await asyncio.sleep(delay)
+        if status != 200:
+            return httpx.Response(status, json={"message": "upstream trouble"})
+        return httpx.Response(200, json=BODY)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def nasa_client(power: FakePower, **kwargs) -> NasaPowerClient:
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("hedge_delay", 0)
+    return NasaPowerClient(transport=httpx.MockTransport(power), **kwargs)
+
+
+def fetch(client: NasaPowerClient):
+    return client.get_daily(CELL, "20240101", "20240101", ["T2M"])
+
+
+def test_transient_errors_are_retried():
+    power = FakePower([(503, 0), (429, 0)])
+    client = nasa_client(power, max_retries=2)
+
+    assert run(fetch(client)) == BODY["properties"]["parameter"]
+    assert power.calls == 3
+    assert client.stats["retries"] == 2
+    assert client.breaker.state == "closed"
+
+
+def test_retries_give_up_after_max_retries():
+    power = FakePower([(503, 0)] * 3)
+    client = nasa_client(power, max_retries=1)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    assert power.calls == 2
+    assert client.stats["failures"] == 1
+    assert client.breaker.consecutive_failures == 1
+
+
+def test_client_errors_are_not_retried_and_do_not_trip_the_breaker():
+    power = FakePower([(400, 0)])
+    client = nasa_client(power, max_retries=2, failure_threshold=1)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    assert power.calls == 1
+    assert client.breaker.state == "closed"
+
+
+def test_a_client_from_an_earlier_event_loop_is_closed():
+    client = nasa_client(FakePower())
+    run(fetch(client))
+    first = client._client
+
+    run(fetch(client))
+
+    assert first.is_closed
+    assert client._client is not first and not client._client.is_closed
+    run(client.aclose())
+
+
+def test_a_slow_request_is_hedged_and_the_faster_copy_wins():
+    power = FakePower([(200, 1.0)])
+    client = nasa_client(power, hedge_delay=0.05)
+
+    async def timed():
+        started = asyncio.get_running_loop().time()
+        await fetch(client)
+        return asyncio.get_running_loop().time() - started
+
+    assert run(timed()) < 0.5
+    assert power.calls == 2
+    assert client.stats["hedges_sent"] == 1
+    assert client.stats["hedge_wins"] == 1
+
+
+def test_a_fast_request_is_not_hedged():
+    power = FakePower()
+    client = nasa_client(power, hedge_delay=0.5)
+
+    run(fetch(client))
+    assert power.calls == 1
+    assert client.stats["hedges_sent"] == 0
+
+
+def test_a_failed_hedge_copy_does_not_hide_the_primary_answer():
+    # The primary is slow but fine; the hedge copy fails fast
+    power = FakePower([(200, 0.2), (503, 0)])
+    client = nasa_client(power, hedge_delay=0.05, max_retries=0)
+
+    assert run(fetch(client)) == BODY["properties"]["parameter"]
+    assert client.stats["hedge_wins"] == 0
+
+
+def test_circuit_opens_half_opens_and_closes():
+    clock = FakeClock()
+    power = FakePower([(503, 0)] * 2)
+    client = nasa_client(power, max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            run(fetch(client))
+    assert client.breaker.state == "open"
+
+    # Open: fail fast without calling upstream
+    with pytest.raises(CircuitOpenError):
+        run(fetch(client))
+    assert power.calls == 2
+    assert client.breaker.get_stats()["retry_in_seconds"] == 30
+
+    clock.now += 30
+    assert run(fetch(client)) == BODY["properties"]["parameter"]
+    assert power.calls == 3
+    assert client.breaker.state == "closed"
+    assert client.breaker.get_stats()["opened"] == 1
+
+
+def test_a_failed_trial_reopens_the_circuit():
+    clock = FakeClock()
+    power = FakePower([(503, 0)] * 2)
+    client = nasa_client(power, max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    clock.now += 30
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+
+    assert client.breaker.state == "open"
+    assert client.breaker.opened_at == clock.now
+    with pytest.raises(CircuitOpenError):
+        run(fetch(client))
+
+
+def test_a_client_error_on_the_half_open_trial_leaves_the_circuit_half_open():
+    clock = FakeClock()
+    power = FakePower([(503, 0), (400, 0), (503, 0)])
+    client = nasa_client(power, max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    clock.now += 30
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+
+    # The 400 proved nothing about upstream, so the next call is another trial, and its 503 reopens
+    assert client.breaker.state == "half_open"
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    assert client.breaker.state == "open"
+    assert power.calls == 3
+
+
+def test_half_open_lets_one_trial_through():
+    clock = FakeClock()
+    power = FakePower([(503, 0), (200, 0.1)])
+    client = nasa_client(power, max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    clock.now += 30
+
+    async def concurrent():
+        return await asyncio.gather(fetch(client), fetch(client), return_exceptions=True)
+
+    trial, other = run(concurrent())
+    assert trial == BODY["properties"]["parameter"]
+    assert isinstance(other, CircuitOpenError)
+    assert client.breaker.state == "closed"
+
+
+def test_a_cancelled_trial_does_not_block_the_next_one():
+    clock = FakeClock()
+    power = FakePower([(503, 0), (200, 1.0)])
+    client = nasa_client(power, max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(fetch(client))
+    clock.now += 30
+
+    async def cancel_trial():
+        trial = asyncio.ensure_future(fetch(client))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        return await fetch(client)
+
+    assert run(cancel_trial()) == BODY["properties"]["parameter"]
+    assert client.breaker.state == "closed"
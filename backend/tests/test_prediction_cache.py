@@ -0,0 +1,94 @@
+import pytest
+
+import prediction_cache
+from prediction_cache import PredictionCache, compute_roi, normalize_prediction, scale_prediction
+
+ACRE = 43560
+
+
+def prediction(cost_of_growing: float = 15000.0) -> dict:
+    return {
+        "crops": [{"name": "Rice", "water_required_liters": 435600.0}],
+        "yield_data": [{
+            "crop_name": "Rice",
+            "yield_amount": 1400.0,
+            "market_rate_per_unit": 22.0,
+            "cost_of_selling": 30800.0,
+            "cost_of_growing": cost_of_growing,
+            "roi": compute_roi(30800.0, cost_of_growing),
+        }],
+        "crop_timeline": [{"crop": "Rice", "season": "Kharif", "suitable_months": ["June", "July"]}],
+        "best_sowing_time": "June",
+    }
+
+
+def test_rescale_is_linear_in_area_and_keeps_roi():
+    half = scale_prediction(normalize_prediction(prediction(), ACRE), ACRE // 2)
+
+    assert half["crops"][0]["water_required_liters"] == 217800.0
+    entry = half["yield_data"][0]
+    assert (entry["yield_amount"], entry["cost_of_selling"], entry["cost_of_growing"]) == (700.0, 15400.0, 7500.0)
+    assert entry["market_rate_per_unit"] == 22.0
+    assert entry["roi"] == pytest.approx(105.33)
+    assert half["crop_timeline"] == prediction()["crop_timeline"]
+
+
+def test_tiny_area_keeps_roi_when_costs_round_to_zero():
+    tiny = scale_prediction(normalize_prediction(prediction(), ACRE), 1)
+
+    entry = tiny["yield_data"][0]
+    assert entry["cost_of_growing"] == 0.34
+    assert entry["roi"] == pytest.approx(105.33)
+    assert scale_prediction(normalize_prediction(prediction(cost_of_growing=0.001), ACRE), 1)["yield_data"][0]["roi"] > 0
+
+
+def test_zero_growing_cost_gives_zero_roi():
+    assert compute_roi(100.0, 0) == 0.0
+    scaled = scale_prediction(normalize_prediction(prediction(cost_of_growing=0.0), ACRE), ACRE)
+    assert scaled["yield_data"][0]["roi"] == 0.0
+
+
+@pytest.mark.parametrize("land_area, data", [
+    (0, prediction()),
+    (-5, prediction()),
+    (ACRE, {**prediction(), "crops": []}),
+    (ACRE, {**prediction(), "yield_data": [{"crop_name": "Rice"}]}),
+    (ACRE, {**prediction(), "crops": [{"name": "Rice", "water_required_liters": "lots"}]}),
+])
+def test_unscalable_predictions_are_not_cached(land_area, data):
+    assert normalize_prediction(data, land_area) is None
+    cache = PredictionCache()
+    cache.set("key", data, land_area)
+    assert cache.stats["uncacheable"] == 1 and cache.get("key", ACRE) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, "time", lambda: now[0])
+    cache = PredictionCache(ttl_seconds=60)
+    cache.set("key", prediction(), ACRE)
+
+    now[0] += 59
+    assert cache.contains("key") and cache.get("key", ACRE) is not None
+    now[0] += 2
+    assert not cache.contains("key")
+    assert cache.get("key", ACRE) is None
+    assert cache.stats == {**cache.stats, "hits": 1, "misses": 1, "expired": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    cache.set("a", prediction(), ACRE)
+    cache.set("b", prediction(), ACRE)
+    cache.get("a", ACRE)
+    cache.set("c", prediction(), ACRE)
+
+    assert cache.contains("a") and cache.contains("c")
+    assert not cache.contains("b")
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_make_key_ignores_soil_case_and_climate_order():
+    climate = {"avg_temp": 25.0, "total_rainfall": 90.0}
+    assert (PredictionCache.make_key(" Loamy", (12.25, 77.5), climate, "3")
+            == PredictionCache.make_key("loamy", (12.25, 77.5), dict(reversed(climate.items())), "3"))
@@ -0,0 +1,261 @@
+"""Checking, repairing and schema generation for Gemini prediction output"""
+import copy
+import json
+import random
+
+import pytest
+
+import prediction_output
+from conftest import api_client, run
+from fake_upstreams import FakeGenerativeModel, FakeResponse, fake_prediction
+from prediction_output import (
+    GeminiBatchPredictionRepair, GeminiPrediction, GeminiPredictionRepair, apply_repair, check_prediction,
+    create_batch_repair_prompt, response_schema, split_batch_repair
+)
+
+
+def valid_prediction(seed: int = 0) -> dict:
+    return fake_prediction(43560, random.Random(seed))
+
+
+def sections(problems: list) -> list:
+    return [(problem["section"], problem["index"]) for problem in problems]
+
+
+# --- check_prediction ---
+
+def test_a_valid_prediction_has_no_problems():
+    data = valid_prediction()
+    prediction, problems = check_prediction(data, record=False)
+
+    assert problems == []
+    assert [crop["name"] for crop in prediction["crops"]] == [crop["name"] for crop in data["crops"]]
+    assert prediction["best_sowing_time"] == data["best_sowing_time"]
+
+
+def test_invalid_entries_are_reported_and_left_out():
+    data = valid_prediction()
+    data["crops"][1]["water_required_liters"] = -1
+    data["yield_data"][0]["yield_amount"] = "lots"
+    prediction, problems = check_prediction(data, record=False)
+
+    assert sections(problems) == [("crops", 1), ("yield_data", 0)]
+    assert len(prediction["crops"]) == 2
+    assert len(prediction["yield_data"]) == 2
+    assert "water_required_liters" in problems[0]["error"]
+
+
+def test_missing_sections_are_reported_without_an_index():
+    prediction, problems = check_prediction({"crops": [], "yield_data": "none"}, record=False)
+
+    assert sections(problems) == [("crops", None), ("yield_data", None), ("crop_timeline", None),
+                                  ("best_sowing_time", None)]
+    assert prediction["best_sowing_time"] == "Not specified"
+
+
+def test_selling_value_and_roi_are_recomputed():
+    data = valid_prediction()
+    entry = data["yield_data"][0]
+    entry.update(yield_amount=1000.0, market_rate_per_unit=20.0, cost_of_growing=10000.0,
+                 cost_of_selling=1.0, roi=999.0)
+    before = prediction_output.stats["numbers_corrected"]
+    prediction, _ = check_prediction(data)
+
+    assert prediction["yield_data"][0]["cost_of_selling"] == 20000.0
+    assert prediction["yield_data"][0]["roi"] == 100.0
+    assert prediction_output.stats["numbers_corrected"] == before + 2
+
+
+def test_months_are_normalized():
+    data = valid_prediction()
+    data["crop_timeline"][0]["suitable_months"] = ["jun", "Sept", "June"]
+    prediction, problems = check_prediction(data, record=False)
+
+    assert problems == []
+    assert prediction["crop_timeline"][0]["suitable_months"] == ["June", "September"]
+
+
+def test_unknown_months_are_problems():
+    data = valid_prediction()
+    data["crop_timeline"][2]["suitable_months"] = ["Smarch"]
+    _, problems = check_prediction(data, record=False)
+
+    assert sections(problems) == [("crop_timeline", 2)]
+
+
+def test_strict_mode_rejects_numbers_as_strings():
+    data = valid_prediction()
+    data["crops"][0]["water_required_liters"] = "5000"
+    _, problems = check_prediction(data, record=False)
+
+    assert sections(problems) == [("crops", 0)]
+
+
+# --- apply_repair ---
+
+def test_repaired_entries_replace_only_the_invalid_ones():
+    data = valid_prediction()
+    original = copy.deepcopy(data)
+    data["yield_data"][1]["cost_of_growing"] = 0
+    _, problems = check_prediction(data, record=False)
+    fixed = {**original["yield_data"][1], "index": 1}
+    # An entry that wasn't asked for is ignored
+    stray = {**original["crops"][0], "name": "Not asked for", "index": 0}
+
+    merged = apply_repair(data, {"crops": [stray], "yield_data": [fixed]}, problems)
+
+    assert merged["yield_data"][1] == original["yield_data"][1]
+    assert merged["crops"] == original["crops"]
+    assert check_prediction(merged, record=False)[1] == []
+    # The input is left as it was
+    assert data["yield_data"][1]["cost_of_growing"] == 0
+
+
+def test_missing_sections_are_replaced_whole():
+    data = valid_prediction()
+    timeline = data.pop("crop_timeline")
+    del data["best_sowing_time"]
+    _, problems = check_prediction(data, record=False)
+    repair = {
+        "crop_timeline": [{**entry, "index": index} for index, entry in reversed(list(enumerate(timeline)))],
+        "best_sowing_time": "June",
+    }
+
+    merged = apply_repair(data, repair, problems)
+
+    assert merged["crop_timeline"] == timeline
+    assert merged["best_sowing_time"] == "June"
+
+
+def test_a_malformed_repair_changes_nothing():
+    data = valid_prediction()
+    data["crops"][0]["name"] = ""
+    _, problems = check_prediction(data, record=False)
+
+    merged = apply_repair(data, {"crops": [{"name": "Rice"}, "Rice"], "yield_data": None}, problems)
+
+    assert merged["crops"] == data["crops"]
+
+
+# --- batch repair ---
+
+def test_batch_repair_prompt_lists_only_the_invalid_plots():
+    prompts = ["Plot A request", "Plot B request", "Plot C request"]
+    plot = valid_prediction()
+    plot["crops"][0]["name"] = ""
+    _, problems = check_prediction(plot, record=False)
+
+    prompt = create_batch_repair_prompt(prompts, {2: plot}, {2: problems})
+
+    assert "=== PLOT 3 ===" in prompt
+    assert "Plot C request" in prompt
+    assert "Plot A request" not in prompt and "=== PLOT 1 ===" not in prompt
+    assert "crops[0]" in prompt
+
+
+def test_split_batch_repair_keys_repairs_by_position():
+    repair = {"plots": [{"plot": 3, "crops": []}, {"plot": "1"}, "junk", {"plot": 1, "crops": []}]}
+
+    assert sorted(split_batch_repair(repair)) == [0, 2]
+    assert split_batch_repair({"plots": None}) == {}
+
+
+# --- response_schema ---
+
+def test_response_schema_inlines_refs_and_requires_every_field():
+    schema = response_schema(GeminiPrediction)
+    text = json.dumps(schema)
+
+    assert "$ref" not in text and "$defs" not in text
+    assert schema["required"] == ["crops", "yield_data", "crop_timeline", "best_sowing_time"]
+    crop = schema["properties"]["crops"]["items"]
+    assert crop["type"] == "object"
+    assert crop["required"] == ["name", "water_required_liters"]
+
+
+def test_response_schema_drops_validation_keywords():
+    text = json.dumps(response_schema(GeminiPrediction))
+
+    for keyword in ("minimum", "exclusiveMinimum", "minLength", "minItems", "title"):
+        assert f'"{keyword}"' not in text
+
+
+def test_response_schema_marks_optional_fields_nullable():
+    schema = response_schema(GeminiPredictionRepair)
+
+    assert schema["properties"]["best_sowing_time"] == {"type": "string", "nullable": True}
+    assert "index" in schema["properties"]["yield_data"]["items"]["required"]
+    plot = response_schema(GeminiBatchPredictionRepair)["properties"]["plots"]["items"]
+    assert "plot" in plot["required"]
+
+
+# --- repairs in the app ---
+
+class RepairingModel(FakeGenerativeModel):
+    """Answers with one invalid entry per plot, then repairs it; every prompt is recorded"""
+
+    prompts = []
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        prompt = str(contents)
+        self.prompts.append(prompt)
+        if "some parts of your JSON were invalid" in prompt:
+            timeline = [{**valid_prediction()["crop_timeline"][0], "index": 0}]
+            fix = {"crops": [], "yield_data": [], "crop_timeline": timeline, "best_sowing_time": None}
+            if "=== PLOT" in prompt:
+                text = json.dumps({"plots": [{**fix, "plot": number} for number in (1, 2)]})
+            else:
+                text = json.dumps(fix)
+        else:
+            plot = valid_prediction()
+            plot["crop_timeline"][0]["suitable_months"] = ["Smarch"]
+            plots = prompt.count("=== PLOT")
+            text = json.dumps({"plots": [plot] * plots} if plots else plot)
+        if stream:
+            return self._stream(text, 0.01)
+        return FakeResponse(text)
+
+
+@pytest.fixture
+def repairing_app(app_module, monkeypatch):
+    monkeypatch.setattr(RepairingModel, "prompts", [])
+    monkeypatch.setattr(app_module, "gemini_model_class", RepairingModel)
+    return app_module
+
+
+def test_a_packed_answer_is_repaired_in_one_call(repairing_app):
+    items = [{"land_area": 43560, "latitude": 12.0 + index * 2, "longitude": 77.0, "soil_type": "Loamy"}
+             for index in range(2)]
+
+    async def scenario():
+        async with api_client(repairing_app) as client:
+            return await client.post("/predict/batch", json={"items": items})
+
+    body = run(scenario()).json()
+
+    assert len(RepairingModel.prompts) == 2
+    assert "=== PLOT 1 ===" in RepairingModel.prompts[1] and "=== PLOT 2 ===" in RepairingModel.prompts[1]
+    assert body["stats"]["gemini_calls"] == 2
+    for result in body["results"]:
+        assert result["status_code"] == 200
+        assert result["result"]["prediction_source"] == "gemini"
+        assert len(result["result"]["crop_timeline"]) == 3
+
+
+def test_the_stream_repairs_invalid_entries_and_resends_the_section(repairing_app):
+    plot = {"land_area": 43560, "latitude": 12.0, "longitude": 77.0, "soil_type": "Loamy"}
+
+    async def scenario():
+        async with api_client(repairing_app) as client:
+            return await client.post("/predict/stream", json=plot)
+
+    events = [(block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+              for block in run(scenario()).text.strip().split("\n\n")]
+    timelines = [data["crop_timeline"] for name, data in events if name == "crop_timeline"]
+    done = dict(events)["done"]
+
+    assert len(RepairingModel.prompts) == 2
+    assert len(timelines) == 2
+    assert timelines[0][0]["suitable_months"] == ["Smarch"]
+    assert len(timelines[1]) == 3
+    assert done["crop_timeline"] == timelines[1]
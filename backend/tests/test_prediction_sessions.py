@@ -0,0 +1,220 @@
+"""PredictionSessionStore, prediction_id lookups in /ask and the Gemini context cache"""
+import threading
+
+import pytest
+
+import prediction_sessions
+from conftest import api_client, run
+from fake_upstreams import FakeGenerativeModel
+from prediction_sessions import PredictionSessionStore
+
+QUESTION = "Explain how I can improve my soil before sowing"
+PREFIX_MARKER = "You are an agricultural assistant chatbot"
+
+
+def prediction(number: int) -> dict:
+    return {"crops": [{"name": f"Crop {number}", "water_required_liters": 1000.0 + number}]}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(prediction_sessions.time, "time", fake)
+    return fake
+
+
+# --- PredictionSessionStore ---
+
+def test_ids_are_content_hashes():
+    store = PredictionSessionStore()
+
+    first = store.save(prediction(1))
+    assert store.save({**prediction(1)}) == first
+    assert store.save(prediction(2)) != first
+    assert len(first) == 32
+    assert store.stats["created"] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    store = PredictionSessionStore(ttl_seconds=60)
+    prediction_id = store.save(prediction(1))
+
+    clock.now += 59
+    assert store.get(prediction_id) == prediction(1)
+    clock.now += 2
+    assert store.get(prediction_id) is None
+    assert store.stats["misses"] == 1
+
+
+def test_saving_again_extends_the_ttl(clock):
+    store = PredictionSessionStore(ttl_seconds=60)
+    prediction_id = store.save(prediction(1))
+    clock.now += 50
+    store.save(prediction(1))
+    clock.now += 50
+
+    assert store.get(prediction_id) == prediction(1)
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    store = PredictionSessionStore(max_entries=2)
+    first, second = store.save(prediction(1)), store.save(prediction(2))
+    store.get(first)
+    store.save(prediction(3))
+
+    assert store.get(second) is None
+    assert store.get(first) == prediction(1)
+    assert store.get_stats()["entries"] == 2
+
+
+def test_evicted_entries_are_spilled_and_reloaded(tmp_path):
+    store = PredictionSessionStore(max_entries=1, spill_path=str(tmp_path / "sessions.db"))
+    first = store.save(prediction(1))
+    store.save(prediction(2))
+    assert store.get_stats()["spilled_entries"] == 1
+
+    assert store.get(first) == prediction(1)
+    # Loading it back evicted the other one in turn
+    assert store.stats["spill_hits"] == 1
+    assert store.get_stats()["spilled_entries"] == 1
+    assert store.get_stats()["entries"] == 1
+
+
+def test_expired_spilled_entries_are_not_reloaded(tmp_path, clock):
+    store = PredictionSessionStore(max_entries=1, ttl_seconds=60, spill_path=str(tmp_path / "sessions.db"))
+    first = store.save(prediction(1))
+    store.save(prediction(2))
+    clock.now += 61
+
+    assert store.get(first) is None
+    assert store.get_stats()["spilled_entries"] == 0
+
+
+def test_derived_values_are_built_once():
+    store = PredictionSessionStore()
+    prediction_id = store.save(prediction(1))
+    builds = []
+
+    def build(data):
+        builds.append(data)
+        return "context"
+
+    assert store.get_derived(prediction_id, "context", build) == "context"
+    assert store.get_derived(prediction_id, "context", build) == "context"
+    assert len(builds) == 1
+    assert store.get_derived("unknown", "context", build) is None
+
+
+def test_async_spill_io_runs_off_the_event_loop(tmp_path, monkeypatch):
+    store = PredictionSessionStore(max_entries=1, spill_path=str(tmp_path / "sessions.db"))
+    threads = []
+    for name in ("_spill", "_take_spilled"):
+        method = getattr(store, name)
+        monkeypatch.setattr(store, name, lambda *args, method=method: threads.append(threading.get_ident())
+                            or method(*args))
+
+    async def scenario():
+        first = await store.save_async(prediction(1))
+        await store.save_async(prediction(2))
+        return threading.get_ident(), await store.get_async(first)
+
+    loop_thread, reloaded = run(scenario())
+
+    assert reloaded == prediction(1)
+    assert len(threads) == 3
+    assert loop_thread not in threads
+
+
+# --- /ask with a prediction_id ---
+
+class RecordingModel(FakeGenerativeModel):
+    """Records what each chatbot call sends and which cached content it was built from"""
+
+    calls = []
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", cached_content=None, **kwargs):
+        super().__init__(model_name)
+        self.cached_content = cached_content
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        return cls(cached_content=cached_content)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        self.calls.append((self.cached_content, str(contents)))
+        return await super().generate_content_async(contents, stream=stream, **kwargs)
+
+
+@pytest.fixture
+def ask_app(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "gemini_model_class", RecordingModel)
+    monkeypatch.setattr(RecordingModel, "calls", [])
+    return app_module
+
+
+def predict_then_ask(app_module, questions: int = 1) -> list:
+    plot = {"land_area": 43560, "latitude": 12.0, "longitude": 77.5, "soil_type": "Loamy"}
+
+    async def scenario():
+        async with api_client(app_module) as client:
+            prediction_id = (await client.post("/predict", json=plot)).json()["prediction_id"]
+            return [await client.post("/ask", json={"question": QUESTION, "prediction_id": prediction_id})
+                    for _ in range(questions)]
+
+    return run(scenario())
+
+
+def test_an_unknown_prediction_id_is_a_404(app_module):
+    async def scenario():
+        async with api_client(app_module) as client:
+            return await client.post("/ask", json={"question": QUESTION, "prediction_id": "not-a-real-id"})
+
+    response = run(scenario())
+
+    assert response.status_code == 404
+    assert response.json()["detail"].startswith("PREDICTION_NOT_FOUND")
+
+
+def test_a_context_cache_failure_falls_back_to_the_full_prompt(ask_app, monkeypatch):
+    from google.generativeai import caching
+
+    creates = []
+
+    def create(**kwargs):
+        creates.append(kwargs)
+        raise ValueError("400 Cached content is too small")
+
+    monkeypatch.setattr(ask_app, "GEMINI_CONTEXT_CACHE_TTL", 600)
+    monkeypatch.setattr(caching.CachedContent, "create", create)
+
+    responses = predict_then_ask(ask_app, questions=2)
+
+    assert all(response.status_code == 200 and response.json()["answer"] for response in responses)
+    chatbot_calls = [call for call in RecordingModel.calls if QUESTION in call[1]]
+    assert len(chatbot_calls) == 2
+    # No cached content, so the instructions and dataset are sent with the question
+    assert all(cached is None and PREFIX_MARKER in contents for cached, contents in chatbot_calls)
+    # The failure is remembered, so the second question doesn't try again
+    assert len(creates) == 1
+
+
+def test_a_context_cache_sends_only_the_question_part(ask_app, monkeypatch):
+    from google.generativeai import caching
+
+    monkeypatch.setattr(ask_app, "GEMINI_CONTEXT_CACHE_TTL", 600)
+    monkeypatch.setattr(caching.CachedContent, "create", lambda **kwargs: "cached-prefix")
+
+    responses = predict_then_ask(ask_app, questions=2)
+
+    assert all(response.status_code == 200 for response in responses)
+    chatbot_calls = [call for call in RecordingModel.calls if QUESTION in call[1]]
+    assert [cached for cached, _ in chatbot_calls] == ["cached-prefix", "cached-prefix"]
+    assert all(PREFIX_MARKER not in contents for _, contents in chatbot_calls)
@@ -0,0 +1,101 @@
+"""Coalesced /predict calls: each caller's deadline and disconnect only affect that caller"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from conftest import api_client, fixed_latency, run
+
+PLOT = {"land_area": 43560, "latitude": 12.0, "longitude": 77.0, "soil_type": "Loamy"}
+
+
+@pytest.fixture
+def slow_gemini(app_module, monkeypatch):
+    from fake_upstreams import FakeGenerativeModel
+    from single_flight import SingleFlight
+
+    monkeypatch.setattr(FakeGenerativeModel, "faults", fixed_latency(300))
+    monkeypatch.setattr(app_module, "predict_flight", SingleFlight("predict"))
+    return app_module
+
+
+def disconnecting_request(after: float) -> Request:
+    """A /predict Request whose client goes away after seconds"""
+    async def receive():
+        await asyncio.sleep(after)
+        return {"type": "http.disconnect"}
+
+    scope = {"type": "http", "method": "POST", "path": "/predict", "headers": [], "query_string": b"",
+             "scheme": "http", "server": ("api.test", 80)}
+    return Request(scope, receive)
+
+
+def test_a_short_deadline_does_not_cut_the_shared_prediction_short(slow_gemini):
+    async def scenario():
+        async with api_client(slow_gemini) as client:
+            short = asyncio.ensure_future(client.post("/predict", json=PLOT, headers={"X-Request-Timeout": "0.1"}))
+            await asyncio.sleep(0.01)
+            long = asyncio.ensure_future(client.post("/predict", json=PLOT))
+            return await short, await long
+
+    short, long = run(scenario())
+
+    assert short.status_code == 200 and long.status_code == 200
+    # The short caller stops waiting and falls back; the shared call still finishes for the other
+    assert short.json()["prediction_source"] == "local"
+    assert long.json()["prediction_source"] == "gemini"
+    assert slow_gemini.predict_flight.stats["coalesced"] == 1
+    assert slow_gemini.predict_flight.stats["deadline_exceeded"] == 1
+
+
+def test_without_local_fallback_a_short_deadline_gets_the_partial_payload(slow_gemini, monkeypatch):
+    monkeypatch.setattr(slow_gemini, "CROP_ENGINE_MODE", "gemini")
+
+    async def scenario():
+        async with api_client(slow_gemini) as client:
+            return await client.post("/predict", json=PLOT, headers={"X-Request-Timeout": "0.1"})
+
+    body = run(scenario()).json()
+
+    assert body["partial"] is True
+    assert body["prediction_source"] is None
+    assert body["crops"] == []
+    assert body["soil_info"] and body["climate_data"]
+
+
+def test_a_disconnected_client_gets_a_499_and_the_work_is_cancelled(slow_gemini):
+    from app import CropPredictionRequest
+
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            await slow_gemini.predict_crop(CropPredictionRequest(**PLOT), disconnecting_request(0.05))
+        await asyncio.sleep(0)
+        return error.value
+
+    error = run(scenario())
+
+    assert error.status_code == 499
+    assert slow_gemini.predict_flight.stats["abandoned"] == 1
+    assert slow_gemini.predict_flight.get_stats()["in_flight"] == 0
+
+
+def test_the_work_goes_on_until_the_last_coalesced_client_leaves(slow_gemini):
+    from app import CropPredictionRequest
+
+    async def scenario():
+        gone = asyncio.ensure_future(
+            slow_gemini.predict_crop(CropPredictionRequest(**PLOT), disconnecting_request(0.05))
+        )
+        staying = asyncio.ensure_future(
+            slow_gemini.predict_crop(CropPredictionRequest(**PLOT), disconnecting_request(5))
+        )
+        results = await asyncio.gather(gone, staying, return_exceptions=True)
+        await asyncio.sleep(0)
+        return results
+
+    gone, staying = run(scenario())
+
+    assert isinstance(gone, HTTPException) and gone.status_code == 499
+    assert staying["prediction_source"] == "gemini"
+    assert slow_gemini.predict_flight.stats["abandoned"] == 0
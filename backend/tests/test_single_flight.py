@@ -0,0 +1,162 @@
+"""Request coalescing: shared results, deadline isolation between callers, and cancellation"""
+import asyncio
+
+import pytest
+
+import deadlines
+from conftest import run
+from deadlines import DeadlineExceeded
+from single_flight import SingleFlight, canonical_key
+
+
+async def call_with_deadline(flight: SingleFlight, key, work, seconds: float = None, deadline: float = None):
+    """flight.run as a request with its own deadline of seconds (None: no deadline) would call it"""
+    token = deadlines.start(seconds) if seconds is not None else None
+    try:
+        return await flight.run(key, work, deadline=deadline)
+    finally:
+        if token is not None:
+            deadlines.reset(token)
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def scenario():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+        return flight, results
+
+    flight, results = run(scenario())
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats["leaders"] == 1 and flight.stats["coalesced"] == 4
+
+
+def test_errors_reach_every_caller():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("GEMINI_API_ERROR: boom")
+
+    async def scenario():
+        flight = SingleFlight("test")
+        return flight, await asyncio.gather(*(flight.run("key", work) for _ in range(3)), return_exceptions=True)
+
+    flight, results = run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats["errors"] == 1
+
+
+def test_the_leaders_short_deadline_does_not_cut_the_work_short_for_others():
+    seen = {}
+
+    async def work():
+        seen["remaining"] = deadlines.remaining()
+        # Like a stage sized from the request's time left
+        await deadlines.run_within(asyncio.sleep(0.2), "gemini")
+        return "result"
+
+    async def scenario():
+        flight = SingleFlight("test")
+        leader = asyncio.ensure_future(call_with_deadline(flight, "key", work, seconds=0.05, deadline=5.0))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(call_with_deadline(flight, "key", work, seconds=5.0, deadline=5.0))
+        return flight, await asyncio.gather(leader, follower, return_exceptions=True)
+
+    flight, (leader, follower) = run(scenario())
+    assert isinstance(leader, DeadlineExceeded)
+    assert follower == "result"
+    # The work ran under the deadline passed to run, not the leader's 50 ms
+    assert 4.5 < seen["remaining"] <= 5.0
+    assert flight.stats["deadline_exceeded"] == 1
+    assert flight.stats["abandoned"] == 0
+
+
+def test_work_runs_without_a_deadline_unless_given_one():
+    seen = {}
+
+    async def work():
+        seen["remaining"] = deadlines.remaining()
+        return "result"
+
+    assert run(call_with_deadline(SingleFlight("test"), "key", work, seconds=1.0)) == "result"
+    assert seen["remaining"] is None
+
+
+def test_a_caller_without_a_deadline_waits_for_the_result():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    assert run(call_with_deadline(SingleFlight("test"), "key", work, deadline=0.01)) == "result"
+
+
+def test_work_is_cancelled_when_every_caller_runs_out_of_time():
+    state = {"cancelled": False}
+
+    async def work():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def scenario():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(
+            call_with_deadline(flight, "key", work, seconds=0.05),
+            call_with_deadline(flight, "key", work, seconds=0.1),
+            return_exceptions=True
+        )
+        await asyncio.sleep(0)
+        return flight, results
+
+    flight, results = run(scenario())
+    assert all(isinstance(result, DeadlineExceeded) for result in results)
+    assert state["cancelled"]
+    assert flight.stats["abandoned"] == 1
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_work_is_cancelled_only_when_the_last_caller_is():
+    state = {"cancelled": False}
+
+    async def work():
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        return "result"
+
+    async def scenario():
+        flight = SingleFlight("test")
+        first = asyncio.ensure_future(flight.run("key", work))
+        second = asyncio.ensure_future(flight.run("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        second_result = await second
+        assert not state["cancelled"]
+
+        third = asyncio.ensure_future(flight.run("other", work))
+        await asyncio.sleep(0.01)
+        third.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await third
+        await asyncio.sleep(0)
+        return flight, second_result
+
+    flight, second_result = run(scenario())
+    assert second_result == "result"
+    assert state["cancelled"]
+    assert flight.stats["abandoned"] == 1
+
+
+def test_canonical_key_ignores_dict_order():
+    assert canonical_key("predict", {"a": 1, "b": 2}) == canonical_key("predict", {"b": 2, "a": 1})
+    assert canonical_key("predict", {"a": 1}) != canonical_key("ask", {"a": 1})
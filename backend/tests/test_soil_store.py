@@ -0,0 +1,145 @@
+"""SoilStore lookups by id, nearest location and type, hot reloads, and soil records in prediction cache keys"""
+import json
+import os
+
+import pytest
+
+from soil_store import SoilStore
+
+LOAMY_PROFILE = {"id": 1, "type": "Loamy", "water_retention": "High"}
+NEAR_SENSOR = {"id": "S1", "type": "Loamy", "latitude": 12.0, "longitude": 77.5, "water_retention": "Medium"}
+FAR_SENSOR = {"id": "S2", "type": "Loamy", "latitude": 12.3, "longitude": 77.5, "water_retention": "Low"}
+SANDY_SENSOR = {"id": "S3", "type": "Sandy", "latitude": 12.01, "longitude": 77.5, "water_retention": "Low"}
+RECORDS = [LOAMY_PROFILE, NEAR_SENSOR, FAR_SENSOR, SANDY_SENSOR]
+
+
+def write_soil(path, records: list, mtime: float = None):
+    path.write_text(json.dumps({"soil_data": records}))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def soil_path(tmp_path):
+    path = tmp_path / "iot_data.json"
+    write_soil(path, RECORDS, mtime=1_000_000)
+    return path
+
+
+def reload(store: SoilStore):
+    """Check the file now and wait for any reload it starts"""
+    store.snapshot()
+    with store._reload_lock:
+        pass
+
+
+# --- Lookups ---
+
+def test_a_soil_id_wins_over_location_and_type(soil_path):
+    store = SoilStore(str(soil_path))
+
+    assert store.find("Loamy", soil_id="S2", latitude=12.0, longitude=77.5, max_distance_km=25) == FAR_SENSOR
+    assert store.find("Loamy", soil_id=1) == LOAMY_PROFILE
+    # An unknown id falls through to the location
+    assert store.find("Loamy", soil_id="S9", latitude=12.0, longitude=77.5, max_distance_km=25) == NEAR_SENSOR
+    assert store.stats["id_hits"] == 2
+
+
+def test_the_nearest_record_of_the_type_within_range_comes_next(soil_path):
+    store = SoilStore(str(soil_path))
+
+    # The Sandy sensor is closer, but it is another type
+    assert store.find("Loamy", latitude=12.01, longitude=77.5, max_distance_km=25) == NEAR_SENSOR
+    assert store.find("Loamy", latitude=12.25, longitude=77.5, max_distance_km=25) == FAR_SENSOR
+    assert store.stats["nearest_hits"] == 2
+
+
+def test_the_type_profile_is_used_when_no_record_is_in_range(soil_path):
+    store = SoilStore(str(soil_path))
+
+    # S1 is about 22 km away
+    assert store.find("Loamy", latitude=12.2, longitude=77.5, max_distance_km=10) == LOAMY_PROFILE
+    assert store.find("Loamy", latitude=20.0, longitude=77.5, max_distance_km=25) == LOAMY_PROFILE
+    assert store.find("Loamy") == LOAMY_PROFILE
+    assert store.find("Chalky", latitude=12.0, longitude=77.5, max_distance_km=25) is None
+    assert (store.stats["type_hits"], store.stats["misses"]) == (3, 1)
+
+
+def test_types_are_matched_without_case_or_spaces(soil_path):
+    store = SoilStore(str(soil_path))
+
+    assert store.by_type(" LOAMY ") == LOAMY_PROFILE
+    # A type with only sensor records uses one of them as its profile
+    assert store.find("sandy") == SANDY_SENSOR
+    assert store.find("sAnDy", latitude=12.0, longitude=77.5, max_distance_km=25) == SANDY_SENSOR
+
+
+# --- Reloads ---
+
+def test_a_changed_file_is_reloaded(soil_path):
+    store = SoilStore(str(soil_path), check_interval=0)
+    write_soil(soil_path, [{**LOAMY_PROFILE, "water_retention": "Low"}], mtime=1_000_100)
+
+    reload(store)
+
+    assert store.by_type("loamy")["water_retention"] == "Low"
+    assert store.get("S1") is None
+    assert store.get_stats()["reloads"] == 1
+    assert store.get_stats()["records"] == 1
+
+
+def test_an_unchanged_mtime_is_not_reloaded(soil_path):
+    store = SoilStore(str(soil_path), check_interval=0)
+    write_soil(soil_path, [], mtime=1_000_000)
+
+    reload(store)
+
+    assert store.get_stats()["reloads"] == 0
+    assert store.get_stats()["records"] == len(RECORDS)
+
+
+def test_a_file_that_fails_to_parse_keeps_the_previous_snapshot(soil_path):
+    store = SoilStore(str(soil_path), check_interval=0)
+    soil_path.write_text('{"soil_data": [')
+    os.utime(soil_path, (1_000_100, 1_000_100))
+
+    reload(store)
+
+    assert store.get_stats()["reload_errors"] == 1
+    # get_stats doesn't check the file, so it shows the snapshot in use without starting another attempt
+    assert store.get_stats()["records"] == len(RECORDS)
+    # Once the file is fixed, the next check loads it
+    write_soil(soil_path, [LOAMY_PROFILE], mtime=1_000_200)
+    reload(store)
+    assert store.get_stats()["records"] == 1
+
+
+def test_a_missing_file_leaves_the_store_empty(tmp_path):
+    store = SoilStore(str(tmp_path / "missing.json"))
+
+    assert store.find("Loamy") is None
+    assert store.get_stats()["records"] == 0
+
+
+# --- Prediction cache keys ---
+
+def test_each_soil_record_gets_its_own_cache_key(app_module, soil_path, monkeypatch):
+    monkeypatch.setattr(app_module, "soil_store", SoilStore(str(soil_path)))
+    monkeypatch.setattr(app_module, "SOIL_NEAREST_MAX_KM", 25)
+    climate = {"avg_temp": 25.0, "avg_soil_moisture": 0.4, "avg_surface_temp": 26.0, "total_rainfall": 90.0}
+
+    def cache_key(**fields):
+        request = app_module.CropPredictionRequest(
+            **{"land_area": 43560, "latitude": 12.0, "longitude": 77.5, "soil_type": "Loamy", **fields}
+        )
+        return app_module.prediction_cache_key(request, climate, app_module.get_soil_info(request))
+
+    near = cache_key()
+    # Same cell and type, but a soil_id picks another record
+    assert cache_key(soil_id="S2") != near
+    assert cache_key(soil_id="S1") == near
+    assert cache_key(soil_id="1") != near
+    # Another point in the cell resolving to the same sensor shares the prediction
+    assert cache_key(latitude=12.1, longitude=77.6) == near
+    # Far from every sensor, the type profile is used
+    assert cache_key(latitude=14.0, longitude=77.5)[0] == cache_key(soil_id="1")[0]
@@ -0,0 +1,241 @@
+"""Hot pair ranking, the warm-up window, the request key log and the warm-up's Gemini budget"""
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import warmup
+from conftest import run
+from warmup import CacheWarmer, RequestKeyLog, rank_hot_pairs, seconds_until_window
+
+NOW = 1_760_000_000.0
+HOUR = 3600
+
+
+def record(latitude: float, longitude: float, soil_type: str = "Loamy", age_hours: float = 0.0,
+           land_area: int = 43560, soil_id: str = None) -> dict:
+    return {"ts": NOW - age_hours * HOUR, "latitude": latitude, "longitude": longitude,
+            "soil_type": soil_type, "land_area": land_area, "soil_id": soil_id}
+
+
+# --- rank_hot_pairs ---
+
+def test_pairs_are_ranked_by_request_count():
+    records = [record(12.0, 77.0)] * 3 + [record(20.0, 78.0)] * 5 + [record(25.0, 80.0)]
+    hot = rank_hot_pairs(records, top=2, now=NOW)
+
+    assert [(pair["latitude"], pair["requests"]) for pair in hot] == [(20.0, 5), (12.0, 3)]
+
+
+def test_older_requests_weigh_less():
+    records = [record(12.0, 77.0, age_hours=72)] * 3 + [record(20.0, 78.0)] * 2
+    hot = rank_hot_pairs(records, top=2, half_life_hours=72, now=NOW)
+
+    assert hot[0]["latitude"] == 20.0
+    assert hot[0]["score"] == 2.0
+    assert hot[1]["score"] == 1.5
+
+
+def test_requests_past_the_lookback_are_ignored_and_undated_ones_count_fully():
+    records = [record(12.0, 77.0, age_hours=15 * 24)] * 5 + [{**record(20.0, 78.0), "ts": None}]
+    hot = rank_hot_pairs(records, top=5, lookback_days=14, now=NOW)
+
+    assert [(pair["latitude"], pair["score"]) for pair in hot] == [(20.0, 1.0)]
+
+
+def test_points_in_one_cell_and_soil_type_are_one_pair():
+    records = [record(12.01, 77.01, "loamy", land_area=1000), record(12.02, 77.02, "Loamy", land_area=3000),
+               record(12.02, 77.02, "Loamy", land_area=5000), record(12.02, 77.02, "Clay")]
+    hot = rank_hot_pairs(records, top=5, now=NOW)
+
+    assert len(hot) == 2
+    loamy = hot[0]
+    assert loamy["requests"] == 3
+    # The most requested point and the median land area stand for the pair
+    assert (loamy["latitude"], loamy["longitude"], loamy["soil_type"]) == (12.02, 77.02, "Loamy")
+    assert loamy["land_area"] == 3000
+
+
+# --- seconds_until_window ---
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 3, 1, hour, minute, tzinfo=timezone.utc)
+
+
+def test_the_window_is_open_between_its_hours():
+    assert seconds_until_window((0, 2), at(0)) == 0.0
+    assert seconds_until_window((0, 2), at(1, 59)) == 0.0
+    assert seconds_until_window((0, 2), at(2)) == 22 * HOUR
+
+
+def test_a_window_opens_later_today_or_tomorrow():
+    assert seconds_until_window((3, 5), at(1, 30)) == 1.5 * HOUR
+    assert seconds_until_window((3, 5), at(6)) == 21 * HOUR
+
+
+def test_a_window_can_span_midnight():
+    assert seconds_until_window((22, 2), at(23)) == 0.0
+    assert seconds_until_window((22, 2), at(1)) == 0.0
+    assert seconds_until_window((22, 2), at(12)) == 10 * HOUR
+
+
+# --- RequestKeyLog ---
+
+def read_lines(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_recorded_keys_are_written_by_the_writer_thread(tmp_path):
+    path = tmp_path / "keys.jsonl"
+    key_log = RequestKeyLog(str(path))
+    for index in range(50):
+        key_log.record(12.0, 77.0 + index, "Loamy", 43560, soil_id="S1" if index == 0 else None)
+    key_log.flush()
+
+    lines = read_lines(path)
+    assert len(lines) == 50
+    assert lines[0]["soil_id"] == "S1" and "soil_id" not in lines[1]
+    key_log.close()
+
+
+def test_trim_drops_records_past_the_lookback(tmp_path, monkeypatch):
+    path = tmp_path / "keys.jsonl"
+    old = {"ts": NOW - 20 * 24 * HOUR, "latitude": 1.0, "longitude": 1.0, "soil_type": "Clay", "land_area": 1}
+    path.write_text(json.dumps(old) + "\n" + json.dumps({**old, "ts": NOW}) + "\n", encoding="utf-8")
+    monkeypatch.setattr(warmup.time, "time", lambda: NOW)
+    key_log = RequestKeyLog(str(path))
+
+    key_log.trim(NOW - 14 * 24 * HOUR)
+    key_log.record(2.0, 2.0, "Clay", 1)
+    key_log.close()
+
+    assert [line["latitude"] for line in read_lines(path)] == [1.0, 2.0]
+    assert all(line["ts"] == NOW for line in read_lines(path))
+
+
+def test_a_log_replaced_by_another_worker_is_reopened(tmp_path):
+    path = tmp_path / "keys.jsonl"
+    key_log = RequestKeyLog(str(path))
+    other = RequestKeyLog(str(path))
+    other.record(1.0, 1.0, "Clay", 1)
+    other.flush()
+
+    # Trimming every record so far replaces the file under the other writer
+    key_log.trim(float("inf"))
+    other.record(2.0, 2.0, "Clay", 1)
+    other.close()
+    key_log.close()
+
+    assert [line["latitude"] for line in read_lines(path)] == [2.0]
+
+
+# --- CacheWarmer ---
+
+def write_keys(path, pairs: int):
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(pairs):
+            f.write(json.dumps({**record(10.0 + index * 2, 77.0), "ts": time.time()}) + "\n")
+
+
+def test_the_budget_counts_actual_gemini_calls(tmp_path):
+    path = tmp_path / "keys.jsonl"
+    write_keys(path, 4)
+    spending = iter([2, 1, 1, 1])
+    allowed = []
+
+    async def warm_pair(pair: dict, allow_gemini: bool):
+        allowed.append(allow_gemini)
+        if not allow_gemini:
+            return "climate_only", None, 0
+        return "predicted", pair["latitude"], next(spending)
+
+    warmer = CacheWarmer(warm_pair, [str(path)], max_gemini_calls=5, concurrency=1)
+    report = run(warmer.run_once())
+
+    # Each pair reserves 2; after 2 + 1 + 1 spent, a fourth reservation would overshoot the 5
+    assert allowed == [True, True, True, False]
+    assert report["gemini_calls"] == 4
+
+
+def test_a_failed_pair_gives_its_reservation_back(tmp_path):
+    path = tmp_path / "keys.jsonl"
+    write_keys(path, 2)
+
+    async def warm_pair(pair: dict, allow_gemini: bool):
+        raise OSError("no climate")
+
+    report = run(CacheWarmer(warm_pair, [str(path)], max_gemini_calls=2).run_once())
+
+    assert report["pairs_failed"] == 2
+    assert report["gemini_calls"] == 0
+
+
+@pytest.mark.skipif(warmup.fcntl is None, reason="no file locks on this platform")
+def test_only_the_lock_holder_warms(tmp_path):
+    path = tmp_path / "keys.jsonl"
+    write_keys(path, 1)
+    lock_path = str(tmp_path / "warmup.lock")
+    runs = []
+
+    async def warm_pair(pair: dict, allow_gemini: bool):
+        runs.append(pair)
+        return "climate_only", None, 0
+
+    first = CacheWarmer(warm_pair, [str(path)], lock_path=lock_path)
+    second = CacheWarmer(warm_pair, [str(path)], lock_path=lock_path)
+    run(first._run_safely())
+    run(second._run_safely())
+
+    assert len(runs) == 1
+    assert second.stats["runs_skipped"] == 1
+
+    # Once the holder is gone, the next worker's run goes ahead
+    first.release_lock()
+    run(second._run_safely())
+    assert len(runs) == 2
+
+
+@pytest.mark.skipif(warmup.fcntl is None, reason="no file locks on this platform")
+def test_shutdown_lets_the_warmup_unwind_before_releasing_its_lock(app_module, tmp_path, monkeypatch):
+    path = tmp_path / "keys.jsonl"
+    write_keys(path, 1)
+    events = []
+
+    async def warm_pair(pair: dict, allow_gemini: bool):
+        events.append("started")
+        try:
+            await asyncio.sleep(60)
+        finally:
+            events.append(("unwound holding the lock", warmer._lock_file is not None))
+
+    warmer = CacheWarmer(warm_pair, [str(path)], on_startup=True, lock_path=str(tmp_path / "warmup.lock"))
+    monkeypatch.setattr(app_module, "cache_warmer", warmer)
+    monkeypatch.setattr(app_module, "request_key_log", None)
+
+    async def scenario():
+        async with app_module.lifespan(app_module.app):
+            while "started" not in events:
+                await asyncio.sleep(0.01)
+
+    run(scenario())
+
+    assert events == ["started", ("unwound holding the lock", True)]
+    assert warmer._lock_file is None
+
+
+def test_warm_prediction_reports_the_gemini_calls_it_spent(app_module):
+    pair = {"land_area": 43560, "latitude": 12.0, "longitude": 77.0, "soil_type": "Loamy", "soil_id": None,
+            "cell": (12.0, 77.0)}
+
+    async def scenario():
+        first = await app_module.warm_prediction(pair, allow_gemini=True)
+        second = await app_module.warm_prediction(pair, allow_gemini=True)
+        return first, second
+
+    (outcome, cache_key, calls), second = run(scenario())
+
+    assert (outcome, calls) == ("predicted", 1)
+    assert second == ("cached", cache_key, 0)
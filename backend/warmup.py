@@ -0,0 +1,375 @@
+"""
+Cache warm-up for hot locations and soil types.
+
+Traffic is seasonal and concentrated: before Kharif and Rabi sowing, most
+/predict calls come from the same districts. RequestKeyLog appends the
+location and soil type of each /predict to a JSON-lines file. CacheWarmer
+then does the following:
+- ranks (POWER cell, soil type) pairs from that log, or from sample files
+  in the same format or as CSV, by recency-weighted request count
+- fetches climate and predictions for the hottest pairs in an off-peak
+  window, so peak-hour requests are cache hits
+- makes at most max_gemini_calls prediction calls per run, at batch
+  priority so live requests go first
+- counts how many later /predict lookups the warm set served
+
+Only one worker process warms: the others find the lock file taken and
+skip their run. Before ranking, that worker trims request keys older than
+lookback_days from the log so it doesn't grow without bound.
+
+Rank a log without warming anything:
+
+    python warmup.py rank predict_keys.jsonl --top 20
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import queue
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from climate_cache import cell_for
+
+try:
+    import fcntl
+except ImportError:  # Windows: no warm-up lock, every worker warms
+    fcntl = None
+
+
+class RequestKeyLog:
+    """
+    Append-only JSON-lines log of /predict request keys. record() only queues the line;
+    a writer thread does the file I/O, so it never blocks the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_lines, name="request-key-log", daemon=True)
+        self._thread.start()
+
+    def record(self, latitude: float, longitude: float, soil_type: str, land_area: int, soil_id: str = None):
+        entry = {"ts": round(time.time(), 1), "latitude": latitude, "longitude": longitude,
+                 "soil_type": soil_type, "land_area": land_area}
+        if soil_id is not None:
+            entry["soil_id"] = soil_id
+        self._queue.put(json.dumps(entry) + "\n")
+
+    def flush(self):
+        """Block until every line recorded so far is written"""
+        self._queue.join()
+
+    def trim(self, oldest: float):
+        """Drop the records older than oldest (epoch seconds) from the file; blocks until done"""
+        self._queue.put(lambda: self._trim(oldest))
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write_lines(self):
+        while True:
+            # Write whatever queued up meanwhile with one flush
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._reopen_if_replaced()
+                for item in items:
+                    if item is None:
+                        self._file.close()
+                        return
+                    if callable(item):
+                        item()
+                    else:
+                        self._file.write(item)
+                self._file.flush()
+            except OSError as e:
+                print(f"Warning: could not write the request key log {self.path}: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _reopen_if_replaced(self):
+        # Another worker may have trimmed the file, replacing it
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self._file.close()
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def _trim(self, oldest: float):
+        self._file.flush()
+        kept, dropped = [], 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                ts = _json_line(line).get("ts")
+                if isinstance(ts, (int, float)) and ts < oldest:
+                    dropped += 1
+                else:
+                    kept.append(line)
+        if not dropped:
+            return
+        # Lines other workers append between the read and the replace are lost; they reopen the new file
+        trimmed_path = f"{self.path}.trim"
+        with open(trimmed_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(trimmed_path, self.path)
+        self._file.close()
+        self._file = open(self.path, "a", encoding="utf-8")
+        print(f"Request key log: trimmed {dropped} records older than the lookback")
+
+
+def read_request_keys(paths: list) -> list:
+    """Request key records from JSON-lines logs and .csv sample files; malformed lines are skipped"""
+    records = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Warning: warm-up source {path} not found")
+            continue
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = csv.DictReader(f) if path.lower().endswith(".csv") else (_json_line(line) for line in f)
+            for row in rows:
+                try:
+                    records.append({
+                        "ts": float(row["ts"]) if row.get("ts") not in (None, "") else None,
+                        "latitude": float(row["latitude"]),
+                        "longitude": float(row["longitude"]),
+                        "soil_type": str(row["soil_type"]).strip(),
+                        "land_area": int(float(row.get("land_area") or 43560)),
+                        "soil_id": row.get("soil_id") or None,
+                    })
+                except (KeyError, TypeError, ValueError):
+                    continue
+    return records
+
+
+def _json_line(line: str) -> dict:
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError:
+        return {}
+    return row if isinstance(row, dict) else {}
+
+
+def rank_hot_pairs(records: list, top: int, half_life_hours: float = 72.0, lookback_days: float = 14.0,
+                   now: float = None) -> list:
+    """
+    The top (cell, soil type) pairs by request count, each request weighted by 0.5 ** (age / half-life).
+    Records older than lookback_days are ignored; records without a timestamp count fully.
+    Each pair carries the point, soil record and median land area most requested for it.
+    """
+    now = now if now is not None else time.time()
+    oldest = now - lookback_days * 86400
+    pairs = {}
+    for record in records:
+        if record["ts"] is not None and record["ts"] < oldest:
+            continue
+        age_hours = max(0.0, now - record["ts"]) / 3600 if record["ts"] is not None else 0.0
+        key = (cell_for(record["latitude"], record["longitude"]), record["soil_type"].lower())
+        pair = pairs.setdefault(key, {"score": 0.0, "requests": 0, "points": Counter(), "areas": []})
+        pair["score"] += 0.5 ** (age_hours / half_life_hours)
+        pair["requests"] += 1
+        pair["points"][(record["latitude"], record["longitude"], record["soil_type"], record["soil_id"])] += 1
+        pair["areas"].append(record["land_area"])
+
+    ranked = sorted(pairs.items(), key=lambda item: item[1]["score"], reverse=True)[:top]
+    hot = []
+    for (cell, _), pair in ranked:
+        latitude, longitude, soil_type, soil_id = pair["points"].most_common(1)[0][0]
+        hot.append({
+            "cell": cell,
+            "soil_type": soil_type,
+            "latitude": latitude,
+            "longitude": longitude,
+            "soil_id": soil_id,
+            "land_area": int(statistics.median(pair["areas"])),
+            "score": round(pair["score"], 3),
+            "requests": pair["requests"],
+        })
+    return hot
+
+
+def seconds_until_window(window: tuple, now: datetime = None) -> float:
+    """Seconds until the UTC hour window (start, end) next opens; 0 while it is open"""
+    now = now or datetime.now(timezone.utc)
+    start, end = window
+    if (start <= now.hour < end) if start < end else (now.hour >= start or now.hour < end):
+        return 0.0
+    opens = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if opens <= now:
+        opens += timedelta(days=1)
+    return (opens - now).total_seconds()
+
+
+class CacheWarmer:
+    """
+    Periodically warms the caches for the hottest pairs. warm_pair(pair, allow_gemini) does
+    the work for one pair and returns (outcome, prediction cache key, Gemini calls spent), where
+    outcome is "cached", "predicted", "prediction_failed" or "climate_only". A pair may spend up to
+    calls_per_prediction calls (a prediction and its repair).
+    """
+
+    def __init__(self, warm_pair, sources: list, top: int = 100, max_gemini_calls: int = 50,
+                 concurrency: int = 2, window: tuple = (0, 2), half_life_hours: float = 72.0,
+                 lookback_days: float = 14.0, on_startup: bool = False, key_log: RequestKeyLog = None,
+                 calls_per_prediction: int = 2, lock_path: str = None):
+        self.warm_pair = warm_pair
+        self.sources = sources
+        self.top = top
+        self.max_gemini_calls = max_gemini_calls
+        self.concurrency = concurrency
+        self.window = window
+        self.half_life_hours = half_life_hours
+        self.lookback_days = lookback_days
+        self.on_startup = on_startup
+        self.key_log = key_log
+        self.calls_per_prediction = calls_per_prediction
+        self.lock_path = lock_path
+        self._lock_file = None
+        self.warm_keys = set()
+        self.last_run = None
+        self.stats = {"runs": 0, "runs_skipped": 0, "lookups": 0, "warm_set_hits": 0, "warm_set_misses": 0}
+
+    async def run_once(self) -> dict:
+        """Rank the sources and warm the hot set now; returns the run's report"""
+        started = time.time()
+        if self.key_log is not None:
+            await asyncio.to_thread(self.key_log.trim, started - self.lookback_days * 86400)
+        records = await asyncio.to_thread(read_request_keys, self.sources)
+        hot = rank_hot_pairs(records, self.top, self.half_life_hours, self.lookback_days, now=started)
+
+        outcomes = Counter()
+        gemini_calls = 0
+        warm_keys = set()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(pair: dict):
+            nonlocal gemini_calls
+            async with semaphore:
+                # Reserve the most a prediction can spend so concurrent pairs can't overshoot the
+                # budget, then give back what it didn't use
+                reserved = self.calls_per_prediction
+                allow_gemini = gemini_calls + reserved <= self.max_gemini_calls
+                if allow_gemini:
+                    gemini_calls += reserved
+                spent = 0
+                try:
+                    outcome, cache_key, spent = await self.warm_pair(pair, allow_gemini)
+                except Exception as e:
+                    print(f"Warning: warm-up failed for {pair['soil_type']} at {pair['cell']}: {e}")
+                    outcome, cache_key = "failed", None
+                if allow_gemini:
+                    gemini_calls += spent - reserved
+                outcomes[outcome] += 1
+                if outcome in ("cached", "predicted"):
+                    warm_keys.add(cache_key)
+
+        await asyncio.gather(*(warm(pair) for pair in hot))
+
+        # Effectiveness is measured from here until the next run
+        self.warm_keys = warm_keys
+        self.stats.update(runs=self.stats["runs"] + 1, lookups=0, warm_set_hits=0, warm_set_misses=0)
+        self.last_run = {
+            "started_at": datetime.fromtimestamp(started, timezone.utc).isoformat(timespec="seconds"),
+            "duration_seconds": round(time.time() - started, 2),
+            "hot_pairs": len(hot),
+            "warm_set": len(warm_keys),
+            "gemini_calls": gemini_calls,
+            "gemini_budget": self.max_gemini_calls,
+            **{f"pairs_{outcome}": count for outcome, count in sorted(outcomes.items())},
+        }
+        print(f"Cache warm-up: {json.dumps(self.last_run)}")
+        return self.last_run
+
+    async def run_forever(self):
+        """Lifespan task: warm once per day when the UTC window opens (and at startup if asked)"""
+        if self.on_startup:
+            await self._run_safely()
+        while True:
+            await asyncio.sleep(seconds_until_window(self.window))
+            await self._run_safely()
+            # Don't run again in the same window
+            await asyncio.sleep(max(1, (self.window[1] - self.window[0]) % 24) * 3600)
+
+    async def _run_safely(self):
+        if not self.acquire_lock():
+            self.stats["runs_skipped"] += 1
+            print(f"Cache warm-up: another worker holds {self.lock_path}, skipping this run")
+            return
+        try:
+            await self.run_once()
+        except Exception as e:
+            print(f"Warning: cache warm-up run failed: {e}")
+
+    def acquire_lock(self) -> bool:
+        """
+        Whether this process is the one that warms. The first to lock lock_path keeps it until it
+        exits; the others try again on their next run, so a dead worker's turn passes on.
+        """
+        if self.lock_path is None or fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def record_lookup(self, cache_key, hit: bool):
+        """Count a /predict prediction-cache lookup towards the warm set's effectiveness"""
+        self.stats["lookups"] += 1
+        if cache_key in self.warm_keys:
+            self.stats["warm_set_hits" if hit else "warm_set_misses"] += 1
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            # Share of all /predict lookups since the last run that the warm set answered
+            "warm_set_hit_share": round(self.stats["warm_set_hits"] / lookups, 4) if lookups else 0.0,
+            "last_run": self.last_run,
+        }
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Rank hot (cell, soil type) pairs for cache warm-up")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rank_parser = commands.add_parser("rank", help="Print the pairs a warm-up run would warm, hottest first")
+    rank_parser.add_argument("sources", nargs="+", help="Request key logs (JSON lines) or .csv sample files")
+    rank_parser.add_argument("--top", type=int, default=100)
+    rank_parser.add_argument("--half-life-hours", type=float, default=72.0)
+    rank_parser.add_argument("--lookback-days", type=float, default=14.0)
+
+    args = parser.parse_args(argv)
+    records = read_request_keys(args.sources)
+    hot = rank_hot_pairs(records, args.top, args.half_life_hours, args.lookback_days)
+    covered = sum(pair["requests"] for pair in hot)
+    for pair in hot:
+        print(json.dumps(pair))
+    print(f"{len(hot)} pairs cover {covered} of {len(records)} requests"
+          f" ({covered / len(records):.1%})" if records else "No request keys found")
+
+
+if __name__ == "__main__":
+    main()